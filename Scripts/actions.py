@@ -1,239 +1,944 @@
-import pandas as pd
+from __future__ import annotations
+
 import re
+import config
+import lazy
+import metrics
+import reader
+import rules
+
+pd = lazy.lazy_import("pandas")
+np = lazy.lazy_import("numpy")
 
 # 1. Number of lessons of the group
-def analyze_group_subjects(file_path: str):
+WEEKDAY_PATTERN = re.compile(r'Понедельник|Вторник|Среда|Четверг|Пятница|Суббота', re.IGNORECASE)
+SUBJECT_PATTERN = re.compile(r'Предмет: (.*?)\n')
+
+def count_group_subjects(source) -> dict:
+    """
+    Считает количество пар по дисциплинам для каждой группы из расписания
+
+    Все ячейки дней недели собираются в один столбец, предмет извлекается одним
+    векторным проходом
+
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
+    :return: Словарь {группа: {дисциплина: количество пар}} в порядке появления в расписании
+    """
+    df = load_report(source, "schedule")
+
+    # Get all need columns
+    week_columns = [col for col in df.columns if isinstance(col, str) and WEEKDAY_PATTERN.search(col)]
+    # Group name may be filled only in the first row of merged cells
+    groups = df['Группа'].ffill()
+
+    # Stack day columns one after another and extract subjects
+    cells = df[week_columns].assign(Группа=groups).melt(id_vars='Группа', value_name='cell').dropna()
+    # The same cell text repeats across the week, the subject is extracted once per distinct text
+    codes, texts = pd.factorize(cells['cell'])
+    names = pd.Series(texts).astype(str).str.extract(SUBJECT_PATTERN, expand=False).str.strip()
+    subjects = pd.Series(names.to_numpy()[codes], index=cells.index)
+
+    subject_count = {group: {} for group in groups.dropna().unique()}
+    counts = subjects.groupby([cells['Группа'], subjects], sort=False).size()
+    for (group, subject), count in counts.items():
+        subject_count[group][subject] = int(count)
+    return subject_count
+
+def analyze_group_subjects(source):
     """
-    Анализирует таблицу и выводит список дисцплин с количеством пар за неделю для группы
+    Анализирует таблицу и выводит список дисцплин с количеством пар за неделю для каждой группы
 
-    :param file_path: Путь к файлу .xlsx
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
     :return: Форматированная строка со списком пар за неделю
     """
     try:
-        df = pd.read_excel(file_path)
-
-        # Get all need columns
-        group_name = df['Группа'].iloc[0]
-        week_columns = [col for col in df.columns if re.search(r'Понедельник|Вторник|Среда|Четверг|Пятница|Суббота', col, re.IGNORECASE)]
-
-        # Calculating lessons count
-        subject_count = {}
-        for day in week_columns:
-            for cell in df[day]:
-                if isinstance(cell,str):
-                    match = re.search(r'Предмет: (.*?)\n', cell)
-                    if match:
-                        subject = match.group(1).strip()
-                        subject_count[subject] = subject_count.get(subject, 0) + 1
-        # Make result
+        subject_count = count_group_subjects(source)
         if not subject_count:
-            return f"Для группы {group_name} не найдено расписание"
-        
-        result = f"\nУ группы {group_name} на этой неделе было:\n"
-        for subject, count in subject_count.items():
-            result += f"{subject} - {count}\n"
-        
+            return "В файле не найдено ни одной группы"
+
+        # Make result
+        result = ""
+        for group_name, subjects in subject_count.items():
+            if not subjects:
+                result += f"\nДля группы {group_name} не найдено расписание\n"
+                continue
+
+            result += f"\nУ группы {group_name} на этой неделе было:\n"
+            result += "".join(f"{subject} - {count}\n" for subject, count in subjects.items())
+
         # Return lessons list
         return result
     except Exception as e:
         return f"Ошибка при анализе: {e}"
+# 2-3. Homeworks report
+# Columns of the homework report (header=1) by position for each period
+HOMEWORK_COLUMNS = {
+    "month": {"given": 3, "received": 4, "checked": 5, "planned": 6},
+    "week": {"given": 8, "received": 9, "checked": 10, "planned": 11},
+}
+CHECKED_THRESHOLD = 75
+GIVEN_THRESHOLD = 70
+
+def _percentage(part, total):
+    # Zero total counts as 0%, missing values stay NaN and never pass a threshold
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(total == 0, 0.0, part / total * 100)
+
+def analyze_homeworks(source) -> pd.DataFrame:
+    """
+    Считает % проверенных и выданных ДЗ за месяц и неделю за один проход по столбцам
+
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
+    :return: DataFrame со столбцом teacher и для каждого периода столбцами <period>_given, <period>_planned,
+        <period>_given_pct, <period>_received, <period>_checked, <period>_checked_pct
+    """
+    df = load_report(source, "homework")
+
+    # Columns are collected as arrays and the table is built once
+    table = {"teacher": df["Unnamed: 1"].to_numpy()}
+    for period, columns in HOMEWORK_COLUMNS.items():
+        for name in columns:
+            table[f"{period}_{name}"] = pd.to_numeric(df[f"{period}_{name}"], errors="coerce").to_numpy()
+        table[f"{period}_given_pct"] = _percentage(table[f"{period}_given"], table[f"{period}_planned"])
+        table[f"{period}_checked_pct"] = _percentage(table[f"{period}_checked"], table[f"{period}_received"])
+    return pd.DataFrame(table, index=df.index)
+
 # 2. Checked homeworks
-def analyze_checked_homeworks(file_path: str, period):
+def analyze_checked_homeworks(source, period, branch: str = None):
     """
-    Анализирует проверенные ДЗ на процент выполнения < 75%
+    Анализирует проверенные ДЗ на процент выполнения < 75% (порог - правило checked_<period>)
 
-    :param file_path: Путь к файлу .xlsx
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
     :param period: Период, за который анализируются данные
+    :param branch: Филиал, правила которого применяются, None - общие правила
     :return: Форматированная строка со списком преподавателей и процентом проверенных ДЗ
     """
-    try:
-        df = pd.read_excel(file_path, header=1)
-
-        # Get all need columns
-        if period == "month":
-            received_index, checked_index = 4, 5
-        elif period == "week":
-            received_index, checked_index = 9, 10
-        else:
-            return "Ошибка: Неверный период"
-        
-        results = []
-        for _, row in df.iterrows():
-            received = row.iloc[received_index]
-            checked = row.iloc[checked_index]
-            percentage = (checked / received * 100) if received else 0
-            if percentage < 75:
-                results.append(f"{row['Unnamed: 1']}: {percentage:.1f}% (Проверено {checked} из {received})")
-
-        return "\n".join(results) if results else "Все ДЗ проверены более чем на 75%"
-    except Exception as e:
-        return f"Ошибка при анализе: {e}"
+    if period not in HOMEWORK_COLUMNS:
+        return "Ошибка: Неверный период"
+    action = f"checked_{period}"
+    return rule_texts([action], source, branch)[action]
 # 3. Given homeworks
-def analyze_given_homeworks(file_path: str, period):
+def analyze_given_homeworks(source, period, branch: str = None):
     """
-    Анализирует выданные ДЗ на процент выполнения < 70%
+    Анализирует выданные ДЗ на процент выполнения < 70% (порог - правило given_<period>)
 
-    :param file_path: Путь к файлу .xlsx
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
     :param period: Период, за который анализируются данные
+    :param branch: Филиал, правила которого применяются, None - общие правила
     :return: Форматированная строка со списком преподавателей и процентом выданных ДЗ
     """
-    try:
-        df = pd.read_excel(file_path, header=1)
-
-        # Get all need columns
-        if period == "month":
-            given_index, planned_index = 3, 6
-        elif period == "week":
-            given_index, planned_index = 8, 11
-        else:
-            return "Неверный период"
-        
-        results = []
-        for _, row in df.iterrows():
-            given = row.iloc[given_index]
-            planned = row.iloc[planned_index]
-            percentage = (given / planned * 100) if planned else 0
-            if percentage < 70:
-                results.append(f"{row['Unnamed: 1']}: {percentage:.1f}% (Выдано {given} из {planned})")
-
-        return "\n".join(results) if results else "Все ДЗ выданы более чем на 70%."
-    except Exception as e:
-        return f"Ошибка при анализе: {e}"
+    if period not in HOMEWORK_COLUMNS:
+        return "Неверный период"
+    action = f"given_{period}"
+    return rule_texts([action], source, branch)[action]
 # 4. Lessons topic check
-def analyze_lessons_topic(file_path: str):
+TOPIC_PATTERN = re.compile(r"Урок №.* Тема:.*")
+# Bad topics shown for every teacher
+TOPIC_SAMPLES = 3
+# Periods of the topic check, counted back from the latest lesson date in the report,
+# stored as pd.DateOffset arguments so that importing the module does not import pandas
+TOPIC_PERIODS = {"month": {"months": 1}, "week": {"weeks": 1}}
+TOPIC_PERIOD_TITLES = {"month": "за последний месяц", "week": "за последнюю неделю"}
+
+def _topic_columns(df: pd.DataFrame):
+    topic_column = next((col for col in df.columns if "Тема" in col), None)
+    teacher_column = next((col for col in df.columns if "ФИО преподавателя" in col), None)
+    if not topic_column or not teacher_column:
+        raise ValueError("не найдены необходимые столбцы (Date, Тема, ФИО преподавателя)")
+    return topic_column, teacher_column
+
+def filter_topic_period(df: pd.DataFrame, period: str = None):
+    """
+    Оставляет уроки периода, считая от последней даты в отчете, чтобы проверять только их
+
+    :param df: DataFrame отчета по темам из load_report
+    :param period: Период из TOPIC_PERIODS или None - весь отчет
+    :return: Уроки периода и его границы (первая и последняя дата) или None для всего отчета
+    """
+    if period is None:
+        return df, None
+    if "Date" not in df.columns:
+        raise ValueError("в отчете нет столбца Date для выбора периода")
+    dates = pd.to_datetime(df["Date"], errors="coerce", dayfirst=True, format="mixed")
+    last = dates.max()
+    if pd.isna(last):
+        raise ValueError("в столбце Date нет дат")
+    first = last - pd.DateOffset(**TOPIC_PERIODS[period]) + pd.Timedelta(days=1)
+    return df[(dates >= first) & (dates <= last)], (first, last)
+
+def valid_topics(topics: pd.Series) -> pd.Series:
+    """
+    Проверяет темы на соответствие шаблону TOPIC_PATTERN
+
+    Одинаковые темы проверяются один раз, пустые ячейки и не строки не соответствуют шаблону
+
+    :return: Series bool с индексом topics
+    """
+    codes, uniques = pd.factorize(topics)
+    # Missing topics get code -1, the appended False marks them invalid
+    matched = np.array([isinstance(topic, str) and TOPIC_PATTERN.match(topic) is not None for topic in uniques] + [False])
+    return pd.Series(matched[codes], index=topics.index)
+
+def topic_violations(df: pd.DataFrame, samples: int = TOPIC_SAMPLES) -> pd.DataFrame:
+    """
+    Считает темы не по шаблону у каждого преподавателя за один векторный проход
+
+    :param df: DataFrame отчета по темам (уже отфильтрованный по периоду)
+    :param samples: Сколько тем не по шаблону оставить для примера
+    :return: DataFrame с индексом по преподавателю: lessons, violations, rate (в %), samples (список тем),
+        в порядке появления преподавателей в отчете
+    """
+    topic_column, teacher_column = _topic_columns(df)
+    # Teacher names are cleaned once per distinct value, then rows are coded by the cleaned name
+    codes, uniques = pd.factorize(df[teacher_column])
+    names = np.array([str(name).strip() for name in uniques] + ["(не указан)"], dtype=object)
+    codes, teachers = pd.factorize(names[codes])
+    invalid = ~valid_topics(df[topic_column]).to_numpy()
+
+    lessons = np.bincount(codes, minlength=len(teachers))
+    violations = np.bincount(codes[invalid], minlength=len(teachers))
+
+    examples = [[] for _ in teachers]
+    topic_codes, topics = pd.factorize(df[topic_column].to_numpy()[invalid])
+    # Missing topics get code -1 and are shown as the last name
+    topics = [str(topic) for topic in topics] + ["(пусто)"]
+    seen = set()
+    # Distinct (teacher, topic) pairs in report order until every teacher has its samples
+    for teacher, topic in zip(codes[invalid].tolist(), topic_codes.tolist()):
+        topic = topics[topic]
+        if len(examples[teacher]) < samples and (teacher, topic) not in seen:
+            seen.add((teacher, topic))
+            examples[teacher].append(topic)
+    return pd.DataFrame(
+        {"lessons": lessons, "violations": violations, "rate": violations / lessons * 100, "samples": examples},
+        index=pd.Index(teachers),
+    )
+
+def analyze_lessons_topic(source, period: str = None):
     """
     Анализирует темы уроков на соответствие маске “Урок №.* Тема:*”
 
-    :param file_path: Путь к файлу .xlsx
+    Для каждого преподавателя выводит количество и долю тем не по шаблону и несколько примеров,
+    сначала преподаватели с наибольшим количеством нарушений
+
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
+    :param period: Период из TOPIC_PERIODS или None - весь отчет
     :return: Форматированный список несоответствий маске
     """
     try:
-        df = pd.read_excel(file_path)
-
-        # Get all need columns
-        topic_column = next((col for col in df.columns if "Тема" in col), None)
-        teacher_column = next((col for col in df.columns if "ФИО преподавателя" in col), None)
-        
-        if not topic_column:
-            return "Ошибка: Не найдены необходимые столбцы (Date, Тема, ФИО преподавателя)"
-        
-        # Checking for compliance with the mask
-        incorrect_rows = []
-        for _, row in df.iterrows():
-            teacher = row[teacher_column]
-            topic = row[topic_column]
-
-            if not isinstance(topic, str) or not re.match(r"Урок №.* Тема:.*", topic):
-                incorrect_rows.append(f"Преподаватель: {teacher}")
-        
+        df, bounds = filter_topic_period(load_report(source, "topics"), period)
+        table = topic_violations(df)
+
+        title = ""
+        if bounds:
+            title = f" {TOPIC_PERIOD_TITLES[period]} ({bounds[0]:%d.%m.%Y} - {bounds[1]:%d.%m.%Y})"
+        violations = int(table["violations"].sum())
+        if not violations:
+            return f"Все темы{title} соответствуют маске Урок №. Тема:"
+
         # Make result
-        if incorrect_rows:
-            result = "Список преподавателей, заполнивших тему не по шаблону:\n" + "\n".join(set(incorrect_rows))
-        else:
-            result = "Все темы соответствуют маске Урок №. Тема:"
-        return result
+        rows = zip(table.index, table["violations"].tolist(), table["lessons"].tolist(), table["rate"].tolist(), table["samples"])
+        # Stable sort keeps report order for equal counts
+        bad = sorted((row for row in rows if row[1] > 0), key=lambda row: (row[1], row[3]), reverse=True)
+        lines = [
+            f"{teacher}: {count} из {lessons} ({rate:.1f}%), например: " + "; ".join(samples)
+            for teacher, count, lessons, rate, samples in bad
+        ]
+        return (
+            f"Темы не по шаблону \"Урок № . Тема:\"{title}: {violations} из {len(df)} уроков "
+            f"({violations / len(df) * 100:.1f}%)\n\n" + "\n".join(lines)
+        )
     except Exception as e:
         return f"Ошибка при анализе: {e}"
 # 5. Attendance below 65%
-def analyze_low_attendance(file_path: str):
+ATTENDANCE_THRESHOLD = 65
+
+def analyze_low_attendance(source, branch: str = None):
     """
     Анализирует отчет по посещаемости и возвращает список преподавателей с посещаемостью ниже 65%
+    (порог - правило low_attendance)
 
-    :param file_path: Путь к файлу .xlsx
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
+    :param branch: Филиал, правила которого применяются, None - общие правила
     :return: Форматированная строка со списком преподавателей
     """
-    try:
-        df = pd.read_excel(file_path)
-        
-        df = df[:-1]
+    return rule_texts(["low_attendance"], source, branch)["low_attendance"]
+# 6. Low Homework Percentage
+HOMEWORK_PERCENT_THRESHOLD = 50
 
-        df['Средняя посещаемость'] = df['Средняя посещаемость'].str.replace('%', '').astype(float)
+def analyze_low_homework_percentage(source, branch: str = None):
+    """
+    Анализирует процент выполнения студентами выполнения домашних заданий
 
-        low_attendance = df[df['Средняя посещаемость'] < 65]
+    Возвращает список студентов со Percentage Homework ниже 50% (порог - правило low_homework_percentage)
 
-        if low_attendance.empty:
-            return "Все преподаватели имеют посещаемость выше 65%"
-        
-        # Make result
-        result = "Список преподавателей с посещаемостью групп ниже 65%:\n"
-        for _, row in low_attendance.iterrows():
-            result += f"{row['ФИО преподавателя']} - {row['Средняя посещаемость']:.0f}%\n"
-
-        return result
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
+    :param branch: Филиал, правила которого применяются, None - общие правила
+    :return: Форматированная строка со списком студентов
+    """
+    try:
+        results, _ = student_results(["low_homework_percentage"], source, branch=branch)
+        return results["low_homework_percentage"]
     except Exception as e:
         return f"Ошибка при анализе: {e}"
-# 6. Low Homework Percentage
-def analyze_low_homework_percentage(file_path: str):
+# 7. Marks analysis
+MARK_THRESHOLD = 3
+
+def analyze_bad_marks(source, branch: str = None):
     """
-    Анализирует процент выполнения студентами выполнения домашних заданий
+    Анализирует оценки студентов за Homework и Classroom
 
-    Возвращает список студентов со Percentage Homework ниже 50%
+    Возвращает список студентов со средней оценкой ниже 3 (порог - правило marks_analysis)
 
-    :param file_path: Путь к файлу .xlsx
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
+    :param branch: Филиал, правила которого применяются, None - общие правила
     :return: Форматированная строка со списком студентов
     """
     try:
-        df = pd.read_excel(file_path)
+        results, _ = student_results(["marks_analysis"], source, branch=branch)
+        return results["marks_analysis"]
+    except Exception as e:
+        return f"Ошибка при анализе: {e}"
+# 8. Threshold rules
+# Columns of rule_table that rules can check, for every report type
+RULE_COLUMNS = {
+    "schedule": ["lessons"],
+    "homework": [
+        f"{period}_{name}" for period in HOMEWORK_COLUMNS
+        for name in ["given", "planned", "given_pct", "received", "checked", "checked_pct"]
+    ],
+    "topics": ["lessons", "violations", "rate"],
+    "attendance": ["attendance"],
+    "students": ["homework_pct", "homework_mark", "classroom_mark", "average_mark"],
+}
+# Student report columns and their names in rule_table
+STUDENT_RULE_COLUMNS = {"Percentage Homework": "homework_pct", "Homework": "homework_mark", "Classroom": "classroom_mark"}
 
-        # Get all need columns
-        required_columns = ["FIO", "Percentage Homework"]
-        if not all(col in df.columns for col in required_columns):
-            return "Ошибка: в файле отсутствуют необходимые столбцы (FIO, Percentage Homework)"
+def rule_table(report: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Значения, которые проверяют правила: одна строка на преподавателя, студента или группу
 
-        # Students list with low homework percentage
-        low_percentage_students = []
+    :param report: Тип отчета из RULE_COLUMNS
+    :param df: DataFrame отчета из load_report или часть отчета по студентам
+    :return: DataFrame со столбцом name и теми столбцами RULE_COLUMNS, данные для которых есть в отчете
+    """
+    match report:
+        case "schedule":
+            counts = count_group_subjects(df)
+            return pd.DataFrame({"name": list(counts), "lessons": [float(sum(subjects.values())) for subjects in counts.values()]})
+        case "homework":
+            return analyze_homeworks(df).rename(columns={"teacher": "name"})
+        case "topics":
+            table = topic_violations(df)
+            return pd.DataFrame({
+                "name": table.index, "lessons": table["lessons"].values,
+                "violations": table["violations"].values, "rate": table["rate"].values,
+            })
+        case "attendance":
+            # Drop summary row without touching the caller's DataFrame
+            df = df[:-1]
+            return pd.DataFrame({
+                "name": df["ФИО преподавателя"].values,
+                "attendance": pd.to_numeric(df["Средняя посещаемость"].astype(str).str.replace("%", ""), errors="coerce").values,
+            })
+        case "students":
+            table = pd.DataFrame({"name": df["FIO"].values})
+            for column, name in STUDENT_RULE_COLUMNS.items():
+                if column in df.columns:
+                    table[name] = df[column].values
+            # Students without one of the marks are skipped
+            if "homework_mark" in table and "classroom_mark" in table:
+                table["average_mark"] = (table["homework_mark"] + table["classroom_mark"]) / 2
+            return table
+    raise ValueError(f"нет правил для отчета {report}")
 
-        for _, row in df.iterrows():
-            fio = row["FIO"]
-            percentage = row["Percentage Homework"]
+def _rule_result(rule: dict, lines: dict, columns) -> str:
+    if rule["column"] not in columns:
+        return f"Ошибка: в файле нет данных для проверки {rule['column']}"
+    return rules.format_result(rule, lines[rule["id"]])
 
-            if pd.notna(percentage) and isinstance(percentage, (int, float)) and percentage < 50:
-                low_percentage_students.append(f"{fio}: {percentage:.0f}")
-        
-        # Make result
-        if low_percentage_students:
-            result = "Студенты с процентом выполненных ДЗ ниже 50%:\n" + "\n".join(low_percentage_students)
+def reported_rules(report_actions: list, checked: rules.CompiledRules) -> list:
+    """
+    :param report_actions: Действия, которые проверяются правилами
+    :param checked: Скомпилированные правила отчета
+    :return: id правил, результаты которых нужны для действий: их строки и форматируются
+    """
+    branch_rules = any(action in BRANCH_RULE_ACTIONS for action in report_actions)
+    return [
+        rule["id"] for rule in checked.rules
+        if rule["id"] in report_actions or (branch_rules and rule["id"] not in RULE_ACTIONS)
+    ]
+
+def rule_results(report_actions: list, checked: rules.CompiledRules, lines: dict, columns) -> dict:
+    """
+    :param report_actions: Действия, которые проверяются правилами
+    :param checked: Скомпилированные правила отчета
+    :param lines: Строки нарушений из CompiledRules.lines
+    :param columns: Столбцы rule_table, для которых в отчете есть данные
+    :return: Словарь {действие: результат}, для действия правил филиала - результаты всех правил без своего действия
+    """
+    by_id = {rule["id"]: rule for rule in checked.rules}
+    results = {}
+    for action in report_actions:
+        if action in BRANCH_RULE_ACTIONS:
+            results[action] = "\n\n".join(
+                f"{rule['title']}:\n{_rule_result(rule, lines, columns)}" for rule in checked.rules if rule["id"] not in RULE_ACTIONS
+            )
+        elif action in by_id:
+            results[action] = _rule_result(by_id[action], lines, columns)
         else:
-            result = "Все студенты имеют процент выполненных ДЗ 50% или выше "
-        return result
+            results[action] = "Проверка отключена в правилах филиала"
+    return results
+
+def rule_texts(report_actions: list, source, branch: str = None) -> dict:
+    """
+    Проверяет все правила типа отчета за один векторный проход по таблице отчета
+
+    :param report_actions: Действия одного типа отчета, остальные пропускаются
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
+    :param branch: Филиал, правила которого применяются, None - общие правила
+    :return: Словарь {действие: результат} для действий, которые проверяются правилами
+    """
+    rule_actions = [action for action in report_actions if action in RULE_ACTIONS or action in BRANCH_RULE_ACTIONS]
+    if not rule_actions:
+        return {}
+    report = report_type(rule_actions[0])
+    try:
+        checked = RULES.compiled(report, branch)
+        rule_ids = reported_rules(rule_actions, checked)
+        if not rule_ids:
+            # Nothing to check, e.g. the branch has no rules of its own: the report table is not built
+            return rule_results(rule_actions, checked, {}, [])
+        table = rule_table(report, load_report(source, report))
+        with metrics.timer("analysis", report=report):
+            return rule_results(rule_actions, checked, checked.lines(table, rule_ids), table.columns)
+    except Exception as e:
+        return {action: f"Ошибка при анализе: {e}" for action in rule_actions}
+
+def analyze_branch_rules(source, report: str, branch: str = None):
+    """
+    Проверяет правила филиала, добавленные администратором без своего действия в меню
+
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
+    :param report: Тип отчета
+    :param branch: Филиал, None - общие правила
+    :return: Результаты правил с их названиями, пустая строка, если таких правил нет
+    """
+    action = f"branch_rules_{report}"
+    try:
+        if report == "students":
+            results, _ = student_results([action], source, branch=branch)
+            return results[action]
+        return rule_texts([action], source, branch)[action]
     except Exception as e:
         return f"Ошибка при анализе: {e}"
-# 7. Marks analysis
-def analyze_bad_marks(file_path : str):
+
+# Student reports are read in chunks of this many rows, so memory does not grow with the report
+STUDENT_CHUNK_ROWS = 10000
+
+def student_results(report_actions: list, source, with_records: bool = False, branch: str = None, write_records=None):
     """
-    Анализирует оценки студентов за Homework и Classroom
+    Анализирует отчет по студентам за один проход частями по STUDENT_CHUNK_ROWS строк
 
-    Возвращает список студентов со средней оценкой ниже 3
+    Правила проверяются на каждой части, от нее остаются только строки результата,
+    поэтому расход памяти не зависит от размера отчета
 
-    :param file_path: Путь к файлу .xlsx
-    :return: Форматированная строка со списком студентов
+    :param report_actions: Действия отчета по студентам
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
+    :param with_records: Собрать и записи для истории (result_records)
+    :param branch: Филиал, правила которого применяются, None - общие правила
+    :param write_records: history.HistoryWriter, которому передаются записи каждой части вместо того,
+        чтобы копить их, закрывается после последней части
+    :return: Словарь {действие: результат} и записи для истории (пустой список, если передан write_records)
     """
+    checked = RULES.compiled("students", branch)
+    rule_ids = reported_rules(report_actions, checked)
+    lines = {rule_id: [] for rule_id in rule_ids}
+    records = []
+    columns = set()
     try:
-        df = pd.read_excel(file_path)
-
-        # Get all need columns
-        required_columns = ["FIO", "Homework", "Classroom"]
-        if not all(col in df.columns for col in required_columns):
-            return "Ошибка: в файле отсутствуют необходимые столбцы (FIO, Homework, Classroom)"
-        
-        # Students list with bad marks
-        bad_marks_students = []
-
-        for _, row in df.iterrows():
-            fio = row["FIO"]
-            homework = row["Homework"]
-            classroom = row["Classroom"]
-
-            if pd.notna(homework) and pd.notna(classroom) and isinstance(homework, (int, float)) and isinstance(classroom, (int, float)):
-                average_score = (homework + classroom) / 2
-                if average_score < 3:
-                    bad_marks_students.append(f"{fio}: {average_score:.1f}")
+        for chunk in read_report_chunks(source, "students", STUDENT_CHUNK_ROWS):
+            table = rule_table("students", chunk)
+            columns.update(table.columns)
+            for rule_id, rule_lines in checked.lines(table, rule_ids).items():
+                lines[rule_id].extend(rule_lines)
+            if with_records:
+                chunk_records = [record for action in report_actions for record in result_records(action, chunk)]
+                if write_records is not None:
+                    write_records(chunk_records)
+                else:
+                    records.extend(chunk_records)
+    finally:
+        if write_records is not None:
+            write_records.close()
+    return rule_results(report_actions, checked, lines, columns), records
 
-        # Make result
-        if bad_marks_students:
-            result = "Студенты с средней оценкой ниже 3:\n" + "\n".join(bad_marks_students)
-        else:
-            result = "Все студенты имеют среднюю оценку 3 или выше"
-        return result
-    except Exception as e:
-        return f"Ошибка при анализе: {e}"
\ No newline at end of file
+# Report layouts: header row, columns read by the analyses, column types
+REPORT_LAYOUTS = {
+    "schedule": (0, ["Группа", lambda col: WEEKDAY_PATTERN.search(col)], None),
+    "homework": (1, ["Unnamed: 1"] + [
+        (f"{period}_{name}", index) for period, columns in HOMEWORK_COLUMNS.items() for name, index in columns.items()
+    ], None),
+    "topics": (0, [lambda col: "Тема" in col, lambda col: "ФИО преподавателя" in col, "Date"], None),
+    "attendance": (0, ["ФИО преподавателя", "Средняя посещаемость"], None),
+    "students": (0, ["FIO", "Percentage Homework", "Homework", "Classroom"], {
+        "Percentage Homework": "float", "Homework": "float", "Classroom": "float"
+    }),
+}
+
+def load_report(source, report: str) -> pd.DataFrame:
+    """
+    Читает из отчета только столбцы, нужные анализам этого типа отчета
+
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
+    :param report: Тип отчета из REPORT_LAYOUTS
+    :return: DataFrame с нужными столбцами
+    """
+    header, columns, dtypes = REPORT_LAYOUTS[report]
+    if isinstance(source, pd.DataFrame):
+        # Already parsed, only the columns are selected
+        return reader.read_columns(source, columns, header, dtypes)
+    with metrics.timer("parse", report=report):
+        df = reader.read_columns(source, columns, header, dtypes)
+    metrics.observe("file_bytes", reader.source_size(source), report=report)
+    metrics.observe("report_rows", len(df), report=report)
+    return df
+
+def read_report_chunks(source, report: str, chunk_rows: int):
+    """
+    Читает из отчета нужные столбцы частями по chunk_rows строк
+
+    :return: Генератор DataFrame, как у load_report
+    """
+    header, columns, dtypes = REPORT_LAYOUTS[report]
+    return reader.read_chunks(source, columns, header, dtypes, chunk_rows)
+
+# Large reports of these types are analysed in chunks straight from the file, without a DataFrame of the whole report
+STREAMED_REPORTS = ["students"]
+STREAM_MIN_BYTES = 5 * 1024 * 1024
+
+def is_streamed(source, report: str) -> bool:
+    """
+    :param source: Путь к файлу, буфер или байты файла .xls/.xlsx
+    :return: True, если отчет анализируется частями, а не через load_report
+    """
+    return report in STREAMED_REPORTS and reader.source_size(source) > STREAM_MIN_BYTES
+
+# Report names for messages
+REPORT_NAMES = {
+    "schedule": "расписание группы",
+    "homework": "отчет по домашним заданиям",
+    "topics": "отчет по темам уроков",
+    "attendance": "отчет по посещаемости",
+    "students": "отчет по студентам",
+}
+
+# Header signatures checked before the full parse: column name, filter by name or (position, check of its name)
+REPORT_SIGNATURES = {
+    "schedule": ["Группа", lambda col: WEEKDAY_PATTERN.search(col)],
+    # Teacher column without a title, every month and week column has a text title
+    "homework": ["Unnamed: 1"] + [
+        (index, lambda name: isinstance(name, str) and not name.startswith("Unnamed:"))
+        for columns in HOMEWORK_COLUMNS.values() for index in columns.values()
+    ],
+    "topics": [lambda col: "Тема" in col, lambda col: "ФИО преподавателя" in col],
+    "attendance": ["ФИО преподавателя", "Средняя посещаемость"],
+    "students": ["FIO"],
+}
+# Period checks run only when chosen in the menu, a report sent without an action is checked in full
+MENU_ONLY_ACTIONS = ["topic_check_month", "topic_check_week"]
+# Columns required by analyses of a report type that does not always have all of them
+ACTION_COLUMNS = {
+    "low_homework_percentage": ["Percentage Homework"],
+    "marks_analysis": ["Homework", "Classroom"],
+}
+
+def header_matches(names: list, signature: list) -> bool:
+    """
+    :param names: Названия столбцов из строки заголовка
+    :param signature: Сигнатура из REPORT_SIGNATURES или ACTION_COLUMNS
+    :return: True, если заголовок подходит под сигнатуру
+    """
+    for spec in signature:
+        if callable(spec):
+            if not any(isinstance(name, str) and spec(name) for name in names):
+                return False
+        elif isinstance(spec, tuple):
+            # (position, check): the column at this position must exist and pass the check
+            index, check = spec
+            if index >= len(names) or not check(names[index]):
+                return False
+        elif spec not in names:
+            return False
+    return True
+
+def detect_report(source, reports: list = None):
+    """
+    Определяет тип отчета по первым строкам файла, не разбирая его целиком
+
+    Отчеты с заголовком в первой строке проверяются раньше отчета по ДЗ с заголовком во второй,
+    так как его сигнатура слабее
+
+    :param source: Путь к файлу, буфер или байты файла .xls/.xlsx
+    :param reports: Проверяемые типы отчета, None - все из REPORT_LAYOUTS
+    :return: Тип отчета (None, если тип не распознан) и названия его столбцов
+    """
+    layouts = sorted(reports or REPORT_LAYOUTS, key=lambda report: REPORT_LAYOUTS[report][0])
+    # python-calamine would load the whole sheet of a report that is then analysed in chunks
+    stream = any(is_streamed(source, report) for report in layouts)
+    rows = reader.head_rows(source, max(REPORT_LAYOUTS[report][0] for report in layouts) + 1, stream)
+    for report in layouts:
+        header = REPORT_LAYOUTS[report][0]
+        if header >= len(rows):
+            continue
+        names = reader.column_names(rows[header])
+        if header_matches(names, REPORT_SIGNATURES[report]):
+            return report, names
+    return None, []
+
+def check_report(source, action: str = None):
+    """
+    Проверяет заголовок отчета до полного разбора
+
+    :param source: Путь к файлу, буфер или байты файла .xls/.xlsx
+    :param action: Действие из меню или None, если действие не выбрано
+    :return: Тип отчета и список действий, которые к нему применимы
+    :raises ValueError: Тип отчета не распознан или не подходит для действия
+    """
+    if action is not None:
+        expected = report_type(action)
+        # Only the layout of the chosen action is checked, other types are named only in the error
+        with metrics.timer("check"):
+            report, names = detect_report(source, [expected])
+        if report is None:
+            report, _ = detect_report(source)
+            if report is None:
+                raise ValueError("не удалось определить тип отчета по заголовку таблицы")
+            raise ValueError(f"нужен {REPORT_NAMES[expected]}, а прислан {REPORT_NAMES[report]}")
+        if not header_matches(names, ACTION_COLUMNS.get(action, [])):
+            raise ValueError(f"в файле нет столбцов {', '.join(ACTION_COLUMNS[action])}")
+        return report, [action]
+
+    with metrics.timer("check"):
+        report, names = detect_report(source)
+    if report is None:
+        raise ValueError("не удалось определить тип отчета по заголовку таблицы")
+
+    report_actions = [
+        name for name, (_, _, action_report) in ANALYSES.items()
+        if action_report == report and name not in MENU_ONLY_ACTIONS and header_matches(names, ACTION_COLUMNS.get(name, []))
+    ]
+    return report, report_actions
+
+# Menu actions and their analyses: function, extra arguments, report type
+ANALYSES = {
+    "group_subjects": (analyze_group_subjects, (), "schedule"), # 1. Number of lessons of the group
+    "checked_month": (analyze_checked_homeworks, ("month",), "homework"), # 2.1. Checked homeworks (month)
+    "checked_week": (analyze_checked_homeworks, ("week",), "homework"), # 2.2 Checked homeworks (week)
+    "given_month": (analyze_given_homeworks, ("month",), "homework"), # 3.1 Given homeworks (month)
+    "given_week": (analyze_given_homeworks, ("week",), "homework"), # 3.2 Given homeworks (week)
+    "topic_check": (analyze_lessons_topic, (), "topics"), # 4. Lessons topic check
+    "topic_check_month": (analyze_lessons_topic, ("month",), "topics"), # 4.1 Lessons topic check (last month)
+    "topic_check_week": (analyze_lessons_topic, ("week",), "topics"), # 4.2 Lessons topic check (last week)
+    "low_attendance": (analyze_low_attendance, (), "attendance"), # 5. Attendance below 65%
+    "low_homework_percentage": (analyze_low_homework_percentage, (), "students"), # 6. Low Homework Percentage
+    "marks_analysis": (analyze_bad_marks, (), "students"), # 7. Marks analysis
+}
+# 8. Rules of the branch without their own action, run on every report of their type sent without an action
+BRANCH_RULE_ACTIONS = {f"branch_rules_{report}": report for report in RULE_COLUMNS}
+ANALYSES.update({
+    action: (analyze_branch_rules, (report,), report) for action, report in BRANCH_RULE_ACTIONS.items()
+})
+
+# Action titles for results of several analyses
+ACTION_TITLES = {
+    "group_subjects": "Пары группы",
+    "checked_month": "Проверенные ДЗ за месяц",
+    "checked_week": "Проверенные ДЗ за неделю",
+    "given_month": "Выданные ДЗ за месяц",
+    "given_week": "Выданные ДЗ за неделю",
+    "topic_check": "Тема урока",
+    "topic_check_month": "Тема урока за последний месяц",
+    "topic_check_week": "Тема урока за последнюю неделю",
+    "low_attendance": "Посещаемость",
+    "low_homework_percentage": "Выполнение ДЗ",
+    "marks_analysis": "Анализ успеваемости",
+    **{action: "Правила филиала" for action in BRANCH_RULE_ACTIONS},
+}
+
+# Built-in threshold checks, their ids are the menu actions. Branches change them in config.RULES_PATH
+DEFAULT_RULES = [
+    {
+        "id": "checked_month", "report": "homework", "column": "month_checked_pct", "op": "<", "value": CHECKED_THRESHOLD,
+        "title": ACTION_TITLES["checked_month"],
+        "line": "{month_checked_pct:.1f}% (Проверено {month_checked} из {month_received})",
+        "empty": "Все ДЗ проверены более чем на {value:g}%",
+    },
+    {
+        "id": "checked_week", "report": "homework", "column": "week_checked_pct", "op": "<", "value": CHECKED_THRESHOLD,
+        "title": ACTION_TITLES["checked_week"],
+        "line": "{week_checked_pct:.1f}% (Проверено {week_checked} из {week_received})",
+        "empty": "Все ДЗ проверены более чем на {value:g}%",
+    },
+    {
+        "id": "given_month", "report": "homework", "column": "month_given_pct", "op": "<", "value": GIVEN_THRESHOLD,
+        "title": ACTION_TITLES["given_month"],
+        "line": "{month_given_pct:.1f}% (Выдано {month_given} из {month_planned})",
+        "empty": "Все ДЗ выданы более чем на {value:g}%.",
+    },
+    {
+        "id": "given_week", "report": "homework", "column": "week_given_pct", "op": "<", "value": GIVEN_THRESHOLD,
+        "title": ACTION_TITLES["given_week"],
+        "line": "{week_given_pct:.1f}% (Выдано {week_given} из {week_planned})",
+        "empty": "Все ДЗ выданы более чем на {value:g}%.",
+    },
+    {
+        "id": "low_attendance", "report": "attendance", "column": "attendance", "op": "<", "value": ATTENDANCE_THRESHOLD,
+        "title": ACTION_TITLES["low_attendance"],
+        "line": "{attendance:.0f}%", "text": "{name} - {line}",
+        "header": "Список преподавателей с посещаемостью групп ниже {value:g}%:\n",
+        "empty": "Все преподаватели имеют посещаемость выше {value:g}%",
+    },
+    {
+        "id": "low_homework_percentage", "report": "students", "column": "homework_pct", "op": "<",
+        "value": HOMEWORK_PERCENT_THRESHOLD, "title": ACTION_TITLES["low_homework_percentage"],
+        "line": "{homework_pct:.0f}",
+        "header": "Студенты с процентом выполненных ДЗ ниже {value:g}%:\n",
+        "empty": "Все студенты имеют процент выполненных ДЗ {value:g}% или выше ",
+    },
+    {
+        "id": "marks_analysis", "report": "students", "column": "average_mark", "op": "<", "value": MARK_THRESHOLD,
+        "title": ACTION_TITLES["marks_analysis"],
+        "line": "{average_mark:.1f}",
+        "header": "Студенты с средней оценкой ниже {value:g}:\n",
+        "empty": "Все студенты имеют среднюю оценку {value:g} или выше",
+    },
+]
+RULE_ACTIONS = [rule["id"] for rule in DEFAULT_RULES]
+# Rules of every branch, compiled rule sets are cached until the file changes
+RULES = rules.RuleBook(config.RULES_PATH, DEFAULT_RULES, RULE_COLUMNS)
+
+def report_type(action: str) -> str:
+    """
+    :param action: Действие из меню
+    :return: Тип отчета, который нужен этому действию
+    """
+    return ANALYSES[action][2]
+
+def run_analysis(action: str, source):
+    """
+    Запускает анализ, выбранный в меню
+
+    Функция уровня модуля, поэтому может выполняться в отдельном процессе
+
+    :param action: Действие из меню
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
+    :return: Форматированная строка с результатом анализа
+    """
+    if action not in ANALYSES:
+        return "Неизвестное действие. Попробуйте снова"
+    analyze, args, _ = ANALYSES[action]
+    with metrics.timer("analysis", action=action):
+        return analyze(source, *args)
+
+def run_analyses(report_actions: list, df: pd.DataFrame, branch: str = None) -> str:
+    """
+    Запускает несколько анализов на одном разобранном отчете
+
+    Действия, которые проверяются правилами, выполняются одним проходом rule_texts
+
+    :param report_actions: Действия из меню
+    :param df: DataFrame отчета из load_report
+    :param branch: Филиал, правила которого применяются, None - общие правила
+    :return: Результат анализа, для нескольких действий - с заголовком каждого
+    """
+    results = rule_texts(report_actions, df, branch)
+    return join_results(report_actions, [
+        results[action] if action in results else run_analysis(action, df) for action in report_actions
+    ])
+
+def join_results(report_actions: list, results: list) -> str:
+    """
+    :return: Результат одного действия или результаты нескольких действий с заголовком каждого,
+        пустые результаты (правила филиала, которых нет) пропускаются
+    """
+    pairs = [(action, result) for action, result in zip(report_actions, results) if result]
+    if not pairs:
+        return "Для этого отчета нет подходящих анализов"
+    if len(pairs) == 1:
+        return pairs[0][1]
+    return "\n\n".join(f"📊 {ACTION_TITLES[action]}\n{result.strip()}" for action, result in pairs)
+
+# Structured results for the history: metric of each action
+METRICS = {
+    "group_subjects": "lessons",
+    "checked_month": "checked_pct",
+    "checked_week": "checked_pct",
+    "given_month": "given_pct",
+    "given_week": "given_pct",
+    "topic_check": "bad_topics",
+    "topic_check_month": "bad_topics",
+    "topic_check_week": "bad_topics",
+    "low_attendance": "attendance",
+    "low_homework_percentage": "homework_pct",
+    "marks_analysis": "average_mark",
+}
+
+def _metric_values(action: str, df: pd.DataFrame) -> pd.Series:
+    # Value of the action metric for every teacher, student or group, indexed by name
+    match action:
+        case "group_subjects":
+            counts = count_group_subjects(df)
+            return pd.Series({group: sum(subjects.values()) for group, subjects in counts.items()}, dtype=float)
+        case "checked_month" | "checked_week" | "given_month" | "given_week":
+            table = analyze_homeworks(df)
+            return pd.Series(table[f"{ANALYSES[action][1][0]}_{METRICS[action]}"].values, index=table["teacher"])
+        case "topic_check" | "topic_check_month" | "topic_check_week":
+            df, _ = filter_topic_period(df, *ANALYSES[action][1])
+            return topic_violations(df)["violations"].astype(float)
+        case "low_attendance":
+            table = rule_table("attendance", df)
+            return pd.Series(table["attendance"].values, index=table["name"])
+        case "low_homework_percentage":
+            return pd.Series(df["Percentage Homework"].values, index=df["FIO"])
+        case "marks_analysis":
+            return pd.Series(((df["Homework"] + df["Classroom"]) / 2).values, index=df["FIO"])
+    return pd.Series(dtype=float)
+
+def result_records(action: str, df: pd.DataFrame) -> list:
+    """
+    Структурированный результат анализа для истории: значение по каждому преподавателю, студенту или группе,
+    а не только по тем, кто попал в ответ
+
+    :param action: Действие из меню
+    :param df: DataFrame отчета из load_report
+    :return: Список (тип отчета, метрика, период, имя, значение)
+    """
+    if action not in METRICS:
+        return []
+    _, args, report = ANALYSES[action]
+    period = args[0] if args else ""
+    try:
+        values = _metric_values(action, df)
+    except (KeyError, StopIteration, TypeError, ValueError):
+        # Columns are missing, the analysis itself reports the error
+        return []
+    return [
+        (report, METRICS[action], period, name.strip(), float(value))
+        for name, value in values.items()
+        if isinstance(name, str) and name.strip() and pd.notna(value)
+    ]
+
+# Personal alerts: actions whose result lines belong to a teacher
+ALERT_ACTIONS = [
+    "checked_month", "checked_week", "given_month", "given_week", "low_attendance",
+    "topic_check", "topic_check_month", "topic_check_week",
+    "branch_rules_homework", "branch_rules_attendance", "branch_rules_topics",
+]
+# Bad topics listed in one alert
+ALERT_TOPICS = 5
+
+def _teacher_lines(action: str, df: pd.DataFrame) -> list:
+    # (teacher, line with the analysis title) for every teacher in the result of an action without rules
+    match action:
+        case "topic_check" | "topic_check_month" | "topic_check_week":
+            df, _ = filter_topic_period(df, *ANALYSES[action][1])
+            table = topic_violations(df, ALERT_TOPICS)
+            table = table[table["violations"] > 0]
+            return [
+                (teacher, f"{ACTION_TITLES[action]}: {row.violations} из {row.lessons} тем не по шаблону \"Урок № . Тема:\": " + "; ".join(row.samples))
+                for teacher, row in zip(table.index, table.itertuples(index=False))
+            ]
+    return []
+
+def _rule_teacher_lines(report_actions: list, df: pd.DataFrame, branch: str = None) -> dict:
+    # (teacher, line with the rule title) for the requested actions checked by rules, all rules in one pass
+    report = report_type(report_actions[0])
+    checked = RULES.compiled(report, branch)
+    rule_ids = reported_rules(report_actions, checked)
+    if not rule_ids:
+        return {}
+    lines = checked.lines(rule_table(report, load_report(df, report)), rule_ids)
+    result = {}
+    for rule in checked.rules:
+        if rule["id"] not in lines:
+            continue
+        action = rule["id"] if rule["id"] in RULE_ACTIONS else f"branch_rules_{report}"
+        result.setdefault(action, []).extend((teacher, f"{rule['title']}: {line}") for teacher, line in lines[rule["id"]])
+    return result
+
+def teacher_lines(report_actions: list, df: pd.DataFrame, branch: str = None) -> dict:
+    """
+    Строки результата, относящиеся к каждому преподавателю, для личных уведомлений
+
+    :param report_actions: Действия из меню
+    :param df: DataFrame отчета из load_report
+    :param branch: Филиал, правила которого применяются, None - общие правила
+    :return: Словарь {ФИО из отчета: [строки с названием анализа]}
+    """
+    lines = {}
+    rule_lines = None
+    for action in report_actions:
+        if action not in ALERT_ACTIONS:
+            continue
+        try:
+            if action in RULE_ACTIONS or action in BRANCH_RULE_ACTIONS:
+                if rule_lines is None:
+                    rule_lines = _rule_teacher_lines(
+                        [name for name in report_actions if name in ALERT_ACTIONS], df, branch
+                    )
+                action_lines = rule_lines.get(action, [])
+            else:
+                action_lines = _teacher_lines(action, df)
+        except (KeyError, StopIteration, TypeError, ValueError):
+            continue
+        for teacher, line in action_lines:
+            if isinstance(teacher, str) and teacher.strip():
+                lines.setdefault(teacher.strip(), []).append(line)
+    return lines
+
+def analyze_with_records(report_actions: list, df, branch: str = None, write_records=None):
+    """
+    :param df: DataFrame отчета из load_report или сам файл, если is_streamed
+    :param branch: Филиал, правила которого применяются, None - общие правила
+    :param write_records: history.HistoryWriter: записи отчета, который анализируется частями,
+        передаются ему после каждой части и не копятся до конца анализа
+    :return: Результат run_analyses и записи result_records всех действий
+        (None, если они уже переданы write_records)
+    """
+    if not isinstance(df, pd.DataFrame):
+        # Large student report: one pass in chunks for all actions
+        with metrics.timer("analysis", report="students"):
+            results, records = student_results(report_actions, df, with_records=True, branch=branch, write_records=write_records)
+        result = join_results(report_actions, [results[action] for action in report_actions])
+        return result, (None if write_records is not None else records)
+    records = [record for action in report_actions for record in result_records(action, df)]
+    return run_analyses(report_actions, df, branch), records
+
+def prewarm():
+    """
+    Загружает pandas и библиотеки чтения отчетов, вызывается в фоне при запуске бота
+    и в каждом процессе пула анализа
+    """
+    reader.prewarm()
+    pd.DataFrame({"name": ["a", "a"], "value": [1.0, 2.0]}).groupby("name")["value"].mean()
+    for report in RULE_COLUMNS:
+        RULES.compiled(report)
+
+def analyze_report(source, action: str = None, branch: str = None, write_records=None):
+    """
+    Проверяет заголовок, один раз разбирает отчет и запускает выбранный анализ
+    или все анализы, применимые к этому отчету
+
+    :param source: Путь к файлу, буфер или байты файла .xls/.xlsx
+    :param action: Действие из меню или None, если действие не выбрано
+    :param branch: Филиал, правила которого применяются, None - общие правила
+    :param write_records: history.HistoryWriter для записи в историю по частям, как у analyze_with_records
+    :return: Форматированная строка с результатом анализа и записи для истории
+    """
+    try:
+        report, report_actions = check_report(source, action)
+    except ValueError as e:
+        return f"Ошибка: {e}", []
+    df = source if is_streamed(source, report) else load_report(source, report)
+    return analyze_with_records(report_actions, df, branch, write_records)
@@ -0,0 +1,61 @@
+import threading
+
+ALERT_HEADER = "Уведомление по результатам проверки отчета:"
+
+
+def match_teachers(lines: dict, registry):
+    """
+    Сопоставляет ФИО из отчета с реестром преподавателей по нормализованному ФИО
+
+    :param lines: Словарь {ФИО из отчета: [строки результата]} из actions.teacher_lines
+    :param registry: teachers.TeacherRegistry
+    :return: Список уведомлений (chat_id, username, текст) и список ФИО, которым отправить нельзя
+    """
+    alerts = []
+    unmatched = []
+    for full_name, teacher_lines in lines.items():
+        username = registry.by_full_name(full_name)
+        teacher = registry.get(username) if username else None
+        if not teacher or teacher.get("chat_id") is None:
+            unmatched.append(full_name)
+            continue
+        alerts.append((teacher["chat_id"], username, "\n".join([ALERT_HEADER] + teacher_lines)))
+    return alerts, unmatched
+
+
+def broadcast(outbox, alerts: list, on_done):
+    """
+    Отправляет уведомления через очередь рассылки outbox
+
+    :param outbox: outbox.Outbox
+    :param alerts: Список (chat_id, username, текст) из match_teachers
+    :param on_done: Функция, которая получает текст итога рассылки, когда все сообщения отправлены или не отправлены
+    """
+    if not alerts:
+        on_done(summary([], []))
+        return
+
+    lock = threading.Lock()
+    delivered = []
+    failed = []
+
+    def done(future, username):
+        with lock:
+            (failed if future.exception() else delivered).append(username)
+            finished = len(delivered) + len(failed) == len(alerts)
+        if finished:
+            on_done(summary(delivered, failed))
+
+    for chat_id, username, text in alerts:
+        future = outbox.send_message(chat_id, text, bulk=True)
+        future.add_done_callback(lambda future, username=username: done(future, username))
+
+
+def summary(delivered: list, failed: list) -> str:
+    """
+    :return: Итог рассылки для администратора
+    """
+    result = f"Рассылка завершена\nДоставлено: {len(delivered)}\nНе доставлено: {len(failed)}"
+    if failed:
+        result += "\n" + "\n".join(failed)
+    return result
@@ -0,0 +1,110 @@
+import hashlib
+import io
+import os
+import threading
+import zipfile
+
+REPORT_EXTENSIONS = (".xls", ".xlsx")
+CHUNK_SIZE = 64 * 1024
+
+
+def is_report(file_name: str) -> bool:
+    return os.path.splitext(file_name or "")[1].lower() in REPORT_EXTENSIONS
+
+
+def is_archive(file_name: str) -> bool:
+    return os.path.splitext(file_name or "")[1].lower() == ".zip"
+
+
+def content_id(data) -> str:
+    """
+    :param data: Содержимое файла или путь к файлу на диске
+    :return: Идентификатор файла по содержимому, одинаковый для одного отчета в разных архивах
+    """
+    if isinstance(data, (bytes, bytearray)):
+        return hashlib.sha1(data).hexdigest()
+    digest = hashlib.sha1()
+    with open(data, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extract_reports(data, max_files: int, max_bytes: int, job_spool=None, memory_bytes: int = 0) -> list:
+    """
+    Распаковывает .xls и .xlsx из zip архива в память, большие отчеты - в каталог задания
+
+    :param data: Содержимое архива или путь к нему
+    :param max_files: Максимальное количество отчетов в архиве
+    :param max_bytes: Максимальный суммарный размер распакованных отчетов
+    :param job_spool: spool.JobSpool для отчетов больше memory_bytes, без него все отчеты остаются в памяти
+    :param memory_bytes: Отчеты больше этого размера распаковываются на диск
+    :return: Список (имя файла, содержимое или путь), отсортированный по имени
+    """
+    with zipfile.ZipFile(data if isinstance(data, str) else io.BytesIO(data)) as archive:
+        infos = [
+            info for info in archive.infolist()
+            if not info.is_dir() and is_report(info.filename) and not os.path.basename(info.filename).startswith("~$")
+        ]
+        if not infos:
+            raise ValueError("В архиве нет файлов .xls или .xlsx")
+        if len(infos) > max_files:
+            raise ValueError(f"В архиве больше {max_files} отчетов")
+        # Sizes from the archive directory, checked before anything is unpacked
+        if sum(info.file_size for info in infos) > max_bytes:
+            raise ValueError(f"Распакованные отчеты больше {max_bytes // 1024 // 1024} МБ")
+
+        files = []
+        for info in sorted(infos, key=lambda info: info.filename):
+            if job_spool is not None and info.file_size > memory_bytes:
+                with archive.open(info) as member:
+                    files.append((info.filename, job_spool.write(info.filename, iter(lambda: member.read(CHUNK_SIZE), b""))))
+            else:
+                files.append((info.filename, archive.read(info)))
+        return files
+
+
+def combine_results(results: list) -> str:
+    """
+    Собирает результаты анализа нескольких файлов в один отчет
+
+    :param results: Список (имя файла, результат) в нужном порядке
+    :return: Общий отчет
+    """
+    return "\n\n".join(f"📄 {file_name}\n{result.strip()}" for file_name, result in results)
+
+
+class MediaGroupCollector:
+    """
+    Собирает документы, отправленные одной медиагруппой
+
+    Telegram присылает каждый файл группы отдельным сообщением, поэтому группа считается
+    полной, когда после последнего файла проходит delay секунд
+    """
+
+    def __init__(self, callback, delay: float = 1.5):
+        """
+        :param callback: Функция, которая получает список сообщений группы в порядке отправки
+        :param delay: Пауза после последнего файла в секундах
+        """
+        self._callback = callback
+        self._delay = delay
+        self._groups = {}  # media_group_id -> (messages, timer)
+        self._lock = threading.Lock()
+
+    def add(self, message):
+        with self._lock:
+            messages, timer = self._groups.get(message.media_group_id, ([], None))
+            if timer:
+                timer.cancel()
+            messages.append(message)
+            timer = threading.Timer(self._delay, self._flush, args=(message.media_group_id,))
+            timer.daemon = True
+            self._groups[message.media_group_id] = (messages, timer)
+            timer.start()
+
+    def _flush(self, media_group_id):
+        with self._lock:
+            messages, _ = self._groups.pop(media_group_id, ([], None))
+        if messages:
+            self._callback(sorted(messages, key=lambda message: message.message_id))
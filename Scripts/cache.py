@@ -0,0 +1,118 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import lazy
+
+pd = lazy.lazy_import("pandas")
+
+
+def estimate_size(value) -> int:
+    """
+    Оценивает размер значения в памяти в байтах
+
+    :param value: DataFrame, байты или другой объект
+    :return: Размер в байтах
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class ReportCache:
+    """
+    LRU кэш разобранных отчетов с ограничением по объему памяти и времени жизни
+
+    Ключом служит file_unique_id документа Telegram, поэтому повторная загрузка того же
+    файла не требует ни скачивания, ни разбора
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        """
+        :param max_bytes: Максимальный суммарный размер записей в байтах
+        :param ttl: Время жизни записи в секундах
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, key):
+        """
+        Возвращает значение из кэша
+
+        :param key: Ключ записи
+        :return: Значение или None, если записи нет или она устарела
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[2] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Сохраняет значение в кэш, вытесняя давно не использованные записи
+
+        Значения больше всего бюджета не сохраняются
+
+        :param key: Ключ записи
+        :param value: Значение
+        """
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self._size += size
+            self._evict()
+
+    def stats(self) -> dict:
+        """
+        :return: Счетчики попаданий, промахов и текущий размер кэша
+        """
+        with self._lock:
+            self._evict()
+            return {
+                "entries": len(self._entries),
+                "size": self._size,
+                "max_size": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._size -= size
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [key for key, (_, _, expires_at) in self._entries.items() if expires_at < now]:
+            self._remove(key)
+            self.evictions += 1
+
+        while self._size > self.max_bytes:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.evictions += 1
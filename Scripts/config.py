@@ -0,0 +1,82 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv("config.env")
+
+# Telebot Fields
+TOKEN = os.getenv("TOKEN")
+# Bot API server, e.g. a local fake server for tests. Empty means api.telegram.org
+API_URL = os.getenv("API_URL", "").rstrip("/")
+ADMIN_CHAT_ID = 1129590158
+
+# Updates source: polling or webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8443))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# External address for setWebhook, empty means the webhook is registered elsewhere
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+
+TEMP_DIR = "temp_files"
+DATA_DIR = os.getenv("DATA_DIR", "data")
+
+# Document jobs
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 20))
+JOB_QUEUE_PER_CHAT = int(os.getenv("JOB_QUEUE_PER_CHAT", 5))
+ANALYSIS_EXECUTOR = os.getenv("ANALYSIS_EXECUTOR", "thread") # thread or process
+
+# Downloads: files larger than DOWNLOAD_MEMORY_MB are written to a directory of the job in TEMP_DIR
+DOWNLOAD_MAX_MB = int(os.getenv("DOWNLOAD_MAX_MB", 20))
+DOWNLOAD_MEMORY_MB = int(os.getenv("DOWNLOAD_MEMORY_MB", 5))
+# Temporary files: total size limit, age of directories left by failed jobs, janitor interval
+SPOOL_QUOTA_MB = int(os.getenv("SPOOL_QUOTA_MB", 500))
+SPOOL_MAX_AGE = float(os.getenv("SPOOL_MAX_AGE", 3600))
+SPOOL_CLEAN_INTERVAL = float(os.getenv("SPOOL_CLEAN_INTERVAL", 300))
+
+# Batch uploads: zip archives and media groups
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", 50))
+BATCH_MAX_MB = int(os.getenv("BATCH_MAX_MB", 200))
+MEDIA_GROUP_DELAY = float(os.getenv("MEDIA_GROUP_DELAY", 1.5))
+
+# Parsed reports cache
+CACHE_MAX_MB = int(os.getenv("CACHE_MAX_MB", 200))
+CACHE_TTL = float(os.getenv("CACHE_TTL", 900))
+
+# Conversation state: memory, sqlite or http (shared state server, see state.py)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+STATE_PATH = os.getenv("STATE_PATH", os.path.join(DATA_DIR, "state.sqlite3"))
+STATE_URL = os.getenv("STATE_URL", "http://127.0.0.1:8090")
+STATE_TTL = float(os.getenv("STATE_TTL", 7 * 24 * 3600))
+STATE_CACHE_SIZE = int(os.getenv("STATE_CACHE_SIZE", 1000))
+
+# Threshold rules of branches, edited by the admin with /rules
+RULES_PATH = os.getenv("RULES_PATH", os.path.join(DATA_DIR, "rules.json"))
+
+# Results history for trend commands
+HISTORY_PATH = os.getenv("HISTORY_PATH", os.path.join(DATA_DIR, "history.sqlite3"))
+TREND_POINTS = int(os.getenv("TREND_POINTS", 8))
+# Students listed by /risk without a count
+RISK_SHOWN = int(os.getenv("RISK_SHOWN", 30))
+
+# Outgoing messages: Telegram allows about 1 message per second to a chat and 30 per second overall
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", 1))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", 3))
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", 30))
+SEND_BULK_RATE = float(os.getenv("SEND_BULK_RATE", 20))
+# Results longer than this many characters are sent as a .csv file
+RESULT_FILE_THRESHOLD = int(os.getenv("RESULT_FILE_THRESHOLD", 12000))
+
+# Prometheus text endpoint /metrics with stage timings, 0 - disabled
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+
+
+def api_urls():
+    """
+    :return: Шаблоны адресов методов и файлов Bot API для apihelper/asyncio_helper или None
+    """
+    if not API_URL:
+        return None
+    return f"{API_URL}/bot{{0}}/{{1}}", f"{API_URL}/file/bot{{0}}/{{1}}"
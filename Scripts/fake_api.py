@@ -0,0 +1,209 @@
+"""
+Локальная замена Telegram Bot API для тестов и нагрузочного тестирования без сети
+
+Поддерживает getMe, getFile, скачивание файлов, sendMessage, editMessageText, sendDocument
+и отвечает {"ok": true} на остальные методы. Может отвечать 429 Too Many Requests для проверки
+ограничения частоты. Бот подключается через API_URL=http://host:port
+
+Запуск: python scripts/fake_api.py [port]
+"""
+import itertools
+import json
+import re
+import sys
+import threading
+import time
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+METHOD_PATH = re.compile(r"^/bot(?P<token>[^/]+)/(?P<method>\w+)$")
+FILE_PATH = re.compile(r"^/file/bot(?P<token>[^/]+)/(?P<path>.+)$")
+
+
+class TooManyRequests(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__(f"Too Many Requests: retry after {retry_after}")
+        self.retry_after = retry_after
+
+
+class FakeBotAPI:
+    """
+    Состояние фейкового Bot API: загруженные файлы и отправленные ботом сообщения
+    """
+
+    def __init__(self):
+        self.files = {}  # file_id -> (file_unique_id, file_path, data)
+        self.file_data = {}  # file_path -> data
+        self.sent = []  # (method, params) of every outgoing call
+        self.calls = {}  # method -> count
+        self.floods = {}  # method -> [calls left to reject, retry_after]
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Condition()
+
+    def add_file(self, file_id: str, data: bytes, file_name: str = "report.xlsx") -> dict:
+        """
+        Регистрирует файл, который бот сможет скачать
+
+        :param file_id: Идентификатор файла
+        :param data: Содержимое файла
+        :param file_name: Имя файла
+        :return: Объект document для update с сообщением
+        """
+        file_unique_id = f"u-{file_id}"
+        file_path = f"documents/{file_id}/{file_name}"
+        with self._lock:
+            self.files[file_id] = (file_unique_id, file_path, data)
+            self.file_data[file_path] = data
+        return {"file_id": file_id, "file_unique_id": file_unique_id, "file_name": file_name, "file_size": len(data)}
+
+    def flood(self, method: str, count: int = 1, retry_after: int = 1):
+        """
+        Следующие count вызовов метода получат ответ 429 с retry_after
+        """
+        with self._lock:
+            self.floods[method] = [count, retry_after]
+
+    def wait_for(self, method: str, count: int, timeout: float = 30) -> bool:
+        """
+        Ждет, пока бот вызовет метод указанное количество раз
+
+        :return: True, если вызовов было достаточно до истечения timeout
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self.calls.get(method, 0) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._lock.wait(remaining)
+            return True
+
+    def call(self, method: str, params: dict):
+        """
+        Выполняет метод Bot API
+
+        :return: Поле result ответа
+        :raises TooManyRequests: Если для метода задан flood
+        """
+        with self._lock:
+            flood = self.floods.get(method)
+            if flood and flood[0] > 0:
+                flood[0] -= 1
+                raise TooManyRequests(flood[1])
+            self.sent.append((method, params))
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self._lock.notify_all()
+
+        match method:
+            case "getMe":
+                return {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+            case "getFile":
+                file_unique_id, file_path, data = self.files[params["file_id"]]
+                return {"file_id": params["file_id"], "file_unique_id": file_unique_id, "file_size": len(data), "file_path": file_path}
+            case "getUpdates":
+                return []
+            case "sendMessage" | "sendDocument" | "editMessageText":
+                return self._message(params)
+            case _:
+                return True
+
+    def _message(self, params):
+        message_id = int(params.get("message_id") or next(self._message_ids))
+        chat_id = int(params.get("chat_id", 0))
+        message = {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "FakeBot"},
+        }
+        if "text" in params:
+            message["text"] = params["text"]
+        return message
+
+
+class FakeServer(ThreadingHTTPServer):
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def _parse_body(content_type: str, body: bytes) -> dict:
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    if content_type.startswith("multipart/form-data"):
+        message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        params = {}
+        for part in message.iter_parts():
+            payload = part.get_payload(decode=True)
+            params[part.get_param("name", header="content-disposition")] = payload if part.get_filename() else payload.decode()
+        return params
+    return dict(parse_qsl(body.decode()))
+
+
+def make_handler(api: FakeBotAPI):
+    class Handler(BaseHTTPRequestHandler):
+        def _handle(self):
+            url = urlparse(self.path)
+            file_match = FILE_PATH.match(url.path)
+            if file_match:
+                data = api.file_data.get(file_match["path"])
+                if data is None:
+                    return self._send(404, b"Not Found", "text/plain")
+                return self._send(200, data, "application/octet-stream")
+
+            method_match = METHOD_PATH.match(url.path)
+            if not method_match:
+                return self._send(404, b"Not Found", "text/plain")
+
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            params = dict(parse_qsl(url.query))
+            params.update(_parse_body(self.headers.get("Content-Type", ""), body))
+            try:
+                result = {"ok": True, "result": api.call(method_match["method"], params)}
+                status = 200
+            except KeyError as e:
+                result = {"ok": False, "error_code": 400, "description": f"Bad Request: {e}"}
+                status = 400
+            except TooManyRequests as e:
+                result = {"ok": False, "error_code": 429, "description": str(e), "parameters": {"retry_after": e.retry_after}}
+                status = 429
+            self._send(status, json.dumps(result).encode(), "application/json")
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = _handle
+        do_POST = _handle
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start(port: int = 0, api: FakeBotAPI = None):
+    """
+    Запускает фейковый Bot API в фоновом потоке
+
+    :param port: Порт, 0 - выбрать свободный
+    :param api: Состояние сервера, по умолчанию новое
+    :return: Сервер и его состояние, адрес сервера - f"http://127.0.0.1:{server.server_port}"
+    """
+    api = api or FakeBotAPI()
+    server = FakeServer(("127.0.0.1", port), make_handler(api))
+    threading.Thread(target=server.serve_forever, name="fake-bot-api", daemon=True).start()
+    return server, api
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    server, _ = start(port)
+    print(f"Fake Bot API started on http://127.0.0.1:{server.server_port}")
+    threading.Event().wait()
@@ -0,0 +1,627 @@
+"""
+Логика обработчиков бота, общая для синхронного (main.py) и асинхронного (main_async.py) режимов
+
+Обработчики не обращаются к Telegram напрямую, а возвращают список шагов ответа:
+    ("reply", text) или ("reply", text, markup) - ответить на сообщение
+    ("edit", text, markup) - изменить сообщение (для callback - сообщение с кнопками)
+    ("menu",) - отправить меню
+    ("broadcast", alerts) - разослать уведомления преподавателям и прислать итог в чат
+Шаги выполняет функция respond конкретного режима
+"""
+import csv
+import io
+import json
+import os
+import threading
+import time
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+import actions
+import alerts
+import batch
+import cache
+import config
+import history
+import metrics
+import risk
+import rules
+import spool
+import state
+import teachers
+import utils
+
+# Conversation state: action chosen in the menu ("action:<chat_id>") and prepared alerts ("alerts:<chat_id>")
+STATE = None
+
+# Teachers registry
+TEACHERS = None
+
+# Parsed reports by Telegram file_unique_id
+REPORT_CACHE = cache.ReportCache(max_bytes=config.CACHE_MAX_MB * 1024 * 1024, ttl=config.CACHE_TTL)
+
+# Temporary files of document jobs, each job has its own directory
+SPOOL = spool.Spool(config.TEMP_DIR, config.SPOOL_QUOTA_MB * 1024 * 1024, config.SPOOL_MAX_AGE)
+
+# Results of every analysed report for trend commands
+HISTORY = None
+
+# Students at risk by the latest homework and marks results, loaded from the history on first use.
+# Thresholds are the values of these rules of the chat's branch, one profile per branch
+RISK_RULES = {"homework_pct": "low_homework_percentage", "average_mark": "marks_analysis"}
+RISK = {}
+RISK_LOCK = threading.Lock()
+
+def init():
+    """
+    Открывает хранилища состояния, реестра преподавателей и истории
+
+    Вызывается при создании бота, а не при импорте: импорт модуля не создает файлов в data/
+    """
+    global STATE, TEACHERS, HISTORY
+    if STATE is not None:
+        return
+    STATE = state.create_store(
+        config.STATE_BACKEND, config.STATE_TTL, config.STATE_CACHE_SIZE, config.STATE_PATH, config.STATE_URL
+    )
+    TEACHERS = teachers.TeacherRegistry(os.path.join(config.DATA_DIR, "teachers.json"))
+    HISTORY = history.HistoryStore(config.HISTORY_PATH)
+
+def risk_thresholds(branch: str = None) -> dict:
+    """
+    :param branch: Филиал, None - общие правила
+    :return: {метрика: порог} из правил филиала, метрика отключенного правила не учитывается
+    """
+    rules = {rule["id"]: rule for rule in actions.RULES.compiled("students", branch).rules}
+    return {metric: rules[rule_id]["value"] for metric, rule_id in RISK_RULES.items() if rule_id in rules}
+
+def risk_profile(branch: str = None):
+    """
+    :param branch: Филиал, None - общие правила
+    :return: risk.RiskProfile с порогами филиала, после изменения правил создается заново
+    """
+    branch = branch or rules.DEFAULT_BRANCH
+    thresholds = risk_thresholds(branch)
+    with RISK_LOCK:
+        profile = RISK.get(branch)
+        if profile is None or profile.thresholds != thresholds:
+            profile = RISK[branch] = risk.RiskProfile(thresholds, lambda: HISTORY.latest(list(RISK_RULES)))
+        return profile
+
+def risk_profiles() -> list:
+    """
+    :return: Уже созданные профили всех филиалов
+    """
+    with RISK_LOCK:
+        return list(RISK.values())
+
+# How many teachers without a chat to list under the alerts offer
+UNMATCHED_SHOWN = 30
+
+#regionStart Menu
+MENU_TEXT = (
+    "Выберите действие:\n\n"
+    "1️⃣ *Пары группы* - количество пар группы по всем дисциплинам за неделю\n"
+    "2️⃣ *Проверенные ДЗ* - проверка % проверенных заданий\n"
+    "3️⃣ *Выданные ДЗ* - проверка % выданных заданий\n"
+    "4️⃣ *Тема урока* - проверка соответствия темы урока шаблону \"Урок № . Тема:\"\n"
+    "5️⃣ *Посещаемость* - анализ посещаемости у преподавателей\n"
+    "6️⃣ *Выполнение ДЗ* - анализ выполнения ДЗ студентами\n"
+    "7️⃣ *Анализ успеваемости* - информация успеваемости студентов\n\n"
+    "Можно прислать отчет без выбора действия - бот определит тип отчета и выполнит все подходящие анализы"
+)
+
+def menu_markup():
+    markup = InlineKeyboardMarkup()
+    group_subjects_button = InlineKeyboardButton("Пары группы", callback_data="group_subjects")
+    checked_homeworks_button = InlineKeyboardButton("Проверенные ДЗ", callback_data="checked_homeworks")
+    given_homeworks_button = InlineKeyboardButton("Выданные ДЗ", callback_data="given_homeworks")
+    topic_check_button = InlineKeyboardButton("Тема урока", callback_data="topic_periods")
+    low_attendance_button = InlineKeyboardButton("Посещаемость", callback_data="low_attendance")
+    low_homework_percentage_button = InlineKeyboardButton("Выполнение ДЗ", callback_data="low_homework_percentage")
+    marks_analysis_button = InlineKeyboardButton("Анализ успеваемости", callback_data="marks_analysis")
+
+    markup.add(
+        group_subjects_button,
+        checked_homeworks_button,
+        given_homeworks_button,
+        topic_check_button,
+        low_attendance_button,
+        low_homework_percentage_button,
+        marks_analysis_button
+        )
+    return markup
+
+def is_admin(chat_id) -> bool:
+    return chat_id == config.ADMIN_CHAT_ID
+
+# Admin Commands
+def add_teacher(message):
+    if not is_admin(message.chat.id):
+        return [("reply", "Нет доступа к команде"), ("menu",)]
+    return [("reply", "Добавление преподавателя\nНапишите в первой строчке @username, во второй ФИО преподавателя\nОтветьте на это сообщение, чтобы добавить преподавателя")]
+
+def is_teacher_input(message) -> bool:
+    return bool(message.reply_to_message and (message.reply_to_message.text or "").startswith("Добавление преподавателя"))
+
+def handle_teacher_input(message):
+    if not is_admin(message.chat.id):
+        return [("reply", "Нет доступа к данному действию"), ("menu",)]
+
+    # Split input to 2 rows
+    user_input = message.text.split("\n")
+    if len(user_input) != 2:
+        return [("reply", "Ошибка: формат данных неправильный\nНапишите в первой строчке @username, во второй ФИО преподавателя")]
+
+    username, full_name = user_input
+    username = username.strip()
+    full_name = full_name.strip()
+
+    # Check correct data
+    if not username.startswith("@") or len(username) < 2:
+        return [("reply", "Ошибка: username должен начинаться с '@' и содержать хотя бы один символ после")]
+
+    TEACHERS.save(username, None, full_name)
+    # The admin is told whether the teacher is saved, so the file is written right away
+    if TEACHERS.flush():
+        return [("reply", f"Преподаватель добавлен:\nUsername: {username}\nФИО: {full_name}\nchat_id: None")]
+    return [("reply", "Ошибка: не удалось сохранить преподавателя")]
+
+def show_teachers(message):
+    if not is_admin(message.chat.id):
+        return [("reply", "Нет доступа к команде"), ("menu",)]
+
+    if not len(TEACHERS):
+        return [("reply", "Список преподавателей пуст")]
+
+    result = "Список преподавателей:\n"
+    for username, data in TEACHERS.items():
+        full_name = data.get("full_name", "Неизвестно")
+        result += f"{username} : {full_name}\n"
+    return [("reply", result)]
+
+def cache_stats(message):
+    if not is_admin(message.chat.id):
+        return [("reply", "Нет доступа к команде"), ("menu",)]
+
+    stats = REPORT_CACHE.stats()
+    requests_count = stats["hits"] + stats["misses"]
+    hit_rate = stats["hits"] / requests_count * 100 if requests_count else 0
+    return [("reply",
+        f"Кэш отчетов:\n"
+        f"Записей: {stats['entries']}\n"
+        f"Объем: {stats['size'] / 1024 / 1024:.1f} из {stats['max_size'] / 1024 / 1024:.0f} МБ\n"
+        f"Попадания: {stats['hits']}\n"
+        f"Промахи: {stats['misses']}\n"
+        f"Доля попаданий: {hit_rate:.0f}%\n"
+        f"Вытеснено: {stats['evictions']}"
+    )]
+
+METRIC_TITLES = {
+    "lessons": "Пары за неделю",
+    "checked_pct": "Проверенные ДЗ, %",
+    "given_pct": "Выданные ДЗ, %",
+    "bad_topics": "Темы не по шаблону",
+    "attendance": "Посещаемость, %",
+    "homework_pct": "Выполнение ДЗ, %",
+    "average_mark": "Средняя оценка",
+}
+PERIOD_TITLES = {"month": "за месяц", "week": "за неделю"}
+TREND_USAGE = (
+    "Использование: /trend [метрика] ФИО или группа\n"
+    "Метрики: " + ", ".join(METRIC_TITLES)
+)
+
+def trend(message):
+    if not is_admin(message.chat.id):
+        return [("reply", "Нет доступа к команде"), ("menu",)]
+
+    words = (message.text or "").split()[1:]
+    metric = words.pop(0) if words and words[0] in METRIC_TITLES else None
+    name = " ".join(words)
+    if not name:
+        return [("reply", TREND_USAGE)]
+
+    trends = HISTORY.trend(name, metric, config.TREND_POINTS)
+    if not trends:
+        return [("reply", f"Нет сохраненных результатов для {name}")]
+
+    result = f"Динамика: {name}\n"
+    for (row_metric, period), points in trends.items():
+        title = " ".join(filter(None, [METRIC_TITLES.get(row_metric, row_metric), PERIOD_TITLES.get(period)]))
+        values = " → ".join(f"{round(value, 1):g} ({time.strftime('%d.%m', time.localtime(recorded_at))})" for recorded_at, value in points)
+        result += f"{title}: {values}\n"
+    return [("reply", result)]
+
+RISK_USAGE = "Использование: /risk [количество студентов]"
+
+# Risk factors in /risk lines: title and unit
+RISK_TITLES = {"homework_pct": ("выполнение ДЗ", "%"), "average_mark": ("средняя оценка", "")}
+# Risk factors in the /risk header, formatted with the threshold of the branch
+RISK_CONDITIONS = {"homework_pct": "выполнение ДЗ ниже {value:g}%", "average_mark": "средняя оценка ниже {value:g}"}
+
+def risk_line(position: int, name: str, values: dict, metrics) -> str:
+    parts = [
+        f"{title} {round(values[metric], 1):g}{unit}" if metric in values else f"{title} нет данных"
+        for metric, (title, unit) in RISK_TITLES.items()
+        if metric in metrics
+    ]
+    return f"{position}. {name}: " + ", ".join(parts)
+
+def risk_students(message):
+    if not is_admin(message.chat.id):
+        return [("reply", "Нет доступа к команде"), ("menu",)]
+
+    words = (message.text or "").split()[1:]
+    if words and not words[0].isdigit():
+        return [("reply", RISK_USAGE)]
+    profile = risk_profile(chat_branch(message.chat.id))
+    if not profile.thresholds:
+        return [("reply", "Проверки выполнения ДЗ и успеваемости отключены в правилах филиала")]
+    rows, total = profile.ranked(int(words[0]) if words else config.RISK_SHOWN)
+    if not total:
+        return [("reply", "Нет студентов в зоне риска, отправьте отчет по студентам")]
+
+    conditions = " или ".join(RISK_CONDITIONS[metric].format(value=value) for metric, value in profile.thresholds.items())
+    result = f"Студенты в зоне риска: {total}\n{conditions[0].upper()}{conditions[1:]}"
+    if len(profile.thresholds) > 1:
+        result += ", сначала студенты с обоими факторами"
+    result += "\n\n"
+    result += "\n".join(risk_line(position, name, values, profile.thresholds) for position, (name, values, _, _) in enumerate(rows, 1))
+    if total > len(rows):
+        result += f"\n\nПоказано {len(rows)} из {total}, /risk {total} - весь список"
+    return [("reply", part) for part in utils.split_message(result)]
+
+RULES_TITLE = "Правила проверок"
+RULES_HELP = (
+    "Чтобы заменить правки филиала, ответьте на первое сообщение JSON: список правил "
+    "или {\"chats\": [chat_id, ...], \"rules\": [...]}, chats - чаты, отчеты из которых проверяются правилами филиала\n"
+    "Правило с id существующего меняет только указанные поля, например {\"id\": \"checked_month\", \"value\": 80}, "
+    "\"enabled\": false отключает правило. Новое правило задает все поля: id, report, column, "
+    "op (" + " ".join(rules.OPERATORS) + "), value, title и line - строку нарушения со значениями столбцов в {}, например "
+    "{\"id\": \"no_plan\", \"report\": \"homework\", \"column\": \"month_planned\", \"op\": \"==\", \"value\": 0, "
+    "\"title\": \"Нет плана ДЗ\", \"line\": \"выдано {month_given}\"}\n"
+    "/rules филиал - правила другого филиала"
+)
+
+def rules_text(branch: str) -> str:
+    branches = actions.RULES.branches()
+    names = [
+        f"{name} (чаты: {', '.join(map(str, entry['chats']))})" if entry.get("chats") else name
+        for name, entry in branches.items()
+    ]
+    result = f"{RULES_TITLE}: {branch}\nФилиалы: {', '.join(names) or rules.DEFAULT_BRANCH}\n\nДействующие правила:\n"
+    result += "\n".join(
+        f"{rules.describe(rule)} ({actions.REPORT_NAMES[rule['report']]})" for rule in actions.RULES.rules(branch)
+    )
+    changes = branches.get(branch, {}).get("rules")
+    result += "\n\nПравки филиала: " + (json.dumps(changes, ensure_ascii=False) if changes else "нет")
+    result += "\n\nСтолбцы для правил:\n" + "\n".join(
+        f"{actions.REPORT_NAMES[report]} ({report}): {', '.join(columns)}" for report, columns in actions.RULE_COLUMNS.items()
+    )
+    return result + "\n\n" + RULES_HELP
+
+def show_rules(message):
+    if not is_admin(message.chat.id):
+        return [("reply", "Нет доступа к команде"), ("menu",)]
+
+    branch = " ".join((message.text or "").split()[1:]) or chat_branch(message.chat.id)
+    return [("reply", part) for part in utils.split_message(rules_text(branch))]
+
+def is_rules_input(message) -> bool:
+    return bool(message.reply_to_message and (message.reply_to_message.text or "").startswith(f"{RULES_TITLE}: "))
+
+def handle_rules_input(message):
+    if not is_admin(message.chat.id):
+        return [("reply", "Нет доступа к данному действию"), ("menu",)]
+
+    # Branch from the first line of the rules message
+    branch = message.reply_to_message.text.split("\n", 1)[0][len(RULES_TITLE) + 2:].strip()
+    try:
+        branch_rules = actions.RULES.save(branch, json.loads(message.text or ""))
+    except ValueError as e:
+        return [("reply", f"Ошибка в правилах, изменения не сохранены: {e}")]
+    except OSError as e:
+        print(f"Error with rules save: {e}")
+        return [("reply", "Ошибка: не удалось сохранить правила")]
+    return [("reply", f"Правила филиала {branch} сохранены, действует правил: {len(branch_rules)}")]
+
+def chat_branch(chat_id) -> str:
+    """
+    :return: Филиал, правилами которого проверяются отчеты из этого чата
+    """
+    return actions.RULES.branch_for(chat_id)
+
+STAGE_TITLES = {
+    "startup": "Запуск бота",
+    "first_update": "Запуск до первого обновления",
+    "queue": "Ожидание в очереди",
+    "download": "Скачивание",
+    "check": "Проверка заголовка",
+    "parse": "Разбор",
+    "analysis": "Анализ",
+    "history": "Запись в историю",
+    "send": "Отправка",
+    "total": "Всего до ответа",
+}
+# Measurements shown by /stats: title, unit divisor, unit
+STATS_SECTIONS = {
+    "stage_seconds": ("Время этапов", 0.001, "мс"),
+    "file_bytes": ("Размер файлов", 1024, "КБ"),
+    "report_rows": ("Строк в отчетах", 1, "шт."),
+}
+
+def stats_label(labels: dict) -> str:
+    parts = [STAGE_TITLES.get(labels["stage"], labels["stage"])] if "stage" in labels else []
+    if "action" in labels:
+        parts.append(actions.ACTION_TITLES.get(labels["action"], labels["action"]))
+    if "report" in labels:
+        parts.append(actions.REPORT_NAMES.get(labels["report"], labels["report"]))
+    if "method" in labels:
+        parts.append(labels["method"])
+    return ", ".join(parts)
+
+def stats(message):
+    if not is_admin(message.chat.id):
+        return [("reply", "Нет доступа к команде"), ("menu",)]
+
+    # Stages in processing order, then by labels
+    stages = list(STAGE_TITLES)
+    summary = sorted(metrics.REGISTRY.summary(), key=lambda row: stages.index(row[1]["stage"]) if row[1].get("stage") in stages else len(stages))
+    if not summary:
+        return [("reply", "Пока нет измерений, отправьте отчет")]
+
+    result = ""
+    for name, (title, divisor, unit) in STATS_SECTIONS.items():
+        rows = [
+            f"{stats_label(labels)}: " + " / ".join(f"{value / divisor:.0f}" for value in quantiles) + f" ({count})"
+            for row_name, labels, count, quantiles in summary if row_name == name
+        ]
+        if rows:
+            result += f"{title}, {unit} (p50 / p95 / p99, количество):\n" + "\n".join(rows) + "\n\n"
+    return [("reply", result)]
+
+# Common commands
+def start(message):
+    username = f"@{message.from_user.username}"
+    teacher = TEACHERS.get(username)
+    if teacher is None or teacher["chat_id"] == message.chat.id:
+        return []
+
+    TEACHERS.save(username, chat_id=message.chat.id)
+    return [("reply", "Ваш ID успешно зарегистрирован")]
+
+def menu(message):
+    return [("menu",)]
+
+# Menu callbacks
+PERIOD_MENUS = {
+    "checked_homeworks": ("Выберите период для анализа проверенных ДЗ:", "checked"), # 2. Checked homeworks
+    "given_homeworks": ("Выберите период для анализа выданных ДЗ:", "given"), # 3. Given homeworks
+    "topic_periods": ("Выберите период для проверки тем уроков:", "topic_check"), # 4. Lessons topic check
+}
+# Period menus that also offer the whole report: menu -> action
+WHOLE_REPORT_ACTIONS = {"topic_periods": "topic_check"}
+
+HOMEWORKS_FILE_PROMPT = "Пришлите отчет по домашним заданиям формате .xls или .xlsx"
+TOPICS_FILE_PROMPT = "Пришлите отчет по темам уроков в формате .xls или .xlsx"
+ACTION_PROMPTS = {
+    "group_subjects": "Бот подсчитает количество проведенных пар по всем дисциплинам\nПришлите расписание группы в формате .xls или .xlsx",
+    "checked_month": "Бот подсчитает % проверенных домашних заданий педагогами на группу за месяц и выведет тех, у кого он ниже {value:g}%\n" + HOMEWORKS_FILE_PROMPT,
+    "checked_week": "Бот подсчитает % проверенных домашних заданий педагогами на группу за неделю и выведет тех, у кого он ниже {value:g}%\n" + HOMEWORKS_FILE_PROMPT,
+    "given_month": "Бот подсчитает % выданных домашних заданий педагогами за месяц и выведет тех, у кого он ниже {value:g}%\n" + HOMEWORKS_FILE_PROMPT,
+    "given_week": "Бот подсчитает % выданных домашних заданий педагогами за неделю и выведет тех, у кого он ниже {value:g}%\n" + HOMEWORKS_FILE_PROMPT,
+    "topic_check": "Бот выведет преподавателей с количеством и долей тем, не соответствующих шаблону \"Урок № . Тема:\", и примерами таких тем\n" + TOPICS_FILE_PROMPT,
+    "topic_check_month": "Бот проверит темы уроков за последний месяц отчета на соответствие шаблону \"Урок № . Тема:\"\n" + TOPICS_FILE_PROMPT,
+    "topic_check_week": "Бот проверит темы уроков за последнюю неделю отчета на соответствие шаблону \"Урок № . Тема:\"\n" + TOPICS_FILE_PROMPT,
+    "low_attendance": "Бот выведет список преподавателей, средняя посещаемость которых ниже {value:g}%\nПришлите отчет по посещаемости студентов в формате .xls или .xlsx",
+    "low_homework_percentage": "Бот выведет список студентов, процент выполнения ДЗ которых ниже {value:g}%\nПришлите отчет по студентам в формате .xls или .xlsx",
+    "marks_analysis": "Бот выведет список студентов, средняя оценка которых ниже {value:g}\nПришлите отчет по студентам в формате .xls или .xlsx",
+}
+BATCH_PROMPT = "\nМожно прислать несколько файлов одним сообщением или архив .zip"
+
+def action_prompt(action: str, branch: str = None) -> str:
+    """
+    :param action: Действие из ACTION_PROMPTS
+    :param branch: Филиал чата, порог проверки берется из его правил
+    :return: Текст с описанием проверки и просьбой прислать файл
+    """
+    prompt = ACTION_PROMPTS[action]
+    if action not in actions.RULE_ACTIONS:
+        return prompt
+    rule = next((rule for rule in actions.RULES.compiled(actions.report_type(action), branch).rules if rule["id"] == action), None)
+    if rule is None:
+        # The last line asks for the file, the description with the threshold is replaced
+        return "Проверка отключена в правилах филиала\n" + prompt.rsplit("\n", 1)[-1]
+    return prompt.format(value=rule["value"])
+
+def send_alerts(call):
+    if not is_admin(call.message.chat.id):
+        return [("reply", "Нет доступа к данному действию"), ("menu",)]
+
+    teacher_alerts = STATE.pop(f"alerts:{call.message.chat.id}")
+    if not teacher_alerts:
+        return [("edit", "Нет подготовленных уведомлений, отправьте отчет еще раз", None)]
+    return [
+        ("edit", f"Рассылка {len(teacher_alerts)} уведомлений поставлена в очередь", None),
+        ("broadcast", teacher_alerts),
+    ]
+
+def choose_period(call):
+    text, prefix = PERIOD_MENUS[call.data]
+    markup = InlineKeyboardMarkup()
+    month_button = InlineKeyboardButton("Месяц", callback_data=f"{prefix}_month")
+    week_button = InlineKeyboardButton("Неделя", callback_data=f"{prefix}_week")
+    markup.row(month_button, week_button)
+    if call.data in WHOLE_REPORT_ACTIONS:
+        markup.row(InlineKeyboardButton("Весь отчет", callback_data=WHOLE_REPORT_ACTIONS[call.data]))
+    return [("edit", text, markup)]
+
+def request_file(call):
+    STATE.set(f"action:{call.message.chat.id}", call.data)
+    return [("edit", action_prompt(call.data, chat_branch(call.message.chat.id)) + BATCH_PROMPT, None)]
+
+# Handlers in registration order: filters for register_message_handler and the handler
+MESSAGE_HANDLERS = [
+    ({"commands": ["add_teacher"]}, add_teacher),
+    ({"func": is_teacher_input}, handle_teacher_input),
+    ({"commands": ["show_teachers"]}, show_teachers),
+    ({"commands": ["cache_stats"]}, cache_stats),
+    ({"commands": ["trend"]}, trend),
+    ({"commands": ["risk"]}, risk_students),
+    ({"commands": ["rules"]}, show_rules),
+    ({"func": is_rules_input}, handle_rules_input),
+    ({"commands": ["stats"]}, stats),
+    ({"commands": ["start"]}, start),
+    ({"commands": ["menu"]}, menu),
+]
+CALLBACK_HANDLERS = [
+    (lambda call: call.data in PERIOD_MENUS, choose_period),
+    (lambda call: call.data in ACTION_PROMPTS, request_file),
+    (lambda call: call.data == "send_alerts", send_alerts),
+]
+
+# Documents
+def get_user_state(chat_id):
+    """
+    :return: Действие, выбранное в меню, или None
+    """
+    return STATE.get(f"action:{chat_id}")
+
+def check_document(message):
+    """
+    Проверяет, можно ли обработать присланный документ
+
+    :param message: Сообщение с документом
+    :return: Действие из меню (None, если не выбрано) и шаги ответа с отказом (пустой список, если документ принят)
+    """
+    # Without a chosen action the report type is detected from the file
+    user_state = get_user_state(message.chat.id)
+
+    # Catch incorrect file type
+    file_name = message.document.file_name
+    if not batch.is_report(file_name) and not batch.is_archive(file_name):
+        return None, [("reply", "Пожалуйста, отправьте файл в формате .xls или .xlsx или архив .zip с такими файлами"), ("menu",)]
+    # Size from the message, too large files are not downloaded at all
+    if (message.document.file_size or 0) > config.DOWNLOAD_MAX_MB * 1024 * 1024:
+        return None, [("reply", f"Файл больше {config.DOWNLOAD_MAX_MB} МБ, отправьте файл меньшего размера"), ("menu",)]
+    return user_state, []
+
+def is_single_report(documents) -> bool:
+    """
+    :return: True, если прислан один отчет, а не архив или медиагруппа
+    """
+    return len(documents) == 1 and batch.is_report(documents[0].file_name)
+
+def batch_files(documents, contents, job_spool=None) -> list:
+    """
+    Собирает файлы пакетной загрузки, распаковывая архивы
+
+    :param documents: Документы из сообщений в порядке отправки
+    :param contents: Содержимое этих документов или пути к ним
+    :param job_spool: spool.JobSpool задания для больших отчетов из архивов
+    :return: Список (имя файла, содержимое или путь)
+    """
+    files = []
+    for document, data in zip(documents, contents):
+        if batch.is_archive(document.file_name):
+            files.extend(batch.extract_reports(
+                data, config.BATCH_MAX_FILES, config.BATCH_MAX_MB * 1024 * 1024, job_spool, config.DOWNLOAD_MEMORY_MB * 1024 * 1024
+            ))
+        else:
+            files.append((document.file_name, data))
+    if len(files) > config.BATCH_MAX_FILES:
+        raise ValueError(f"Можно отправить не больше {config.BATCH_MAX_FILES} отчетов за раз")
+    return files
+
+def report_key(document, report: str):
+    """
+    :return: Ключ кэша разобранного отчета для документа и типа отчета
+    """
+    return document.file_unique_id, report
+
+def result_messages(result: str) -> list:
+    """
+    :return: Результат, разбитый на сообщения допустимой длины
+    """
+    return utils.split_message(result) if len(result) >= 4096 else [result]
+
+def history_writer(source: str, chat_id):
+    """
+    Запись результатов в историю по частям во время анализа, в том числе из процесса пула
+
+    :param source: Идентификатор файла, например file_unique_id
+    :param chat_id: Чат, из которого прислан отчет
+    :return: history.HistoryWriter, который сохраняет записи result_records, для actions.analyze_with_records
+    """
+    return history.HistoryWriter(config.HISTORY_PATH, source, chat_id)
+
+def save_history(records, source: str, chat_id):
+    """
+    Сохраняет результаты анализа в историю, ошибка записи не мешает ответу пользователю
+
+    :param records: Записи result_records или None, если анализ уже записал их через history_writer
+    """
+    try:
+        if records is None:
+            # Written chunk by chunk by the analysis, the risk profiles reread them from the history
+            for profile in risk_profiles():
+                profile.reload()
+            return
+        with metrics.timer("history"):
+            HISTORY.add(records, source, chat_id)
+            for profile in risk_profiles():
+                profile.update(records)
+    except Exception as e:
+        print(f"Error with history save: {e}")
+
+def prepare_alerts(chat_id, report_actions: list, df) -> list:
+    """
+    Готовит личные уведомления преподавателям по отчету администратора
+
+    :return: Шаги ответа с предложением разослать уведомления (пустой список, если рассылать нечего)
+    """
+    if not is_admin(chat_id):
+        return []
+    lines = actions.teacher_lines(report_actions, df, chat_branch(chat_id))
+    if not lines:
+        return []
+
+    teacher_alerts, unmatched = alerts.match_teachers(lines, TEACHERS)
+    if not teacher_alerts:
+        # Nobody to notify: no extra message after every report
+        return []
+    text = f"Личные уведомления: преподавателей в результате {len(lines)}, из них можно уведомить {len(teacher_alerts)}"
+    if unmatched:
+        text += "\nНет в реестре или не зарегистрировали ID через /start:\n" + "\n".join(unmatched[:UNMATCHED_SHOWN])
+        if len(unmatched) > UNMATCHED_SHOWN:
+            text += f"\nи еще {len(unmatched) - UNMATCHED_SHOWN}"
+
+    # [(teacher chat_id, username, text)] until the admin presses the button
+    STATE.set(f"alerts:{chat_id}", teacher_alerts)
+    markup = InlineKeyboardMarkup()
+    markup.add(InlineKeyboardButton("Отправить преподавателям", callback_data="send_alerts"))
+    return [("reply", text, markup)]
+
+def result_file(result: str):
+    """
+    Таблица .csv с результатом: строка "Имя: значение" становится двумя столбцами
+
+    :return: Имя файла и содержимое
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    for line in result.splitlines():
+        if line.strip():
+            writer.writerow(line.split(": ", 1))
+    # BOM for Excel to detect UTF-8
+    return "result.csv", buffer.getvalue().encode("utf-8-sig")
+
+def result_delivery(result: str):
+    """
+    Большой результат отправляется файлом вместо десятков сообщений
+
+    :return: Тексты сообщений и файл результата (имя, содержимое) или None
+    """
+    if len(result) > config.RESULT_FILE_THRESHOLD:
+        lines_count = sum(1 for line in result.splitlines() if line.strip())
+        return [f"Результат слишком большой для сообщений ({lines_count} строк), он отправлен файлом"], result_file(result)
+    return result_messages(result), None
@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import threading
+import time
+
+import teachers
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    recorded_at REAL NOT NULL,
+    source TEXT NOT NULL,
+    report TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    period TEXT NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    value REAL NOT NULL,
+    chat_id INTEGER,
+    occurrence INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (source, metric, period, name_key, occurrence)
+);
+CREATE INDEX IF NOT EXISTS results_by_name ON results (name_key, metric, period, recorded_at);
+CREATE INDEX IF NOT EXISTS results_by_report ON results (report, period, recorded_at);
+"""
+# Tables created before namesakes were kept: the unique key without occurrence is rebuilt, rows are copied
+MIGRATE_OCCURRENCE = """
+BEGIN;
+ALTER TABLE results RENAME TO results_old;
+DROP INDEX IF EXISTS results_by_name;
+DROP INDEX IF EXISTS results_by_report;
+""" + SCHEMA + """
+INSERT INTO results (recorded_at, source, report, metric, period, name, name_key, value, chat_id)
+SELECT recorded_at, source, report, metric, period, name, name_key, value, chat_id FROM results_old;
+DROP TABLE results_old;
+COMMIT;
+"""
+
+
+class HistoryStore:
+    """
+    История результатов анализа в SQLite
+
+    Хранит значение метрики по каждому преподавателю, студенту или группе для каждого
+    загруженного отчета. Индексы по имени и по типу отчета с периодом позволяют строить
+    динамику без повторного разбора файлов
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: Путь к файлу базы данных
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(results)")]
+        if columns and "occurrence" not in columns:
+            self._connection.executescript(MIGRATE_OCCURRENCE)
+        self._connection.executescript(SCHEMA)
+
+    def add(self, records: list, source: str, chat_id=None, recorded_at: float = None, occurrences: dict = None) -> int:
+        """
+        Добавляет результаты одного отчета, повторная загрузка того же файла не дублирует записи
+
+        Однофамильцы в одном отчете различаются номером вхождения имени, поэтому сохраняется каждая строка
+
+        :param records: Список (тип отчета, метрика, период, имя, значение) из actions.result_records
+        :param source: Идентификатор файла, например file_unique_id
+        :param chat_id: Чат, из которого прислан отчет
+        :param recorded_at: Время отчета (timestamp), по умолчанию текущее
+        :param occurrences: Счетчик имен, уже записанных из этого отчета, общий для его частей
+        :return: Количество добавленных записей
+        """
+        recorded_at = time.time() if recorded_at is None else recorded_at
+        occurrences = {} if occurrences is None else occurrences
+        rows = []
+        for report, metric, period, name, value in records:
+            name_key = teachers.normalize_name(name)
+            occurrence = occurrences.get((metric, period, name_key), 0)
+            occurrences[metric, period, name_key] = occurrence + 1
+            rows.append((recorded_at, source, report, metric, period, name, name_key, value, chat_id, occurrence))
+        with self._lock, self._connection:
+            before = self._connection.total_changes
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO results (recorded_at, source, report, metric, period, name, name_key, value, chat_id, occurrence) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            return self._connection.total_changes - before
+
+    def trend(self, name: str, metric: str = None, limit: int = 8) -> dict:
+        """
+        Последние значения метрик по преподавателю, студенту или группе
+
+        :param name: ФИО или название группы, без учета регистра и лишних пробелов
+        :param metric: Только эта метрика, по умолчанию все
+        :param limit: Сколько последних значений вернуть для каждой метрики и периода
+        :return: Словарь {(метрика, период): [(время, значение), ...]} от старых к новым
+        """
+        query = (
+            "SELECT metric, period, recorded_at, value FROM ("
+            " SELECT metric, period, recorded_at, value, occurrence,"
+            " ROW_NUMBER() OVER (PARTITION BY metric, period ORDER BY recorded_at DESC, occurrence DESC) AS position"
+            " FROM results WHERE name_key = ?" + (" AND metric = ?" if metric else "") +
+            ") WHERE position <= ? ORDER BY metric, period, recorded_at, occurrence"
+        )
+        params = [teachers.normalize_name(name)] + ([metric] if metric else []) + [limit]
+        with self._lock:
+            rows = self._connection.execute(query, params).fetchall()
+
+        trends = {}
+        for row_metric, period, recorded_at, value in rows:
+            trends.setdefault((row_metric, period), []).append((recorded_at, value))
+        return trends
+
+    def latest(self, metrics: list) -> list:
+        """
+        Последнее значение каждой метрики по каждому преподавателю, студенту или группе
+
+        :param metrics: Метрики, например ["homework_pct", "average_mark"]
+        :return: Список (метрика, имя, значение) от старых записей к новым
+        """
+        query = (
+            "SELECT metric, name, value FROM ("
+            " SELECT metric, name, value, recorded_at,"
+            " ROW_NUMBER() OVER (PARTITION BY name_key, metric ORDER BY recorded_at DESC) AS position"
+            " FROM results WHERE metric IN (" + ", ".join("?" * len(metrics)) + ")"
+            ") WHERE position = 1 ORDER BY recorded_at"
+        )
+        with self._lock:
+            return self._connection.execute(query, list(metrics)).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class HistoryWriter:
+    """
+    Запись результатов одного отчета в историю по частям через одно соединение на все задание
+
+    Соединение открывается при первой части, поэтому объект можно передать в процесс пула анализа
+    """
+
+    def __init__(self, path: str, source: str, chat_id=None, recorded_at: float = None):
+        """
+        :param path: Путь к файлу базы данных
+        :param source: Идентификатор файла, например file_unique_id
+        :param chat_id: Чат, из которого прислан отчет
+        :param recorded_at: Время отчета (timestamp), по умолчанию текущее
+        """
+        self.path = path
+        self.source = source
+        self.chat_id = chat_id
+        self.recorded_at = time.time() if recorded_at is None else recorded_at
+        # One name counter for all parts of the report, namesakes from different parts are kept apart
+        self._occurrences = {}
+        self._store = None
+
+    def __call__(self, records: list) -> int:
+        """
+        :param records: Записи одной части отчета из actions.result_records
+        :return: Количество добавленных записей, как у HistoryStore.add
+        """
+        if self._store is None:
+            self._store = HistoryStore(self.path)
+        return self._store.add(records, self.source, self.chat_id, self.recorded_at, self._occurrences)
+
+    def close(self):
+        if self._store is not None:
+            self._store.close()
+            self._store = None
@@ -0,0 +1,93 @@
+import threading
+from collections import OrderedDict, deque
+
+
+class QueueFullError(Exception):
+    """Очередь заполнена, новая задача не принята"""
+
+
+class JobQueue:
+    """
+    Ограниченная очередь задач с рабочими потоками
+
+    Задачи разных чатов выбираются по кругу, поэтому один чат с большим количеством
+    файлов не блокирует остальных пользователей
+    """
+
+    def __init__(self, handler, workers: int = 2, max_size: int = 20, max_per_chat: int = 5):
+        """
+        :param handler: Функция, которая выполняет задачу в рабочем потоке
+        :param workers: Количество рабочих потоков
+        :param max_size: Максимальное количество ожидающих задач
+        :param max_per_chat: Максимальное количество ожидающих задач одного чата
+        """
+        self._handler = handler
+        self._max_size = max_size
+        self._max_per_chat = max_per_chat
+        self._queues = OrderedDict()  # chat_id -> deque of jobs, in round-robin order
+        self._size = 0
+        self._condition = threading.Condition()
+
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True).start()
+
+    def __len__(self):
+        with self._condition:
+            return self._size
+
+    def submit(self, chat_id, job) -> int:
+        """
+        Ставит задачу в очередь
+
+        :param chat_id: Идентификатор чата, которому принадлежит задача
+        :param job: Объект задачи, передается в handler
+        :return: Позиция задачи в очереди, начиная с 1
+        :raises QueueFullError: Если очередь или лимит чата заполнены
+        """
+        with self._condition:
+            chat_queue = self._queues.get(chat_id)
+            if self._size >= self._max_size:
+                raise QueueFullError("Очередь заполнена")
+            if chat_queue is not None and len(chat_queue) >= self._max_per_chat:
+                raise QueueFullError("Слишком много файлов в очереди от этого чата")
+
+            if chat_queue is None:
+                chat_queue = self._queues[chat_id] = deque()
+            chat_queue.append(job)
+            self._size += 1
+            position = self._position(chat_id, len(chat_queue) - 1)
+            self._condition.notify()
+            return position
+
+    def _position(self, chat_id, index: int) -> int:
+        # Each round takes one job per chat, so count jobs served before ours
+        position = 1
+        for other_id, other_queue in self._queues.items():
+            if other_id == chat_id:
+                position += sum(min(len(q), index) for q in self._queues.values())
+                break
+            if len(other_queue) > index:
+                position += 1
+        return position
+
+    def _next_job(self):
+        with self._condition:
+            while not self._size:
+                self._condition.wait()
+
+            chat_id, chat_queue = next(iter(self._queues.items()))
+            job = chat_queue.popleft()
+            self._size -= 1
+            if chat_queue:
+                self._queues.move_to_end(chat_id)
+            else:
+                del self._queues[chat_id]
+            return job
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            try:
+                self._handler(job)
+            except Exception as e:
+                print(f"Error in job worker: {e}")
@@ -0,0 +1,38 @@
+import importlib
+import threading
+
+
+class LazyModule:
+    """
+    Модуль, который импортируется при первом обращении к его атрибуту
+
+    Тяжелые библиотеки анализа (pandas, openpyxl, xlrd) так не замедляют запуск бота,
+    команды меню работают до их загрузки. Полученные атрибуты запоминаются, поэтому
+    повторное обращение не дороже обычного
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr: str):
+        # Called only for attributes not yet stored in the instance
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        value = getattr(self._module, attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}'>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """
+    :param name: Имя модуля, например "pandas"
+    :return: Модуль, который загрузится при первом обращении к атрибуту
+    """
+    return LazyModule(name)
@@ -0,0 +1,130 @@
+"""
+Нагрузочный тест webhook режима без сети: фейковый Bot API, webhook сервер и бот в одном процессе
+
+Запуск: python scripts/loadtest.py [количество обновлений] [количество файлов]
+"""
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import fake_api
+
+CHAT_ID_START = 1000
+
+
+def make_report() -> bytes:
+    buffer = io.BytesIO()
+    pd.DataFrame({
+        "FIO": [f"Студент {i}" for i in range(50)],
+        "Homework": [i % 5 + 1 for i in range(50)],
+        "Classroom": [i % 4 + 1 for i in range(50)],
+    }).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def message_update(update_id, chat_id, **fields):
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "User", "username": f"user{chat_id}"},
+    }
+    message.update(fields)
+    return {"update_id": update_id, "message": message}
+
+
+def callback_update(update_id, chat_id, data):
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": {"id": chat_id, "is_bot": False, "first_name": "User"},
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": message_update(update_id, chat_id, text="menu")["message"],
+        },
+    }
+
+
+def post_updates(url, updates, workers=32):
+    def post(update):
+        request = urllib.request.Request(url, json.dumps(update).encode(), {"Content-Type": "application/json"})
+        urllib.request.urlopen(request).read()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        list(pool.map(post, updates))
+    return time.perf_counter() - started
+
+
+def run(updates_count: int = 1000, files_count: int = 20):
+    fake_server, api = fake_api.start()
+    os.environ["API_URL"] = f"http://127.0.0.1:{fake_server.server_port}"
+    os.environ.setdefault("TOKEN", "0:loadtest")
+    # Telegram rate limits would hide the bot's own throughput
+    os.environ.setdefault("SEND_GLOBAL_RATE", "100000")
+    # State, history and teachers of the test chats go to a temporary directory, not to the bot's data
+    data_dir = tempfile.mkdtemp(prefix="loadtest-")
+    os.environ["STATE_BACKEND"] = "memory"
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["HISTORY_PATH"] = os.path.join(data_dir, "history.sqlite3")
+
+    import main
+    import webhook
+    # Bot reads API_URL when it is created
+    main.create_bot()
+    main.start_workers()
+
+    server = webhook.WebhookServer(("127.0.0.1", 0), webhook.make_handler(main.bot, "/webhook"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/webhook"
+
+    # 1. Menu commands, every tenth update is delivered twice
+    updates = [message_update(i, CHAT_ID_START + i, text="/menu") for i in range(updates_count)]
+    duplicates = updates[::10]
+    post_time = post_updates(url, updates + duplicates)
+    api.wait_for("sendMessage", updates_count)
+    # Give unfiltered duplicates time to show up as extra menus
+    time.sleep(1)
+    handled = api.calls.get("sendMessage", 0)
+    print(f"Menu: {len(updates) + len(duplicates)} updates posted in {post_time:.2f} s "
+          f"({(len(updates) + len(duplicates)) / post_time:.0f} updates/s), menus sent: {handled}, expected: {updates_count}")
+
+    # 2. Documents: choose analysis, then upload a report
+    report = make_report()
+    first_id = updates_count * 2
+    chats = [CHAT_ID_START + i for i in range(files_count)]
+    callbacks = [callback_update(first_id + i, chat_id, "marks_analysis") for i, chat_id in enumerate(chats)]
+    post_updates(url, callbacks)
+    api.wait_for("editMessageText", files_count)
+
+    documents = []
+    for i, chat_id in enumerate(chats):
+        document = api.add_file(f"file{i}", report, "students.xlsx")
+        documents.append(message_update(first_id + files_count + i, chat_id, document=document))
+
+    sent_before = api.calls.get("sendMessage", 0)
+    started = time.perf_counter()
+    post_updates(url, documents)
+    # Status message and the menu after the result for each file
+    done = api.wait_for("sendMessage", sent_before + files_count * 2, timeout=120)
+    total_time = time.perf_counter() - started
+    print(f"Documents: {files_count} files analysed in {total_time:.2f} s ({files_count / total_time:.1f} files/s), completed: {done}")
+
+    server.shutdown()
+    fake_server.shutdown()
+    main.handlers.HISTORY.close()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    run(*(int(arg) for arg in sys.argv[1:3]))
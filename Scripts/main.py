@@ -1,306 +1,291 @@
-import re
-import telebot
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
-import pandas as pd
+import time
+# Startup time is measured from here, before the other imports
+STARTED = time.perf_counter()
 import os
-import xlrd
-import openpyxl
-import json
-import shutil
+import threading
+import telebot
+from telebot import apihelper
 import atexit
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import actions
+import alerts
+import batch
+import config
+import handlers
+import jobs
+import metrics
+import outbox
 import utils
-from dotenv import load_dotenv
-
-load_dotenv("config.env")
-
-# Telebot Fields
-TOKEN = os.getenv("TOKEN")
-bot = telebot.TeleBot(TOKEN)
-
-TEMP_DIR = "temp_files"
-os.makedirs(TEMP_DIR, exist_ok=True)
-
-DATA_DIR = "data"
-os.makedirs(DATA_DIR, exist_ok=True)
-
-USER_STATE = {}
-
-full_result = []
-
-# JSON functions
-def get_teachers():
-    try:
-        with open("data/teachers.json", "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-def save_teacher(username, chat_id=None, full_name=None):
-    try:
-        teachers = get_teachers()
-        if username in teachers:
-            teachers[username]["chat_id"] = chat_id
-        else:
-            teachers[username] = {"chat_id": chat_id, "full_name": full_name}
-        
-        with open("data/teachers.json", "w", encoding="utf-8") as f:
-            json.dump(teachers, f, ensure_ascii=False, indent=4)
-        return True
-    except Exception as e:
-        print(f"Error with teacher save: {e}")
-        return False
+import webhook
+
+# Telebot Fields, the bot is created by create_bot
+bot = None
+
+JOB_QUEUE = None
+ANALYSIS_POOL = None
+# Runs the files of a zip archive or media group in parallel
+BATCH_POOL = None
+# Outgoing messages with rate limits
+OUTBOX = None
+# Set when pandas and openpyxl are loaded in the bot and in the analysis processes, documents wait for it
+ANALYSIS_READY = threading.Event()
+# Taken by the first update after start, never released
+FIRST_UPDATE = threading.Lock()
 
 # Bot Functions
-
-#regionStart Menu
 def send_menu(chat_id):
-    markup = InlineKeyboardMarkup()
-    group_subjects_button = InlineKeyboardButton("Пары группы", callback_data="group_subjects")
-    checked_homeworks_button = InlineKeyboardButton("Проверенные ДЗ", callback_data="checked_homeworks")
-    given_homeworks_button = InlineKeyboardButton("Выданные ДЗ", callback_data="given_homeworks")
-    topic_check_button = InlineKeyboardButton("Тема урока", callback_data="topic_check")
-    low_attendance_button = InlineKeyboardButton("Посещаемость", callback_data="low_attendance")
-    low_homework_percentage_button = InlineKeyboardButton("Выполнение ДЗ", callback_data="low_homework_percentage")
-    marks_analysis_button = InlineKeyboardButton("Анализ успеваемости", callback_data="marks_analysis")
-
-    markup.add(
-        group_subjects_button, 
-        checked_homeworks_button, 
-        given_homeworks_button, 
-        topic_check_button, 
-        low_attendance_button, 
-        low_homework_percentage_button, 
-        marks_analysis_button
-        )
-    
-    message_text = (
-        "Выберите действие:\n\n"
-        "1️⃣ *Пары группы* - количество пар группы по всем дисциплинам за неделю\n"
-        "2️⃣ *Проверенные ДЗ* - проверка % проверенных заданий\n"
-        "3️⃣ *Выданные ДЗ* - проверка % выданных заданий\n"
-        "4️⃣ *Тема урока* - проверка соответствия темы урока шаблону \"Урок № . Тема:\"\n"
-        "5️⃣ *Посещаемость* - анализ посещаемости у преподавателей\n"
-        "6️⃣ *Выполнение ДЗ* - анализ выполнения ДЗ студентами\n"
-        "7️⃣ *Анализ успеваемости* - информация успеваемости студентов"
-    )
-
-    bot.send_message(chat_id, message_text, reply_markup=markup, parse_mode="Markdown")
+    OUTBOX.send_message(chat_id, handlers.MENU_TEXT, reply_markup=handlers.menu_markup(), parse_mode="Markdown")
     #print(chat_id) #Only for get admin chatID
 
-# Admin Commands
-@bot.message_handler(commands=['add_teacher'])
-def add_teacher(message):
-    if message.chat.id != 1129590158:
-        bot.reply_to(message, "Нет доступа к команде")
-        send_menu(message.chat.id)
-        return
-    bot.reply_to(message, "Добавление преподавателя\nНапишите в первой строчке @username, во второй ФИО преподавателя\nОтветьте на это сообщение, чтобы добавить преподавателя")
-@bot.message_handler(func=lambda message: message.reply_to_message and message.reply_to_message.text.startswith("Добавление преподавателя"))
-def handle_teacher_input(message):
-    if message.chat.id != 1129590158:
-        bot.reply_to(message, "Нет доступа к данному действию")
-        send_menu(message.chat.id)
-        return
-    
-    # Split input to 2 rows
-    user_input = message.text.split("\n")
-    if len(user_input) != 2:
-        bot.reply_to(message, "Ошибка: формат данных неправильный\nНапишите в первой строчке @username, во второй ФИО преподавателя")
+def respond(message, steps):
+    """
+    Выполняет шаги ответа, которые вернул обработчик из handlers
+
+    :param message: Сообщение, на которое отвечает бот
+    :param steps: Список шагов ответа
+    """
+    note_update()
+    for step, *args in steps:
+        match step:
+            case "reply":
+                text, markup = args if len(args) == 2 else (args[0], None)
+                OUTBOX.send_message(message.chat.id, text, reply_to=message.message_id, reply_markup=markup)
+            case "edit":
+                text, markup = args
+                OUTBOX.edit_message_text(text, message.chat.id, message.message_id, reply_markup=markup)
+            case "menu":
+                send_menu(message.chat.id)
+            case "broadcast":
+                alerts.broadcast(OUTBOX, *args, lambda summary: OUTBOX.send_message(message.chat.id, summary))
+
+def note_update():
+    """
+    Отмечает первое обновление после запуска: время до него пишется в лог и в метрики
+    """
+    if not FIRST_UPDATE.acquire(blocking=False):
         return
-    
-    username, full_name = user_input
-    username = username.strip()
-    full_name = full_name.strip()
-
-    # Check correct data
-    if not username.startswith("@") or len(username) < 2:
-        bot.reply_to(message, "Ошибка: username должен начинаться с '@' и содержать хотя бы один символ после")
-        return
-    
-    if save_teacher(username, None, full_name):
-        bot.reply_to(
-            message,
-            f"Преподаватель добавлен:\nUsername: {username}\nФИО: {full_name}\nchat_id: None"
-        )
-    else:
-        bot.reply_to(message, "Ошибка: не удалось сохранить преподавателя")
-@bot.message_handler(commands=['show_teachers'])
-def show_teachers(message):
-    if message.chat.id != 1129590158:
-        bot.reply_to(message, "Нет доступа к команде")
-        send_menu(message.chat.id)
-        return
-    
-    teachers = get_teachers()
-    if not teachers:
-        bot.reply_to(message, "Список преподавателей пуст")
-        return
-    
-    result = "Список преподавателей:\n"
-    for username, data in teachers.items():
-        full_name = data.get("full_name", "Неизвестно")
-        result += f"{username} : {full_name}\n"
-    bot.reply_to(message, result)
-
-# Common commands
-@bot.message_handler(commands=['start'])
-def start(message):
-    username = f"@{message.from_user.username}"
-    teachers = get_teachers()
-    if username in teachers:
-        if teachers[username]["chat_id"] == message.chat.id:
-            return
-        
-        save_teacher(username, chat_id=message.chat.id)
-        bot.reply_to(message, "Ваш ID успешно зарегистрирован")
-
-@bot.message_handler(commands=['menu'])
-def menu(message):
-    send_menu(message.chat.id)
-
-# 1. Number of lessons of the group
-@bot.callback_query_handler(func=lambda call:call.data == "group_subjects")
-def request_xlsx_file(call):
-    USER_STATE[call.message.chat.id] = "group_subjects"
-    bot.edit_message_text("Бот подсчитает количество проведенных пар по всем дисциплинам\nПришлите расписание группы в формате .xls или .xlsx", call.message.chat.id, call.message.message_id)
-
-# 2. Checked homeworks
-@bot.callback_query_handler(func=lambda call:call.data == "checked_homeworks")
-def choose_period_checked(call):
-    markup = InlineKeyboardMarkup()
-    month_button = InlineKeyboardButton("Месяц", callback_data="checked_month")
-    week_button = InlineKeyboardButton("Неделя", callback_data="checked_week")
-    markup.row(month_button, week_button)
-    bot.edit_message_text("Выберите период для анализа проверенных ДЗ:", call.message.chat.id, call.message.message_id, reply_markup=markup)
-
-# 3. Given homeworks
-@bot.callback_query_handler(func=lambda call:call.data == "given_homeworks")
-def choose_period_given(call):
-    markup = InlineKeyboardMarkup()
-    month_button = InlineKeyboardButton("Месяц", callback_data="given_month")
-    week_button = InlineKeyboardButton("Неделя", callback_data="given_week")
-    markup.row(month_button, week_button)
-    bot.edit_message_text("Выберите период для анализа выданных ДЗ:", call.message.chat.id, call.message.message_id, reply_markup=markup)
-
-# 2-3. Homeworks file handler
-@bot.callback_query_handler(func=lambda call: call.data in ["checked_month", "checked_week", "given_month", "given_week"])
-def request_homeworks_file(call):
-    USER_STATE[call.message.chat.id] = call.data
-    message_part = "Пришлите отчет по домашним заданиям формате .xls или .xlsx"
-    match call.data:
-        case "checked_month":
-            bot.edit_message_text("Бот подсчитает % проверенных домашних заданий педагогами на группу за месяц\n" + message_part, call.message.chat.id, call.message.message_id)
-        case "checked_week":
-            bot.edit_message_text("Бот подсчитает % проверенных домашних заданий педагогами на группу за неделю\n" + message_part, call.message.chat.id, call.message.message_id)
-        case "given_month":
-            bot.edit_message_text("Бот подсчитает % выданных домашних заданий педагогами за месяц\n" + message_part, call.message.chat.id, call.message.message_id)
-        case "given_week":
-            bot.edit_message_text("Бот подсчитает % выданных домашних заданий педагогами за неделю\n" + message_part, call.message.chat.id, call.message.message_id)
-
-# 4. Lessons topic check
-@bot.callback_query_handler(func=lambda call: call.data == "topic_check")
-def request_topic_file(call):
-    USER_STATE[call.message.chat.id] = "topic_check"
-    bot.edit_message_text("Бот выведет список преподавателей и тем, не соответствующих шаблону \"Урок № . Тема:\"\nПришлите отчет по темам уроков в формате .xls или .xlsx", call.message.chat.id, call.message.message_id)
-
-# 5. Attendance below 65%
-@bot.callback_query_handler(func=lambda call: call.data == "low_attendance")
-def request_attendance_file(call):
-    USER_STATE[call.message.chat.id] = "low_attendance"
-    bot.edit_message_text("Бот выведет список преподавателей, средняя посещаемость которых ниже 65%\nПришлите отчет по посещаемости студентов в формате .xls или .xlsx", call.message.chat.id, call.message.message_id)
-
-# 6. Low Homework Percentage
-@bot.callback_query_handler(func=lambda call: call.data == "low_homework_percentage")
-def request_attendance_file(call):
-    USER_STATE[call.message.chat.id] = "low_homework_percentage"
-    bot.edit_message_text("Бот выведет список студентов, процент выполнения ДЗ которых ниже 50%\nПришлите отчет по студентам в формате .xls или .xlsx", call.message.chat.id, call.message.message_id)
-
-# 7. Marks analysis
-@bot.callback_query_handler(func=lambda call: call.data == "marks_analysis")
-def request_attendance_file(call):
-    USER_STATE[call.message.chat.id] = "marks_analysis"
-    bot.edit_message_text("Бот выведет список студентов, средняя оценка которых ниже 3\nПришлите отчет по студентам в формате .xls или .xlsx", call.message.chat.id, call.message.message_id)
+    elapsed = time.perf_counter() - STARTED
+    metrics.observe("stage_seconds", elapsed, stage="first_update")
+    print(f"First update {elapsed:.2f} s after start")
 
 # Download handler .xlsx files
-@bot.message_handler(content_types=['document'])
 def handle_document(message):
-    chat_id = message.chat.id
-    user_state = USER_STATE.get(chat_id)
-    
-    if user_state not in [
-            "group_subjects", # 1. Number of lessons of the group
-            "checked_month", # 2.1. Checked homeworks (month)
-            "checked_week", # 2.2 Checked homeworks (week)
-            "given_month", # 3.1 Given homeworks (month)
-            "given_week", # 3.2 Given homeworks (week)
-            "topic_check", # 4. Lessons topic check
-            "low_attendance", # 5. Attendance below 65%
-            "low_homework_percentage", # 6. Low Homework Percentage
-            "marks_analysis" # 7. Marks analysis
-            ]:
-        bot.reply_to(message, "Пожалуйста, выберите действие из меню")
-        send_menu(chat_id)
+    note_update()
+    user_state, steps = handlers.check_document(message)
+    if steps:
+        respond(message, steps)
+        return
+
+    # Files of a media group arrive as separate messages and are queued together
+    if message.media_group_id:
+        MEDIA_GROUPS.add(message)
         return
+    submit_job(message, user_state, [message.document])
 
-    file_name = message.document.file_name
-    _, file_extension = os.path.splitext(file_name)
-    file_extension = file_extension.lower()
+def submit_media_group(messages):
+    user_state = handlers.get_user_state(messages[0].chat.id)
+    submit_job(messages[0], user_state, [message.document for message in messages])
 
-    # Catch incorrect file type
-    if file_extension == '.xls':
-        file_path = utils.download_and_convert_xls(bot, message.document.file_id, TEMP_DIR, file_name)
-    elif file_extension == '.xlsx':
-        file_info = bot.get_file(message.document.file_id)
-        downloaded_file = bot.download_file(file_info.file_path)
-        file_path = os.path.join(TEMP_DIR, file_name)
+MEDIA_GROUPS = batch.MediaGroupCollector(submit_media_group, config.MEDIA_GROUP_DELAY)
 
-        with open(file_path, "wb") as new_file:
-            new_file.write(downloaded_file)
-    else:
-        bot.reply_to(message, "Пожалуйста, отправьте файл в формате .xls или .xlsx")
-        send_menu(chat_id)
+def submit_job(message, user_state, documents):
+    chat_id = message.chat.id
+
+    # Files are downloaded by the worker, so the queue holds only file ids
+    submitted = time.perf_counter()
+    status_message = OUTBOX.send_message(chat_id, "Файл принят, ожидает обработки", reply_to=message.message_id, coalesce=False).result()
+    # Worker waits until the position is sent to the outbox, otherwise it could overwrite the result
+    queued = threading.Event()
+    try:
+        position = JOB_QUEUE.submit(chat_id, (message, user_state, status_message, documents, queued, submitted))
+    except jobs.QueueFullError as e:
+        OUTBOX.edit_message_text(f"{e}, попробуйте позже", chat_id, status_message.message_id)
         return
+    OUTBOX.edit_message_text(f"Файл в очереди, позиция {position}", chat_id, status_message.message_id)
+    queued.set()
+
+# Document job worker
+def run_in_pool(func, *args):
+    """
+    Выполняет func в пуле процессов, если он включен, иначе в текущем потоке
+
+    Измерения времени из дочернего процесса добавляются в metrics.REGISTRY
+    """
+    if not ANALYSIS_POOL:
+        return func(*args)
+    result, observations = ANALYSIS_POOL.submit(metrics.collect, func, *args).result()
+    metrics.REGISTRY.merge(observations)
+    return result
+
+def download(document, job_spool):
+    """
+    Скачивает документ по частям: небольшой файл в память, большой - в каталог задания
+
+    :return: Содержимое файла или путь к нему
+    """
+    with metrics.timer("download"):
+        return utils.download_file(
+            bot, document.file_id, config.DOWNLOAD_MAX_MB * 1024 * 1024,
+            job_spool, config.DOWNLOAD_MEMORY_MB * 1024 * 1024, document.file_name,
+        )
 
+def load_report(document, action, job_spool):
+    """
+    Возвращает разобранный отчет из кэша или скачивает, проверяет заголовок и разбирает его
+
+    :param document: Документ из сообщения Telegram
+    :param action: Действие из меню или None, если тип отчета определяется по файлу
+    :param job_spool: spool.JobSpool задания для больших файлов
+    :return: Действия для отчета и DataFrame отчета
+    """
+    if action:
+        df = handlers.REPORT_CACHE.get(handlers.report_key(document, actions.report_type(action)))
+        if df is not None:
+            return [action], df
+
+    file_data = download(document, job_spool)
+    # Wrong reports are rejected by the first rows, before the full parse
+    report, report_actions = actions.check_report(file_data, action)
+    if actions.is_streamed(file_data, report):
+        # Large student report: the analyses read it in chunks, there is no DataFrame to cache
+        return report_actions, file_data
+    key = handlers.report_key(document, report)
+    df = handlers.REPORT_CACHE.get(key)
+    if df is None:
+        # File stays in memory, only the columns of this report type are read
+        df = run_in_pool(actions.load_report, file_data, report)
+        handlers.REPORT_CACHE.put(key, df)
+    return report_actions, df
+
+def analyze_batch(user_state, documents, chat_id, job_spool):
+    """
+    Анализирует все отчеты пакетной загрузки параллельно и сохраняет результаты в историю
+
+    :return: Общий отчет по файлам в порядке отправки
+    """
+    contents = [download(document, job_spool) for document in documents]
+    files = handlers.batch_files(documents, contents, job_spool)
+    branch = handlers.chat_branch(chat_id)
+    futures = [
+        BATCH_POOL.submit(
+            metrics.collect, actions.analyze_report, data, user_state, branch,
+            handlers.history_writer(batch.content_id(data), chat_id),
+        )
+        for _, data in files
+    ]
+    results = []
+    for (file_name, data), future in zip(files, futures):
+        (result, records), observations = future.result()
+        metrics.REGISTRY.merge(observations)
+        handlers.save_history(records, batch.content_id(data), chat_id)
+        results.append((file_name, result))
+    return batch.combine_results(results)
+
+def process_document(job):
+    message, user_state, status_message, documents, queued, submitted = job
+    chat_id = message.chat.id
+    queued.wait()
+    ANALYSIS_READY.wait()
+    metrics.observe("stage_seconds", time.perf_counter() - submitted, stage="queue")
+
+    # Large files of the job are spooled to its own directory, removed when the job ends
+    job_spool = handlers.SPOOL.job()
     try:
-        match user_state:
-            case "group_subjects":
-                result = actions.analyze_group_subjects(file_path)
-            case "checked_month":
-                  result = actions.analyze_checked_homeworks(file_path, "month")
-            case "checked_week":
-                  result = actions.analyze_checked_homeworks(file_path, "week")
-            case "given_month":
-                  result = actions.analyze_given_homeworks(file_path, "month")
-            case "given_week":
-                  result = actions.analyze_given_homeworks(file_path, "week")
-            case "topic_check":
-                result = actions.analyze_lessons_topic(file_path)
-            case "low_attendance":
-                result = actions.analyze_low_attendance(file_path)
-            case "low_homework_percentage":
-                result = actions.analyze_low_homework_percentage(file_path)
-            case "marks_analysis":
-                result = actions.analyze_bad_marks(file_path)
-            case _:
-                result = "Неизвестное действие. Попробуйте снова"
-
-        if len(result) >= 4096:
-            messages = utils.split_message(result)
-            for msg in messages:
-                bot.reply_to(message, msg)
+        OUTBOX.edit_message_text("Файл обрабатывается...", chat_id, status_message.message_id)
+        alert_steps = []
+        if not handlers.is_single_report(documents):
+            result = analyze_batch(user_state, documents, chat_id, job_spool)
         else:
-            bot.reply_to(message, result)
-
-        send_menu(chat_id)
+            report_actions, df = load_report(documents[0], user_state, job_spool)
+            result, records = run_in_pool(
+                actions.analyze_with_records, report_actions, df, handlers.chat_branch(chat_id),
+                handlers.history_writer(documents[0].file_unique_id, chat_id),
+            )
+            handlers.save_history(records, documents[0].file_unique_id, chat_id)
+            alert_steps = handlers.prepare_alerts(chat_id, report_actions, df)
+
+        messages, document = handlers.result_delivery(result)
+        OUTBOX.edit_message_text(messages[0], chat_id, status_message.message_id)
+        for msg in messages[1:]:
+            OUTBOX.send_message(chat_id, msg, reply_to=message.message_id)
+        if document:
+            OUTBOX.send_document(chat_id, *document, reply_to=message.message_id)
+        respond(message, alert_steps)
+        metrics.observe("stage_seconds", time.perf_counter() - submitted, stage="total")
     except Exception as e:
-        bot.reply_to(message, f"Ошибка: {e}")
-        send_menu(chat_id)
+        OUTBOX.edit_message_text(f"Ошибка: {e}", chat_id, status_message.message_id)
     finally:
-        # Clear temp files
-        if os.path.exists(file_path):
-            os.remove(file_path) 
+        job_spool.close()
+    send_menu(chat_id)
+
+def create_bot():
+    """
+    Создает бота и регистрирует обработчики
+
+    :return: Бот
+    """
+    global bot
+    handlers.init()
+    if config.api_urls():
+        apihelper.API_URL, apihelper.FILE_URL = config.api_urls()
+    bot = telebot.TeleBot(config.TOKEN)
+
+    for filters, handler in handlers.MESSAGE_HANDLERS:
+        bot.register_message_handler(lambda message, handler=handler: respond(message, handler(message)), **filters)
+    for func, handler in handlers.CALLBACK_HANDLERS:
+        bot.register_callback_query_handler(lambda call, handler=handler: respond(call.message, handler(call)), func=func)
+    bot.register_message_handler(handle_document, content_types=['document'])
+    return bot
+
+def prewarm():
+    """
+    Загружает pandas и openpyxl, пока бот уже отвечает на команды меню, и запускает процессы пула анализа
+    """
+    started = time.perf_counter()
+    try:
+        # Processes are forked after the libraries are loaded here, so they start with them
+        actions.prewarm()
+        if ANALYSIS_POOL:
+            for future in [ANALYSIS_POOL.submit(actions.prewarm) for _ in range(config.JOB_WORKERS)]:
+                future.result()
+        print(f"Analysis libraries loaded in {time.perf_counter() - started:.2f} s")
+    except Exception as e:
+        # Documents are not blocked, their analysis reports the error
+        print(f"Error in analysis warm-up: {e}")
+    finally:
+        ANALYSIS_READY.set()
 
-atexit.register(utils.clean_temp_folder)
+def start_workers():
+    global JOB_QUEUE, ANALYSIS_POOL, BATCH_POOL, OUTBOX
+    OUTBOX = outbox.Outbox(
+        lambda method, kwargs: getattr(bot, method)(**kwargs),
+        config.SEND_CHAT_RATE, config.SEND_CHAT_BURST, config.SEND_GLOBAL_RATE, config.SEND_BULK_RATE,
+    )
+    if config.ANALYSIS_EXECUTOR == "process":
+        ANALYSIS_POOL = ProcessPoolExecutor(max_workers=config.JOB_WORKERS)
+    BATCH_POOL = ANALYSIS_POOL or ThreadPoolExecutor(max_workers=config.JOB_WORKERS)
+    handlers.SPOOL.start_janitor(config.SPOOL_CLEAN_INTERVAL)
+    JOB_QUEUE = jobs.JobQueue(process_document, config.JOB_WORKERS, config.JOB_QUEUE_SIZE, config.JOB_QUEUE_PER_CHAT)
+    threading.Thread(target=prewarm, name="prewarm", daemon=True).start()
+
+def main():
+    os.makedirs(config.TEMP_DIR, exist_ok=True)
+    os.makedirs(config.DATA_DIR, exist_ok=True)
+    create_bot()
+    start_workers()
+    # Only the job directories of this process, other processes may share TEMP_DIR
+    atexit.register(handlers.SPOOL.close)
+    atexit.register(handlers.TEACHERS.flush)
+    if config.METRICS_PORT:
+        metrics.serve(config.METRICS_HOST, config.METRICS_PORT)
+
+    elapsed = time.perf_counter() - STARTED
+    metrics.observe("stage_seconds", elapsed, stage="startup")
+    print(f"Bot started in {elapsed:.2f} s...")
+    if config.BOT_MODE == "webhook":
+        webhook.serve(bot, config.WEBHOOK_HOST, config.WEBHOOK_PORT, config.WEBHOOK_PATH, config.WEBHOOK_URL, config.WEBHOOK_SECRET)
+    else:
+        bot.polling(none_stop=True)
 
-print("Bot started...")
-bot.polling(none_stop=True)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+import time
+# Startup time is measured from here, before the other imports
+STARTED = time.perf_counter()
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+import actions
+import alerts
+import batch
+import config
+import handlers
+import metrics
+import outbox
+import spool
+import utils
+
+# Telebot Fields, the bot is created by create_bot
+bot = None
+
+# Analyses run in executor, the semaphore limits how many files are processed at once
+ANALYSIS_POOL = None
+ANALYSIS_SLOTS = None
+# media_group_id -> messages received so far
+MEDIA_GROUPS = {}
+# Outgoing messages with rate limits, sent from a thread through the event loop
+OUTBOX = None
+# Set when pandas and openpyxl are loaded in the bot and in the analysis executor, documents wait for it
+ANALYSIS_READY = None
+# Time of the first update after start is reported once
+FIRST_UPDATE_SEEN = False
+
+# Bot Functions
+def send_menu(chat_id):
+    OUTBOX.send_message(chat_id, handlers.MENU_TEXT, reply_markup=handlers.menu_markup(), parse_mode="Markdown")
+
+def respond(message, steps):
+    """
+    Выполняет шаги ответа, которые вернул обработчик из handlers
+
+    :param message: Сообщение, на которое отвечает бот
+    :param steps: Список шагов ответа
+    """
+    note_update()
+    for step, *args in steps:
+        match step:
+            case "reply":
+                text, markup = args if len(args) == 2 else (args[0], None)
+                OUTBOX.send_message(message.chat.id, text, reply_to=message.message_id, reply_markup=markup)
+            case "edit":
+                text, markup = args
+                OUTBOX.edit_message_text(text, message.chat.id, message.message_id, reply_markup=markup)
+            case "menu":
+                send_menu(message.chat.id)
+            case "broadcast":
+                alerts.broadcast(OUTBOX, *args, lambda summary: OUTBOX.send_message(message.chat.id, summary))
+
+def note_update():
+    """
+    Отмечает первое обновление после запуска: время до него пишется в лог и в метрики
+    """
+    global FIRST_UPDATE_SEEN
+    if FIRST_UPDATE_SEEN:
+        return
+    FIRST_UPDATE_SEEN = True
+    elapsed = time.perf_counter() - STARTED
+    metrics.observe("stage_seconds", elapsed, stage="first_update")
+    print(f"First update {elapsed:.2f} s after start")
+
+# Download handler .xlsx files
+async def handle_document(message):
+    note_update()
+    # The state store may be SQLite or HTTP, it is read outside the event loop
+    user_state, steps = await run_blocking(handlers.check_document, message)
+    if steps:
+        respond(message, steps)
+        return
+
+    messages = [message]
+    if message.media_group_id:
+        messages = await collect_media_group(message)
+        if not messages:
+            return
+    message = messages[0]
+    documents = [group_message.document for group_message in messages]
+    chat_id = message.chat.id
+
+    submitted = time.perf_counter()
+    status_message = await asyncio.wrap_future(
+        OUTBOX.send_message(chat_id, "Файл принят, ожидает обработки", reply_to=message.message_id, coalesce=False)
+    )
+    # Large files of the job are spooled to its own directory, removed when the job ends
+    job_spool = handlers.SPOOL.job()
+    try:
+        async with ANALYSIS_SLOTS:
+            await ANALYSIS_READY.wait()
+            metrics.observe("stage_seconds", time.perf_counter() - submitted, stage="queue")
+            OUTBOX.edit_message_text("Файл обрабатывается...", chat_id, status_message.message_id)
+            alert_steps = []
+            if handlers.is_single_report(documents):
+                report_actions, df = await load_report(documents[0], user_state, job_spool)
+                result, records = await run_in_pool(
+                    actions.analyze_with_records, report_actions, df, handlers.chat_branch(chat_id),
+                    handlers.history_writer(documents[0].file_unique_id, chat_id),
+                )
+                await run_blocking(handlers.save_history, records, documents[0].file_unique_id, chat_id)
+                alert_steps = await run_blocking(handlers.prepare_alerts, chat_id, report_actions, df)
+            else:
+                result = await analyze_batch(user_state, documents, chat_id, job_spool)
+
+        messages, document = handlers.result_delivery(result)
+        OUTBOX.edit_message_text(messages[0], chat_id, status_message.message_id)
+        for msg in messages[1:]:
+            OUTBOX.send_message(chat_id, msg, reply_to=message.message_id)
+        if document:
+            OUTBOX.send_document(chat_id, *document, reply_to=message.message_id)
+        respond(message, alert_steps)
+        metrics.observe("stage_seconds", time.perf_counter() - submitted, stage="total")
+    except Exception as e:
+        OUTBOX.edit_message_text(f"Ошибка: {e}", chat_id, status_message.message_id)
+    finally:
+        job_spool.close()
+    send_menu(chat_id)
+
+async def collect_media_group(message):
+    """
+    Ждет остальные файлы медиагруппы
+
+    :return: Сообщения группы для обработчика последнего файла, пустой список для остальных
+    """
+    messages = MEDIA_GROUPS.setdefault(message.media_group_id, [])
+    messages.append(message)
+    count = len(messages)
+    await asyncio.sleep(config.MEDIA_GROUP_DELAY)
+    if len(messages) != count:
+        # A later file arrived, its handler takes the group
+        return []
+    del MEDIA_GROUPS[message.media_group_id]
+    return sorted(messages, key=lambda group_message: group_message.message_id)
+
+async def download(document, job_spool):
+    """
+    Скачивает документ по частям: небольшой файл в память, большой - в каталог задания
+
+    :return: Содержимое файла или путь к нему
+    """
+    max_bytes = config.DOWNLOAD_MAX_MB * 1024 * 1024
+    with metrics.timer("download"):
+        file_info = await bot.get_file(document.file_id)
+        if file_info.file_size and file_info.file_size > max_bytes:
+            raise ValueError(f"файл больше {config.DOWNLOAD_MAX_MB} МБ")
+
+        buffer = spool.DownloadBuffer(max_bytes, job_spool, config.DOWNLOAD_MEMORY_MB * 1024 * 1024, document.file_name)
+        session = await asyncio_helper.session_manager.get_session()
+        url = utils.file_url(asyncio_helper.FILE_URL, bot.token, file_info.file_path)
+        try:
+            async with session.get(url, proxy=asyncio_helper.proxy) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(spool.CHUNK_SIZE):
+                    buffer.write(chunk)
+        finally:
+            buffer.close()
+        return buffer.result()
+
+async def analyze_batch(user_state, documents, chat_id, job_spool):
+    """
+    Скачивает и анализирует все отчеты пакетной загрузки параллельно и сохраняет результаты в историю
+
+    :return: Общий отчет по файлам в порядке отправки
+    """
+    contents = await asyncio.gather(*(download(document, job_spool) for document in documents))
+    files = await run_blocking(handlers.batch_files, documents, contents, job_spool)
+    branch = handlers.chat_branch(chat_id)
+    analyses = await asyncio.gather(*(
+        run_in_pool(actions.analyze_report, data, user_state, branch, handlers.history_writer(batch.content_id(data), chat_id))
+        for _, data in files
+    ))
+    results = []
+    for (file_name, data), (result, records) in zip(files, analyses):
+        await run_blocking(handlers.save_history, records, batch.content_id(data), chat_id)
+        results.append((file_name, result))
+    return batch.combine_results(results)
+
+async def run_in_pool(func, *args):
+    """
+    Выполняет func в executor, измерения времени из потока или процесса executor добавляются в metrics.REGISTRY
+    """
+    result, observations = await asyncio.get_running_loop().run_in_executor(ANALYSIS_POOL, metrics.collect, func, *args)
+    metrics.REGISTRY.merge(observations)
+    return result
+
+async def run_blocking(func, *args):
+    """
+    Выполняет func в потоке по умолчанию: обращения к хранилищам, кэшу и архивам не блокируют цикл событий
+
+    Состояние handlers не передается в процессы, поэтому ANALYSIS_POOL здесь не используется
+    """
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+async def load_report(document, action, job_spool):
+    """
+    Возвращает разобранный отчет из кэша или скачивает, проверяет заголовок и разбирает его в executor
+
+    :param document: Документ из сообщения Telegram
+    :param action: Действие из меню или None, если тип отчета определяется по файлу
+    :param job_spool: spool.JobSpool задания для больших файлов
+    :return: Действия для отчета и DataFrame отчета
+    """
+    if action:
+        df = handlers.REPORT_CACHE.get(handlers.report_key(document, actions.report_type(action)))
+        if df is not None:
+            return [action], df
+
+    file_data = await download(document, job_spool)
+    # Wrong reports are rejected by the first rows, before the full parse
+    report, report_actions = await run_in_pool(actions.check_report, file_data, action)
+    if actions.is_streamed(file_data, report):
+        # Large student report: the analyses read it in chunks, there is no DataFrame to cache
+        return report_actions, file_data
+    key = handlers.report_key(document, report)
+    df = handlers.REPORT_CACHE.get(key)
+    if df is None:
+        df = await run_in_pool(actions.load_report, file_data, report)
+        await run_blocking(handlers.REPORT_CACHE.put, key, df)
+    return report_actions, df
+
+def create_bot():
+    """
+    Создает бота и регистрирует обработчики
+
+    :return: Бот
+    """
+    global bot
+    handlers.init()
+    if config.api_urls():
+        asyncio_helper.API_URL, asyncio_helper.FILE_URL = config.api_urls()
+    bot = AsyncTeleBot(config.TOKEN)
+
+    for filters, handler in handlers.MESSAGE_HANDLERS:
+        async def run_message_handler(message, handler=handler):
+            respond(message, handler(message))
+        bot.register_message_handler(run_message_handler, **filters)
+    for func, handler in handlers.CALLBACK_HANDLERS:
+        async def run_callback_handler(call, handler=handler):
+            respond(call.message, handler(call))
+        bot.register_callback_query_handler(run_callback_handler, func=func)
+    bot.register_message_handler(handle_document, content_types=['document'])
+    return bot
+
+async def prewarm():
+    """
+    Загружает pandas и openpyxl, пока бот уже отвечает на команды меню, и запускает процессы executor
+    """
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    try:
+        # Processes are forked after the libraries are loaded here, so they start with them
+        await loop.run_in_executor(None, actions.prewarm)
+        if isinstance(ANALYSIS_POOL, ProcessPoolExecutor):
+            await asyncio.gather(*(loop.run_in_executor(ANALYSIS_POOL, actions.prewarm) for _ in range(config.JOB_WORKERS)))
+        print(f"Analysis libraries loaded in {time.perf_counter() - started:.2f} s")
+    except Exception as e:
+        # Documents are not blocked, their analysis reports the error
+        print(f"Error in analysis warm-up: {e}")
+    finally:
+        ANALYSIS_READY.set()
+
+async def main():
+    global ANALYSIS_POOL, ANALYSIS_SLOTS, ANALYSIS_READY, OUTBOX
+    os.makedirs(config.DATA_DIR, exist_ok=True)
+    create_bot()
+    if config.ANALYSIS_EXECUTOR == "process":
+        ANALYSIS_POOL = ProcessPoolExecutor(max_workers=config.JOB_WORKERS)
+    else:
+        ANALYSIS_POOL = ThreadPoolExecutor(max_workers=config.JOB_WORKERS)
+    ANALYSIS_SLOTS = asyncio.Semaphore(config.JOB_WORKERS)
+    ANALYSIS_READY = asyncio.Event()
+    # The reference keeps the task alive until it is done
+    warm_up = asyncio.create_task(prewarm())
+    handlers.SPOOL.start_janitor(config.SPOOL_CLEAN_INTERVAL)
+    loop = asyncio.get_running_loop()
+    OUTBOX = outbox.Outbox(
+        lambda method, kwargs: asyncio.run_coroutine_threadsafe(getattr(bot, method)(**kwargs), loop).result(),
+        config.SEND_CHAT_RATE, config.SEND_CHAT_BURST, config.SEND_GLOBAL_RATE, config.SEND_BULK_RATE,
+    )
+
+    if config.METRICS_PORT:
+        metrics.serve(config.METRICS_HOST, config.METRICS_PORT)
+
+    elapsed = time.perf_counter() - STARTED
+    metrics.observe("stage_seconds", elapsed, stage="startup")
+    print(f"Bot started in {elapsed:.2f} s...")
+    try:
+        await bot.infinity_polling()
+    finally:
+        ANALYSIS_POOL.shutdown(wait=False)
+        handlers.SPOOL.close()
+        handlers.TEACHERS.flush()
+        await bot.close_session()
+
+if __name__ == "__main__":
+    asyncio.run(main())
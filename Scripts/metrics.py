@@ -0,0 +1,217 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _series(start: float, stop: float) -> list:
+    """
+    :return: Границы корзин 1-2-5 от start до stop
+    """
+    bounds = []
+    value = start
+    while value <= stop:
+        bounds.extend(round(value * step, 6) for step in (1, 2, 5))
+        value = round(value * 10, 6)
+    return [bound for bound in bounds if bound <= stop]
+
+
+# Upper bounds of the histogram buckets for each measurement
+BOUNDS = {
+    "stage_seconds": _series(0.001, 100),
+    "file_bytes": _series(1000, 100_000_000),
+    "report_rows": _series(10, 1_000_000),
+}
+HELP = {
+    "stage_seconds": "Duration of document processing stages",
+    "file_bytes": "Size of analysed report files",
+    "report_rows": "Rows in analysed reports",
+}
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """
+    Распределение значений по корзинам, квантили оцениваются интерполяцией внутри корзины
+    """
+
+    def __init__(self, bounds: list):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """
+        :param q: Доля от 0 до 1, 0.95 - 95-й перцентиль
+        :return: Оценка квантиля или None, если значений нет
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = self.bounds[index - 1] if index else 0
+                upper = self.bounds[index] if index < len(self.bounds) else self.max
+                value = lower + (upper - lower) * (rank - cumulative) / count
+                return min(max(value, self.min), self.max)
+            cumulative += count
+        return self.max
+
+
+class Registry:
+    """
+    Гистограммы времени этапов обработки, размера файлов и количества строк в отчетах
+
+    Каждое измерение хранится отдельно для своего набора меток, например этапа и действия
+    """
+
+    def __init__(self):
+        self._histograms = {}  # (name, ((label, value), ...)) -> Histogram
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def observe(self, name: str, value: float, **labels):
+        """
+        :param name: Измерение из BOUNDS
+        :param value: Значение
+        :param labels: Метки измерения, например stage="parse", report="attendance"
+        """
+        key = (name, tuple(sorted(labels.items())))
+        captured = getattr(self._local, "captured", None)
+        if captured is not None:
+            captured.append((key, value))
+            return
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(BOUNDS[name])
+            histogram.observe(value)
+
+    def merge(self, observations: list):
+        """
+        Добавляет измерения, собранные collect
+        """
+        for (name, labels), value in observations:
+            self.observe(name, value, **dict(labels))
+
+    @contextmanager
+    def capture(self):
+        """
+        Собирает измерения текущего потока в список вместо гистограмм
+        """
+        previous = getattr(self._local, "captured", None)
+        self._local.captured = []
+        try:
+            yield self._local.captured
+        finally:
+            self._local.captured = previous
+
+    def summary(self) -> list:
+        """
+        :return: Список (измерение, метки, количество, [p50, p95, p99]), отсортированный по измерению и меткам
+        """
+        with self._lock:
+            return [
+                (name, dict(labels), histogram.count, [histogram.quantile(q) for q in QUANTILES])
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+
+    def prometheus(self, prefix: str = "bot") -> str:
+        """
+        :return: Гистограммы в текстовом формате Prometheus
+        """
+        lines = []
+        with self._lock:
+            for name in BOUNDS:
+                items = sorted((labels, histogram) for (key, labels), histogram in self._histograms.items() if key == name)
+                if not items:
+                    continue
+                metric = f"{prefix}_{name}"
+                lines.append(f"# HELP {metric} {HELP[name]}")
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, histogram in items:
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds + ["+Inf"], histogram.counts):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{metric}_sum{_labels(labels)} {histogram.sum}")
+                    lines.append(f"{metric}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+REGISTRY = Registry()
+
+
+def observe(name: str, value: float, **labels):
+    REGISTRY.observe(name, value, **labels)
+
+
+@contextmanager
+def timer(stage: str, **labels):
+    """
+    Измеряет время блока как этап stage, в том числе если блок завершился ошибкой
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe("stage_seconds", time.perf_counter() - started, stage=stage, **labels)
+
+
+def collect(func, *args):
+    """
+    Вызывает func и возвращает ее результат вместе с измерениями, сделанными во время вызова
+
+    Для вызовов в пуле: измерения из потока или дочернего процесса добавляются в основной
+    процесс через REGISTRY.merge
+    """
+    with REGISTRY.capture() as observations:
+        result = func(*args)
+    return result, observations
+
+
+def serve(host: str, port: int, registry: Registry = REGISTRY):
+    """
+    Запускает в фоновом потоке HTTP сервер, который отдает гистограммы в формате Prometheus по пути /metrics
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            body = registry.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,203 @@
+"""
+Анализ архива отчетов без Telegram: те же проверка заголовка, разбор и анализы, что и в боте,
+файлы обрабатываются параллельно в процессах на всех ядрах
+
+Запуск: python offline.py ПУТЬ [ПУТЬ ...] [--action ДЕЙСТВИЕ] [--branch ФИЛИАЛ] [--output КАТАЛОГ] [--workers N]
+        [--format json csv]
+    ПУТЬ - каталог (отчеты ищутся и во вложенных каталогах), шаблон вроде "reports/**/*.xlsx" или файл,
+    архивы .zip распаковываются, как при пакетной загрузке в боте
+    --action - действие из меню, например low_attendance, без него тип отчета определяется по файлу
+        и выполняются все подходящие анализы
+    --branch - филиал, правила проверок которого применяются (см. /rules в боте), без него - общие правила
+
+В каталог результатов записываются:
+    results.json - результат по каждому файлу: тип отчета, анализы, текст ответа бота, значения, ошибка
+    results.csv - значения всех файлов: файл, тип отчета, метрика, период, имя, значение
+    summary.json, summary.csv - сводка по всем файлам: для каждой метрики и имени количество файлов,
+        среднее, минимум, максимум и последнее значение
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import actions
+import batch
+
+RECORD_FIELDS = ["report", "metric", "period", "name", "value"]
+SUMMARY_FIELDS = ["report", "metric", "period", "name", "files", "mean", "min", "max", "last"]
+# Archives are unpacked in memory, limits only guard against zip bombs
+ARCHIVE_MAX_FILES = 10000
+ARCHIVE_MAX_BYTES = 4 * 1024 * 1024 * 1024
+
+
+def find_reports(paths: list) -> list:
+    """
+    :param paths: Каталоги, шаблоны glob или файлы
+    :return: Пути к отчетам .xls/.xlsx и архивам .zip без повторов, в порядке сортировки
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = [
+                os.path.join(directory, name) for directory, _, names in os.walk(path) for name in names
+            ]
+        elif glob.has_magic(path):
+            candidates = glob.glob(path, recursive=True)
+        else:
+            candidates = [path]
+        found.extend(
+            candidate for candidate in candidates
+            if (batch.is_report(candidate) or batch.is_archive(candidate))
+            and not os.path.basename(candidate).startswith("~$") and os.path.isfile(candidate)
+        )
+    return sorted(set(found))
+
+
+def _entry(name: str, error: str = None) -> dict:
+    return {"file": name, "report": None, "actions": [], "result": "", "records": [], "error": error, "seconds": 0}
+
+
+def analyze_source(name: str, source, action: str = None, branch: str = None) -> dict:
+    """
+    Анализирует один отчет так же, как бот анализирует присланный файл
+
+    :param name: Имя отчета для результата
+    :param source: Путь к файлу или его содержимое
+    :param action: Действие из меню или None, если тип отчета определяется по файлу
+    :param branch: Филиал, правила которого применяются, None - общие правила
+    :return: Результат: file, report, actions, result, records, error, seconds
+    """
+    started = time.perf_counter()
+    entry = _entry(name)
+    try:
+        report, report_actions = actions.check_report(source, action)
+        # Large student reports are analysed in chunks, as in the bot
+        df = source if actions.is_streamed(source, report) else actions.load_report(source, report)
+        result, records = actions.analyze_with_records(report_actions, df, branch)
+        entry.update(report=report, actions=report_actions, result=result)
+        entry["records"] = [dict(zip(RECORD_FIELDS, record)) for record in records]
+    except Exception as e:
+        entry["error"] = str(e)
+    entry["seconds"] = round(time.perf_counter() - started, 3)
+    return entry
+
+
+def analyze_path(path: str, action: str = None, branch: str = None) -> list:
+    """
+    Выполняется в процессе пула: анализирует файл или все отчеты архива
+
+    :return: Список результатов analyze_source, для архива - по отчету на каждый файл в нем
+    """
+    if not batch.is_archive(path):
+        return [analyze_source(path, path, action, branch)]
+    try:
+        files = batch.extract_reports(path, ARCHIVE_MAX_FILES, ARCHIVE_MAX_BYTES)
+    except Exception as e:
+        return [_entry(path, error=str(e))]
+    return [analyze_source(f"{path}/{file_name}", data, action, branch) for file_name, data in files]
+
+
+def summarize(entries: list) -> list:
+    """
+    Сводит значения всех файлов по метрике и имени
+
+    :param entries: Результаты analyze_source в порядке файлов, последнее значение берется из последнего файла
+    :return: Строки сводки с полями SUMMARY_FIELDS, отсортированные по типу отчета, метрике, периоду и имени
+    """
+    values = {}  # (report, metric, period, name) -> [value, ...]
+    for entry in entries:
+        for record in entry["records"]:
+            key = tuple(record[field] for field in RECORD_FIELDS[:-1])
+            values.setdefault(key, []).append(record["value"])
+    return [
+        dict(zip(SUMMARY_FIELDS, key + (
+            len(items), round(sum(items) / len(items), 4), min(items), max(items), items[-1],
+        )))
+        for key, items in sorted(values.items())
+    ]
+
+
+def write_json(path: str, value):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False, indent=2)
+
+
+def write_csv(path: str, fields: list, rows: list):
+    # BOM and semicolons for Excel, as in the result file the bot sends
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fields, delimiter=";")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run(paths: list, action: str = None, workers: int = None, progress=sys.stderr, branch: str = None) -> list:
+    """
+    Анализирует отчеты в пуле процессов и печатает ход обработки
+
+    :param paths: Пути из find_reports
+    :param action: Действие из меню или None
+    :param workers: Количество процессов, None - по числу ядер
+    :param progress: Поток для вывода хода обработки или None
+    :param branch: Филиал, правила которого применяются, None - общие правила
+    :return: Результаты analyze_source в порядке путей
+    """
+    started = time.perf_counter()
+    results = [None] * len(paths)
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(analyze_path, path, action, branch): index for index, path in enumerate(paths)}
+        for done, future in enumerate(as_completed(futures), 1):
+            index = futures[future]
+            results[index] = future.result()
+            if progress is not None:
+                errors = [entry["error"] for entry in results[index] if entry["error"]]
+                status = f"ошибка: {errors[0]}" if errors else "готово"
+                print(f"[{done}/{len(paths)}] {paths[index]}: {status}", file=progress, flush=True)
+
+    entries = [entry for result in results for entry in result]
+    if progress is not None:
+        failed = sum(1 for entry in entries if entry["error"])
+        print(
+            f"Отчетов: {len(entries)}, с ошибкой: {failed}, время: {time.perf_counter() - started:.1f} с",
+            file=progress, flush=True,
+        )
+    return entries
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Анализ архива отчетов без Telegram")
+    parser.add_argument("paths", nargs="+", help="каталоги, шаблоны или файлы .xls, .xlsx, .zip")
+    parser.add_argument("--action", choices=list(actions.ANALYSES), default=None,
+                        help="действие из меню, без него тип отчета определяется по файлу")
+    parser.add_argument("--branch", default=None, help="филиал, правила проверок которого применяются")
+    parser.add_argument("--output", default="offline_results", help="каталог для результатов")
+    parser.add_argument("--workers", type=int, default=None, help="количество процессов, по умолчанию по числу ядер")
+    parser.add_argument("--format", nargs="+", choices=["json", "csv"], default=["json", "csv"], dest="formats")
+    args = parser.parse_args(argv)
+
+    paths = find_reports(args.paths)
+    if not paths:
+        print("Не найдено ни одного отчета .xls, .xlsx или архива .zip", file=sys.stderr)
+        return 1
+
+    entries = run(paths, args.action, args.workers, branch=args.branch)
+    summary = summarize(entries)
+
+    os.makedirs(args.output, exist_ok=True)
+    if "json" in args.formats:
+        write_json(os.path.join(args.output, "results.json"), entries)
+        write_json(os.path.join(args.output, "summary.json"), summary)
+    if "csv" in args.formats:
+        rows = [{"file": entry["file"], **record} for entry in entries for record in entry["records"]]
+        write_csv(os.path.join(args.output, "results.csv"), ["file"] + RECORD_FIELDS, rows)
+        write_csv(os.path.join(args.output, "summary.csv"), SUMMARY_FIELDS, summary)
+    print(f"Результаты сохранены в {args.output}", file=sys.stderr)
+    return 1 if any(entry["error"] for entry in entries) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from telebot.types import ReplyParameters
+import metrics
+
+MAX_MESSAGE_LENGTH = 4096
+# Buckets of idle chats are dropped when there are more of them
+MAX_IDLE_BUCKETS = 1000
+
+
+class TokenBucket:
+    """
+    Ограничение частоты: rate отправок в секунду, до capacity подряд после паузы
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, now: float) -> float:
+        """
+        :return: Сколько секунд ждать до следующей отправки
+        """
+        self._refill(now)
+        blocked = max(0, self._blocked_until - now)
+        if self._tokens >= 1:
+            return blocked
+        return max(blocked, (1 - self._tokens) / self.rate)
+
+    def take(self, now: float):
+        self._refill(now)
+        self._tokens -= 1
+
+    def block(self, seconds: float, now: float):
+        """
+        Запрещает отправку на seconds секунд, например после ответа 429 с retry_after
+        """
+        self._blocked_until = max(self._blocked_until, now + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self._tokens >= self.capacity and self._blocked_until <= now
+
+
+class Outbox:
+    """
+    Очередь исходящих сообщений с ограничением частоты
+
+    Сообщения отправляет один фоновый поток: чаты обслуживаются по кругу, частота ограничена
+    для каждого чата и для бота в целом. При ответе 429 сообщение отправляется повторно после
+    retry_after. Идущие подряд сообщения одного чата объединяются, пока помещаются в одно
+    сообщение, а из нескольких изменений одного сообщения отправляется только последнее
+
+    Рассылки (bulk) идут отдельной очередью со своим ограничением частоты и отправляются,
+    только когда нет готовых ответов пользователям
+    """
+
+    def __init__(self, call, chat_rate: float = 1, chat_burst: float = 3, global_rate: float = 30,
+                 bulk_rate: float = 20, max_retries: int = 5):
+        """
+        :param call: Функция call(method, kwargs), которая вызывает метод бота и возвращает результат
+        :param chat_rate: Сообщений в секунду в один чат
+        :param chat_burst: Сообщений подряд в один чат после паузы
+        :param global_rate: Сообщений в секунду во все чаты
+        :param bulk_rate: Сообщений рассылки в секунду, часть global_rate
+        :param max_retries: Повторов после ответа 429
+        """
+        self._call = call
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._max_retries = max_retries
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._bulk_bucket = TokenBucket(bulk_rate, bulk_rate)
+        self._chat_buckets = {}
+        # Replies and bulk messages: chat_id -> deque of [method, kwargs, futures, attempts, bulk], in round-robin order
+        self._queues = OrderedDict()
+        self._bulk_queues = OrderedDict()
+        self._condition = threading.Condition()
+
+        threading.Thread(target=self._worker, name="outbox", daemon=True).start()
+
+    def __len__(self):
+        with self._condition:
+            return sum(len(queue) for queues in (self._queues, self._bulk_queues) for queue in queues.values())
+
+    def send_message(self, chat_id, text: str, reply_to: int = None, reply_markup=None, parse_mode: str = None,
+                     coalesce: bool = True, bulk: bool = False) -> Future:
+        """
+        :param reply_to: Идентификатор сообщения, на которое отвечает бот
+        :param coalesce: False для сообщений, которые потом изменяются, например статуса обработки
+        :param bulk: Сообщение рассылки, отправляется после ответов пользователям
+        :return: Future с отправленным сообщением
+        """
+        return self._put(chat_id, "send_message", {
+            "chat_id": chat_id, "text": text, "reply_to": reply_to, "reply_markup": reply_markup, "parse_mode": parse_mode,
+            "coalesce": coalesce,
+        }, bulk)
+
+    def edit_message_text(self, text: str, chat_id, message_id: int, reply_markup=None) -> Future:
+        return self._put(chat_id, "edit_message_text", {
+            "text": text, "chat_id": chat_id, "message_id": message_id, "reply_markup": reply_markup,
+        })
+
+    def send_document(self, chat_id, file_name: str, data: bytes, reply_to: int = None, caption: str = None) -> Future:
+        return self._put(chat_id, "send_document", {
+            "chat_id": chat_id, "document": data, "visible_file_name": file_name, "reply_to": reply_to, "caption": caption,
+        })
+
+    def _put(self, chat_id, method: str, kwargs: dict, bulk: bool = False) -> Future:
+        future = Future()
+        queues = self._bulk_queues if bulk else self._queues
+        with self._condition:
+            queue = queues.get(chat_id)
+            if queue and self._merge(queue[-1], method, kwargs):
+                queue[-1][2].append(future)
+            else:
+                if queue is None:
+                    queue = queues[chat_id] = deque()
+                queue.append([method, kwargs, [future], 0, bulk])
+                self._condition.notify()
+        return future
+
+    @staticmethod
+    def _merge(item, method: str, kwargs: dict) -> bool:
+        # Merge into the last waiting call of the chat, if the result is the same as sending both
+        last_method, last_kwargs, _, _, _ = item
+        if method != last_method:
+            return False
+        if method == "edit_message_text":
+            if last_kwargs["message_id"] != kwargs["message_id"]:
+                return False
+            last_kwargs.update(kwargs)
+            return True
+        if method == "send_message":
+            text = f"{last_kwargs['text']}\n\n{kwargs['text']}"
+            if (not last_kwargs["coalesce"] or not kwargs["coalesce"]
+                    or last_kwargs["reply_markup"] is not None or len(text) > MAX_MESSAGE_LENGTH
+                    or (last_kwargs["reply_to"], last_kwargs["parse_mode"]) != (kwargs["reply_to"], kwargs["parse_mode"])):
+                return False
+            last_kwargs.update(kwargs, text=text)
+            return True
+        return False
+
+    def _bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self._chat_rate, self._chat_burst)
+        return bucket
+
+    def _next_item(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = None
+                global_delay = self._global_bucket.delay(now)
+                # Replies first, bulk messages only when no reply can be sent now
+                for queues, lane_delay in ((self._queues, 0), (self._bulk_queues, self._bulk_bucket.delay(now))):
+                    for chat_id in queues:
+                        delay = max(global_delay, lane_delay, self._bucket(chat_id).delay(now))
+                        if delay <= 0:
+                            return chat_id, self._pop(queues, chat_id, now)
+                        wait = delay if wait is None else min(wait, delay)
+                self._condition.wait(wait)
+
+    def _pop(self, queues: OrderedDict, chat_id, now: float):
+        queue = queues[chat_id]
+        item = queue.popleft()
+        if queue:
+            queues.move_to_end(chat_id)
+        else:
+            del queues[chat_id]
+        self._global_bucket.take(now)
+        self._bucket(chat_id).take(now)
+        if queues is self._bulk_queues:
+            self._bulk_bucket.take(now)
+
+        if len(self._chat_buckets) > MAX_IDLE_BUCKETS:
+            busy = self._queues.keys() | self._bulk_queues.keys()
+            for idle_id in [key for key, bucket in self._chat_buckets.items() if key not in busy and bucket.is_idle(now)]:
+                del self._chat_buckets[idle_id]
+        return item
+
+    def _retry(self, chat_id, item, retry_after: float):
+        with self._condition:
+            item[3] += 1
+            self._bucket(chat_id).block(retry_after, time.monotonic())
+            queues = self._bulk_queues if item[4] else self._queues
+            queue = queues.get(chat_id)
+            if queue is None:
+                queue = queues[chat_id] = deque()
+            queue.appendleft(item)
+            self._condition.notify()
+
+    def _worker(self):
+        while True:
+            chat_id, item = self._next_item()
+            method, kwargs, futures, attempts, _ = item
+            call_kwargs = dict(kwargs)
+            call_kwargs.pop("coalesce", None)
+            reply_to = call_kwargs.pop("reply_to", None)
+            if reply_to:
+                call_kwargs["reply_parameters"] = ReplyParameters(reply_to)
+            try:
+                with metrics.timer("send", method=method):
+                    result = self._call(method, call_kwargs)
+            except Exception as e:
+                # Flood limit, the same call is repeated after retry_after seconds
+                if getattr(e, "error_code", None) == 429 and attempts < self._max_retries:
+                    retry_after = (getattr(e, "result_json", None) or {}).get("parameters", {}).get("retry_after", 1)
+                    self._retry(chat_id, item, retry_after)
+                    continue
+                print(f"Error in outbox: {method} to {chat_id}: {e}")
+                for future in futures:
+                    future.set_exception(e)
+            else:
+                for future in futures:
+                    future.set_result(result)
@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import io
+import itertools
+import os
+
+import lazy
+
+try:
+    import python_calamine
+except ImportError:
+    python_calamine = None
+
+# Loaded on first use, the bot starts without them
+openpyxl = lazy.lazy_import("openpyxl")
+pd = lazy.lazy_import("pandas")
+xlrd = lazy.lazy_import("xlrd")
+
+XLS_SIGNATURE = b"\xd0\xcf\x11\xe0"
+
+
+def read_bytes(source) -> bytes:
+    """
+    :param source: Путь к файлу, буфер или байты
+    :return: Содержимое файла
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, "read"):
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return source.read()
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def source_size(source) -> int:
+    """
+    :param source: Путь к файлу, буфер или байты
+    :return: Размер файла в байтах
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    return source.getbuffer().nbytes if hasattr(source, "getbuffer") else len(read_bytes(source))
+
+
+def _cell(value):
+    # Same conversions as pandas: empty -> None, integral float -> int
+    if value == "" or value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _calamine_rows(data):
+    if isinstance(data, str):
+        workbook = python_calamine.CalamineWorkbook.from_path(data)
+    else:
+        workbook = python_calamine.CalamineWorkbook.from_filelike(io.BytesIO(data))
+    sheet = workbook.get_sheet_by_index(0)
+    for row in sheet.iter_rows():
+        yield [_cell(value) for value in row]
+
+
+def _xlsx_rows(data):
+    workbook = openpyxl.load_workbook(data if isinstance(data, str) else io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        # Dimensions stored in the file may be wrong, read them from the rows
+        sheet.reset_dimensions()
+        for row in sheet.iter_rows(values_only=True):
+            yield [_cell(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def _xls_rows(data):
+    if isinstance(data, str):
+        book = xlrd.open_workbook(data, on_demand=True)
+    else:
+        book = xlrd.open_workbook(file_contents=data, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+        for row_index in range(sheet.nrows):
+            row = []
+            for cell_type, value in zip(sheet.row_types(row_index), sheet.row_values(row_index)):
+                if cell_type in (xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK, xlrd.XL_CELL_ERROR):
+                    row.append(None)
+                elif cell_type == xlrd.XL_CELL_DATE:
+                    row.append(xlrd.xldate_as_datetime(value, book.datemode))
+                elif cell_type == xlrd.XL_CELL_BOOLEAN:
+                    row.append(bool(value))
+                else:
+                    row.append(_cell(value))
+            yield row
+    finally:
+        book.release_resources()
+
+
+def iter_rows(source, stream: bool = False):
+    """
+    Построчно читает первый лист .xls или .xlsx, не загружая всю таблицу в DataFrame
+
+    Пустые строки пропускаются, как в pd.read_excel
+
+    :param source: Путь к файлу, буфер или байты файла
+    :param stream: Не использовать python-calamine: он быстрее, но загружает весь лист в память
+    :return: Генератор строк (списков значений), пустые ячейки - None
+    """
+    if isinstance(source, str):
+        # Files spooled to disk are read by the libraries from the path, without a copy in memory
+        with open(source, "rb") as f:
+            signature = f.read(len(XLS_SIGNATURE))
+        data = source
+    else:
+        data = read_bytes(source)
+        signature = data[:len(XLS_SIGNATURE)]
+    if python_calamine is not None and not stream:
+        rows = _calamine_rows(data)
+    elif signature == XLS_SIGNATURE:
+        rows = _xls_rows(data)
+    else:
+        rows = _xlsx_rows(data)
+
+    for row in rows:
+        if any(value is not None for value in row):
+            yield row
+
+
+def head_rows(source, count: int, stream: bool = False) -> list:
+    """
+    Читает только первые непустые строки отчета, например для проверки заголовка
+
+    :param source: Путь к файлу, буфер или байты файла
+    :param count: Количество строк
+    :param stream: Читать без python-calamine, как у iter_rows: для отчетов, которые потом читаются частями
+    :return: Список строк
+    """
+    rows = iter_rows(source, stream)
+    try:
+        return list(itertools.islice(rows, count))
+    finally:
+        rows.close()
+
+
+def column_names(values) -> list:
+    """
+    Названия столбцов из строки заголовка по правилам pandas: "Unnamed: N" для пустых, ".1" для повторов
+    """
+    names = []
+    counts = {}
+    for index, value in enumerate(values):
+        name = f"Unnamed: {index}" if value is None else value
+        if name in counts:
+            counts[name] += 1
+            name = f"{name}.{counts[name]}"
+        else:
+            counts[name] = 0
+        names.append(name)
+    return names
+
+
+def select_columns(names: list, columns: list) -> list:
+    """
+    Находит нужные столбцы
+
+    :param names: Названия столбцов таблицы
+    :param columns: Описание столбцов: название, (название, номер столбца) или функция-фильтр по названию
+    :return: Список (номер столбца, название в результате) без повторов
+    """
+    selected = []
+    for spec in columns:
+        if callable(spec):
+            selected.extend((index, name) for index, name in enumerate(names) if isinstance(name, str) and spec(name))
+        elif isinstance(spec, tuple):
+            label, position = spec
+            if label in names:
+                selected.append((names.index(label), label))
+            elif position < len(names):
+                selected.append((position, label))
+        elif spec in names:
+            selected.append((names.index(spec), spec))
+
+    unique = []
+    for index, label in selected:
+        if all(index != other for other, _ in unique):
+            unique.append((index, label))
+    return unique
+
+
+def apply_dtypes(df: pd.DataFrame, dtypes: dict) -> pd.DataFrame:
+    """
+    Приводит столбцы к типам: "float" - число (не числа становятся NaN), "str" - строка
+    """
+    for column, dtype in (dtypes or {}).items():
+        if column not in df.columns:
+            continue
+        if dtype == "float":
+            df[column] = pd.to_numeric(df[column], errors="coerce").astype(float)
+        elif dtype == "str":
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return df
+
+
+def frame_from_rows(rows, selected: list, dtypes: dict = None) -> pd.DataFrame:
+    """
+    Собирает DataFrame только из выбранных столбцов строк
+
+    :param rows: Строки таблицы без заголовка
+    :param selected: Результат select_columns
+    :param dtypes: Типы столбцов для apply_dtypes
+    """
+    values = {label: [] for _, label in selected}
+    for row in rows:
+        row_length = len(row)
+        for index, label in selected:
+            values[label].append(row[index] if index < row_length else None)
+    df = pd.DataFrame({label: pd.Series(column, dtype=object).infer_objects() for label, column in values.items()})
+    return apply_dtypes(df, dtypes)
+
+
+def project(df: pd.DataFrame, columns: list, dtypes: dict = None) -> pd.DataFrame:
+    """
+    Выбирает нужные столбцы из уже прочитанного DataFrame по тем же правилам, что и read_columns
+    """
+    selected = select_columns(list(df.columns), columns)
+    if [label for _, label in selected] == list(df.columns):
+        # Already projected, e.g. by load_report before a nested analysis: no new columns are built
+        return apply_dtypes(df.copy(deep=False), dtypes)
+    result = pd.DataFrame({label: df.iloc[:, index] for index, label in selected}, index=df.index)
+    return apply_dtypes(result, dtypes)
+
+
+def read_columns(source, columns: list, header: int = 0, dtypes: dict = None) -> pd.DataFrame:
+    """
+    Читает из отчета только нужные столбцы, строки обрабатываются потоком
+
+    Использует python-calamine, если он установлен, иначе openpyxl в режиме read_only для .xlsx
+    и xlrd для .xls
+
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
+    :param columns: Описание столбцов для select_columns
+    :param header: Номер строки заголовка среди непустых строк
+    :param dtypes: Типы столбцов {название: "float" | "str"}
+    :return: DataFrame с выбранными столбцами
+    """
+    if isinstance(source, pd.DataFrame):
+        return project(source, columns, dtypes)
+
+    rows = iter_rows(source)
+    for _ in range(header):
+        next(rows, None)
+    header_values = next(rows, None)
+    if header_values is None:
+        return pd.DataFrame()
+
+    selected = select_columns(column_names(header_values), columns)
+    return frame_from_rows(rows, selected, dtypes)
+
+
+def read_chunks(source, columns: list, header: int = 0, dtypes: dict = None, chunk_rows: int = 10000):
+    """
+    Читает нужные столбцы частями по chunk_rows строк, в памяти одновременно только одна часть
+
+    Строки всегда читаются через openpyxl или xlrd, так как python-calamine загружает лист целиком
+
+    :param source: Путь к файлу, буфер, байты файла .xls/.xlsx или DataFrame
+    :param columns: Описание столбцов для select_columns
+    :param header: Номер строки заголовка среди непустых строк
+    :param dtypes: Типы столбцов {название: "float" | "str"}
+    :param chunk_rows: Строк в одной части
+    :return: Генератор DataFrame с выбранными столбцами, хотя бы одна (возможно пустая) часть,
+        если в отчете есть заголовок
+    """
+    if isinstance(source, pd.DataFrame):
+        df = project(source, columns, dtypes)
+        for start in range(0, max(len(df), 1), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+        return
+
+    rows = iter_rows(source, stream=True)
+    try:
+        for _ in range(header):
+            next(rows, None)
+        header_values = next(rows, None)
+        if header_values is None:
+            return
+
+        selected = select_columns(column_names(header_values), columns)
+        chunk = list(itertools.islice(rows, chunk_rows))
+        yield frame_from_rows(chunk, selected, dtypes)
+        while len(chunk) == chunk_rows:
+            chunk = list(itertools.islice(rows, chunk_rows))
+            if chunk:
+                yield frame_from_rows(chunk, selected, dtypes)
+    finally:
+        rows.close()
+
+
+def prewarm():
+    """
+    Загружает библиотеки чтения отчетов и pandas заранее, чтобы их не ждал первый отчет
+    """
+    # Attribute access imports the lazy modules
+    openpyxl.load_workbook, xlrd.open_workbook
+    frame_from_rows([[1, "1"]], [(0, "number"), (1, "text")], {"number": "float", "text": "str"})
@@ -0,0 +1,104 @@
+import heapq
+import threading
+
+import teachers
+
+
+class RiskProfile:
+    """
+    Студенты в зоне риска: последние значения метрик из разных отчетов, объединенные по нормализованному ФИО
+
+    Значения хранятся в словаре по нормализованному ФИО, поэтому новый отчет обновляет только своих
+    студентов и свою метрику, другие отчеты не перечитываются, а оценка риска пересчитывается только
+    для обновленных студентов
+    """
+
+    def __init__(self, thresholds: dict, load=None):
+        """
+        :param thresholds: {метрика: порог}, значение ниже порога - фактор риска
+        :param load: Функция, которая возвращает сохраненные значения (метрика, имя, значение) от старых к новым,
+            вызывается при первом обращении
+        """
+        self.thresholds = thresholds
+        self._loader = load
+        self._load = load
+        self._students = {}  # name key -> {"name": name, metric: value, ...}
+        self._risks = {}  # name key -> (factors, score), only students below at least one threshold
+        self._lock = threading.Lock()
+
+    def update(self, records: list) -> int:
+        """
+        Добавляет результаты нового отчета, значение студента по метрике заменяет предыдущее
+
+        :param records: Список (тип отчета, метрика, период, имя, значение) из actions.result_records
+        :return: Количество обновленных студентов
+        """
+        with self._lock:
+            self._ensure_loaded()
+            return self._apply((metric, name, value) for _, metric, _, name, value in records)
+
+    def ranked(self, limit: int = None):
+        """
+        :param limit: Сколько студентов вернуть, None - всех
+        :return: Список (ФИО, {метрика: значение}, количество факторов, оценка) от наибольшего риска
+            и общее количество студентов в зоне риска
+        """
+        with self._lock:
+            self._ensure_loaded()
+
+            def order(key):
+                # Ties are broken by name, so the order does not change between calls
+                factors, score = self._risks[key]
+                return -factors, -score, key
+
+            keys = heapq.nsmallest(limit, self._risks, key=order) if limit else sorted(self._risks, key=order)
+            rows = []
+            for key in keys:
+                student = self._students[key]
+                values = {metric: student[metric] for metric in self.thresholds if metric in student}
+                rows.append((student["name"], values) + self._risks[key])
+            return rows, len(self._risks)
+
+    def reload(self):
+        """
+        Перечитывает сохраненные значения при следующем обращении, например после записи
+        результатов в историю не через update
+        """
+        with self._lock:
+            self._load = self._loader
+            self._students = {}
+            self._risks = {}
+
+    def _ensure_loaded(self):
+        # Called under the lock
+        if self._load is not None:
+            load, self._load = self._load, None
+            self._apply(load())
+
+    def _apply(self, values) -> int:
+        touched = set()
+        for metric, name, value in values:
+            if metric not in self.thresholds:
+                continue
+            key = teachers.normalize_name(name)
+            student = self._students.setdefault(key, {})
+            student["name"] = name
+            student[metric] = value
+            touched.add(key)
+
+        for key in touched:
+            risk = self._risk(self._students[key])
+            if risk:
+                self._risks[key] = risk
+            else:
+                self._risks.pop(key, None)
+        return len(touched)
+
+    def _risk(self, student: dict):
+        # Shortfall below each threshold relative to the threshold: more factors first, then deeper shortfalls
+        shortfalls = [
+            (threshold - student[metric]) / threshold
+            for metric, threshold in self.thresholds.items()
+            if metric in student and student[metric] < threshold
+        ]
+        return (len(shortfalls), round(sum(shortfalls), 4)) if shortfalls else None
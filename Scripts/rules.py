@@ -0,0 +1,334 @@
+import json
+import os
+import string
+import tempfile
+import threading
+
+import lazy
+
+np = lazy.lazy_import("numpy")
+
+DEFAULT_BRANCH = "default"
+# Comparison operators of rules and numpy functions applied to all rules with this operator at once
+OPERATORS = {
+    "<": "less", "<=": "less_equal", ">": "greater", ">=": "greater_equal", "==": "equal", "!=": "not_equal",
+}
+# Fields of a new rule, a rule with the id of an existing one may change only some of them
+RULE_FIELDS = ["id", "report", "column", "op", "value", "title", "line"]
+DEFAULT_TEXT = "{name}: {line}"
+DEFAULT_EMPTY = "Нарушений нет"
+
+
+class CompiledRules:
+    """
+    Правила одного типа отчета, скомпилированные в одну векторную проверку
+
+    Значения всех столбцов, которые проверяют правила, собираются в одну матрицу, а пороги правил
+    с одинаковым оператором сравниваются с ней одной операцией numpy. Количество проходов по таблице
+    зависит от числа разных операторов, а не от числа правил
+    """
+
+    def __init__(self, rules: list):
+        """
+        :param rules: Проверенные правила одного типа отчета
+        """
+        self.rules = rules
+        self.columns = list(dict.fromkeys(rule["column"] for rule in rules))
+        # Table columns used in the line template of every rule
+        self._fields = [
+            [name for _, name, _, _ in string.Formatter().parse(rule["line"]) if name and name != "value"]
+            for rule in rules
+        ]
+        positions = {}
+        for position, rule in enumerate(rules):
+            positions.setdefault(rule["op"], []).append(position)
+        # (numpy comparison, rule positions, matrix columns of the rules, thresholds) for every operator
+        self._groups = [
+            (
+                getattr(np, OPERATORS[op]),
+                np.array(op_positions, dtype=int),
+                np.array([self.columns.index(rules[position]["column"]) for position in op_positions], dtype=int),
+                np.array([float(rules[position]["value"]) for position in op_positions]),
+            )
+            for op, op_positions in positions.items()
+        ]
+
+    def __len__(self):
+        return len(self.rules)
+
+    def evaluate(self, table):
+        """
+        :param table: DataFrame значений, столбцы которого проверяют правила, отсутствующие столбцы считаются пустыми
+        :return: Матрица bool (строка таблицы x правило), True - строка нарушает правило
+        """
+        values = table.reindex(columns=self.columns).to_numpy(dtype=float)
+        matched = np.zeros((len(table), len(self.rules)), dtype=bool)
+        present = ~np.isnan(values)
+        for compare, positions, columns, thresholds in self._groups:
+            # Missing values never match, as in the built-in checks
+            matched[:, positions] = compare(values[:, columns], thresholds) & present[:, columns]
+        return matched
+
+    def lines(self, table, rule_ids: list = None) -> dict:
+        """
+        Проверяет таблицу и форматирует строки нарушений
+
+        Все правила проверяются одной векторной проверкой, а строки форматируются только для
+        правил rule_ids и только из нарушивших их строк таблицы
+
+        :param table: DataFrame со столбцом name и значениями
+        :param rule_ids: Правила, строки которых нужны, None - все правила
+        :return: Словарь {id правила: [(имя, строка без имени), ...]} в порядке строк таблицы
+        """
+        matched = self.evaluate(table)
+        result = {}
+        for position, rule in enumerate(self.rules):
+            if rule_ids is not None and rule["id"] not in rule_ids:
+                continue
+            rows = np.flatnonzero(matched[:, position])
+            if not len(rows):
+                result[rule["id"]] = []
+                continue
+            # Only the flagged rows of the columns in the template are converted to Python values
+            fields = self._fields[position]
+            columns = [table[field].to_numpy()[rows].tolist() for field in fields]
+            names = table["name"].to_numpy()[rows].tolist()
+            result[rule["id"]] = [
+                (name, rule["line"].format(value=rule["value"], **dict(zip(fields, values))))
+                for name, *values in zip(names, *columns)
+            ]
+        return result
+
+
+def format_result(rule: dict, lines: list) -> str:
+    """
+    :param rule: Правило
+    :param lines: Строки нарушений [(имя, строка без имени)] из CompiledRules.lines
+    :return: Текст результата правила
+    """
+    if not lines:
+        return rule.get("empty", DEFAULT_EMPTY).format(value=rule["value"])
+    text = rule.get("text", DEFAULT_TEXT)
+    return rule.get("header", "").format(value=rule["value"]) + "\n".join(
+        text.format(name=name, line=line) for name, line in lines
+    )
+
+
+def describe(rule: dict) -> str:
+    """
+    :return: Правило одной строкой: id, название и условие
+    """
+    return f"{rule['id']} - {rule['title']}: {rule['column']} {rule['op']} {rule['value']:g}"
+
+
+def _check_template(rule: dict, field: str, names: list):
+    template = rule[field]
+    if not isinstance(template, str):
+        raise ValueError(f"правило {rule['id']}: поле {field} должно быть строкой")
+    try:
+        fields = [name for _, name, _, _ in string.Formatter().parse(template) if name]
+        unknown = [name for name in fields if name not in names]
+        if unknown:
+            raise ValueError(f"неизвестные поля {', '.join(unknown)}")
+        # Sample values catch wrong format specs before a report is analysed
+        template.format(**{name: "ФИО" if name == "name" else 1.0 for name in names})
+    except (ValueError, IndexError, KeyError) as e:
+        raise ValueError(f"правило {rule['id']}: ошибка в поле {field}: {e}") from None
+
+
+def validate_rule(rule: dict, columns: dict):
+    """
+    Проверяет правило после объединения со встроенными правилами и правками
+
+    :param rule: Правило
+    :param columns: {тип отчета: [столбцы, которые можно проверять]}
+    :raises ValueError: Правило неполное или ссылается на неизвестный отчет, столбец или оператор
+    """
+    missing = [field for field in RULE_FIELDS if field not in rule]
+    if missing:
+        raise ValueError(f"правило {rule.get('id', '?')}: не заданы поля {', '.join(missing)}")
+    if rule["report"] not in columns:
+        raise ValueError(f"правило {rule['id']}: неизвестный тип отчета {rule['report']}, доступны: {', '.join(columns)}")
+    if rule["column"] not in columns[rule["report"]]:
+        raise ValueError(
+            f"правило {rule['id']}: в отчете {rule['report']} нет столбца {rule['column']}, "
+            f"доступны: {', '.join(columns[rule['report']])}"
+        )
+    if rule["op"] not in OPERATORS:
+        raise ValueError(f"правило {rule['id']}: неизвестный оператор {rule['op']}, доступны: {' '.join(OPERATORS)}")
+    if isinstance(rule["value"], bool) or not isinstance(rule["value"], (int, float)):
+        raise ValueError(f"правило {rule['id']}: порог value должен быть числом")
+
+    line_names = ["name", "value"] + columns[rule["report"]]
+    _check_template(rule, "title", [])
+    _check_template(rule, "line", line_names)
+    for field, names in (("text", ["name", "line"]), ("header", ["value"]), ("empty", ["value"])):
+        if field in rule:
+            _check_template(rule, field, names)
+
+
+class RuleBook:
+    """
+    Правила проверок по филиалам: встроенные правила, общие правки и правки филиала из JSON файла
+
+    Файл редактирует администратор: {"default": {"rules": [...]}, "<филиал>": {"chats": [chat_id, ...], "rules": [...]}}.
+    Правило с id существующего правила меняет только указанные поля, правило с новым id добавляет проверку,
+    "enabled": false отключает правило. Скомпилированные наборы кэшируются по филиалу и типу отчета и
+    сбрасываются при изменении файла, поэтому процессы пула анализа видят правки без перезапуска
+    """
+
+    def __init__(self, path: str, defaults: list, columns: dict):
+        """
+        :param path: Путь к JSON файлу правил
+        :param defaults: Встроенные правила
+        :param columns: {тип отчета: [столбцы, которые можно проверять]}
+        """
+        self.path = path
+        self.defaults = {rule["id"]: rule for rule in defaults}
+        self.columns = columns
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._branches = {}
+        self._compiled = {}  # (branch, report) -> CompiledRules
+
+    def _refresh(self):
+        # Called under the lock, the file is re-read only when it changes
+        try:
+            stat = os.stat(self.path)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._stamp:
+            return
+        self._stamp = stamp
+        self._compiled = {}
+        self._branches = {}
+        if stamp is None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                branches = json.load(f)
+            if not isinstance(branches, dict):
+                raise ValueError("ожидается объект {филиал: {\"chats\": [...], \"rules\": [...]}}")
+            for branch in branches:
+                self._merge(branches, branch)
+            self._branches = branches
+        except Exception as e:
+            # A broken file edited by hand does not stop the analyses, the built-in rules are used
+            print(f"Error with rules file {self.path}: {e}")
+
+    def _merge(self, branches: dict, branch: str) -> list:
+        rules = {rule_id: dict(rule) for rule_id, rule in self.defaults.items()}
+        names = [DEFAULT_BRANCH] + ([branch] if branch != DEFAULT_BRANCH else [])
+        for name in names:
+            entry = branches.get(name) or {}
+            if not isinstance(entry, dict) or not isinstance(entry.get("rules", []), list):
+                raise ValueError(f"филиал {name}: ожидается объект с полем rules - списком правил")
+            for change in entry.get("rules", []):
+                if not isinstance(change, dict) or not isinstance(change.get("id"), str) or not change["id"]:
+                    raise ValueError(f"филиал {name}: у каждого правила должно быть поле id")
+                rules.setdefault(change["id"], {}).update(change)
+
+        result = []
+        for rule in rules.values():
+            if not rule.get("enabled", True):
+                continue
+            validate_rule(rule, self.columns)
+            default = self.defaults.get(rule["id"])
+            if default is not None and rule["report"] != default["report"]:
+                raise ValueError(f"правило {rule['id']}: у встроенного правила нельзя менять тип отчета")
+            result.append(rule)
+        return result
+
+    def rules(self, branch: str = None) -> list:
+        """
+        :param branch: Филиал, None - общие правила
+        :return: Действующие правила филиала
+        """
+        with self._lock:
+            self._refresh()
+            return self._merge(self._branches, branch or DEFAULT_BRANCH)
+
+    def compiled(self, report: str, branch: str = None) -> CompiledRules:
+        """
+        :param report: Тип отчета
+        :param branch: Филиал, None - общие правила
+        :return: Скомпилированные правила филиала для этого типа отчета
+        """
+        branch = branch or DEFAULT_BRANCH
+        with self._lock:
+            self._refresh()
+            if branch not in self._branches:
+                branch = DEFAULT_BRANCH
+            key = (branch, report)
+            if key not in self._compiled:
+                self._compiled[key] = CompiledRules(
+                    [rule for rule in self._merge(self._branches, branch) if rule["report"] == report]
+                )
+            return self._compiled[key]
+
+    def branches(self) -> dict:
+        """
+        :return: Словарь {филиал: записи из файла (chats, rules)}
+        """
+        with self._lock:
+            self._refresh()
+            return {name: dict(entry) for name, entry in self._branches.items()}
+
+    def branch_for(self, chat_id) -> str:
+        """
+        :return: Филиал, в списке chats которого есть этот чат, или общие правила
+        """
+        with self._lock:
+            self._refresh()
+            for name, entry in self._branches.items():
+                if chat_id in entry.get("chats", []):
+                    return name
+        return DEFAULT_BRANCH
+
+    def save(self, branch: str, entry) -> list:
+        """
+        Заменяет правила филиала, правила проверяются до записи в файл
+
+        :param branch: Филиал
+        :param entry: Список правил или объект {"chats": [...], "rules": [...]}
+        :return: Действующие правила филиала после изменения
+        :raises ValueError: Правила с ошибкой, файл не изменяется
+        """
+        if isinstance(entry, list):
+            entry = {"rules": entry}
+        if not isinstance(entry, dict):
+            raise ValueError("ожидается список правил или объект {\"chats\": [...], \"rules\": [...]}")
+        chats = entry.get("chats", [])
+        if not isinstance(chats, list) or not all(isinstance(chat, int) and not isinstance(chat, bool) for chat in chats):
+            raise ValueError("chats должен быть списком числовых chat_id")
+
+        with self._lock:
+            self._refresh()
+            branches = dict(self._branches)
+            # Rules sent without chats keep the chats of the branch
+            if "chats" not in entry and "chats" in branches.get(branch, {}):
+                entry = {**entry, "chats": branches[branch]["chats"]}
+            branches[branch] = entry
+            # Other branches inherit the common rules, so all of them are checked
+            for name in branches:
+                self._merge(branches, name)
+            rules = self._merge(branches, branch)
+            self._write(branches)
+            self._branches = branches
+            self._compiled = {}
+            self._stamp = None
+            return rules
+
+    def _write(self, branches: dict):
+        # Write to a temp file next to the target and replace it in one step
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(branches, f, ensure_ascii=False, indent=4)
+            os.replace(temp_path, self.path)
+        except Exception:
+            os.remove(temp_path)
+            raise
@@ -0,0 +1,274 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+JOB_PREFIX = "job-"
+CHUNK_SIZE = 64 * 1024
+
+
+class Spool:
+    """
+    Временные файлы заданий: у каждого задания свой каталог внутри root
+
+    Общий объем файлов активных заданий ограничен quota_bytes. Каталоги, оставшиеся после
+    сбоев, удаляет janitor: старше max_age или самые старые, пока объем больше квоты
+
+    В имени каталога задания - pid процесса, поэтому несколько процессов бота могут использовать
+    один root: каталоги работающего процесса удаляет только он сам, каталоги завершенного - любой
+    """
+
+    def __init__(self, root: str, quota_bytes: int, max_age: float):
+        """
+        :param root: Каталог для временных файлов
+        :param quota_bytes: Максимальный объем временных файлов в байтах
+        :param max_age: Через сколько секунд удалять каталоги завершенных или прерванных заданий
+        """
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.max_age = max_age
+        self._active = {}  # job directory -> bytes written
+        self._lock = threading.Lock()
+
+    def job(self) -> "JobSpool":
+        """
+        :return: Каталог нового задания, создается при записи первого файла и удаляется при выходе из with
+        """
+        return JobSpool(self)
+
+    def _create(self) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        path = tempfile.mkdtemp(prefix=f"{JOB_PREFIX}{os.getpid()}-", dir=self.root)
+        with self._lock:
+            self._active[path] = 0
+        return path
+
+    def usage(self) -> int:
+        """
+        :return: Объем файлов активных заданий в байтах
+        """
+        with self._lock:
+            return sum(self._active.values())
+
+    def _reserve(self, path: str, size: int):
+        with self._lock:
+            if sum(self._active.values()) + size > self.quota_bytes:
+                raise ValueError("недостаточно места для временных файлов, попробуйте позже")
+            self._active[path] += size
+
+    def _release(self, path: str):
+        with self._lock:
+            self._active.pop(path, None)
+        shutil.rmtree(path, ignore_errors=True)
+
+    def clean(self) -> int:
+        """
+        Удаляет каталоги заданий, которые не выполняются: завершенных процессов, старше max_age,
+        а затем самые старые, пока общий объем больше квоты. Каталоги других работающих процессов
+        не трогаются
+
+        :return: Количество удаленных каталогов
+        """
+        if not os.path.isdir(self.root):
+            return 0
+        with self._lock:
+            active = set(self._active)
+            used = sum(self._active.values())
+
+        leftovers = []
+        for entry in os.scandir(self.root):
+            if not entry.name.startswith(JOB_PREFIX) or entry.path in active or not entry.is_dir():
+                continue
+            owner = _owner(entry.name)
+            if owner != os.getpid() and _running(owner):
+                continue
+            try:
+                # Directories of a finished process are removed at once
+                modified = 0 if owner is not None and owner != os.getpid() else entry.stat().st_mtime
+                leftovers.append((modified, _directory_size(entry.path), entry.path))
+            except OSError:
+                continue
+        used += sum(size for _, size, _ in leftovers)
+
+        removed = 0
+        now = time.time()
+        for modified, size, path in sorted(leftovers):
+            if now - modified <= self.max_age and used <= self.quota_bytes:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            used -= size
+            removed += 1
+        return removed
+
+    def close(self) -> int:
+        """
+        Удаляет все каталоги заданий этого процесса, вызывается при его завершении
+
+        :return: Количество удаленных каталогов
+        """
+        with self._lock:
+            self._active.clear()
+        if not os.path.isdir(self.root):
+            return 0
+        removed = 0
+        for entry in os.scandir(self.root):
+            if entry.name.startswith(JOB_PREFIX) and _owner(entry.name) == os.getpid():
+                shutil.rmtree(entry.path, ignore_errors=True)
+                removed += 1
+        return removed
+
+    def start_janitor(self, interval: float):
+        """
+        Запускает фоновую очистку каждые interval секунд, первая очистка - сразу
+        """
+        def run():
+            while True:
+                try:
+                    removed = self.clean()
+                    if removed:
+                        print(f"Spool janitor removed {removed} job directories")
+                except Exception as e:
+                    print(f"Error in spool janitor: {e}")
+                time.sleep(interval)
+
+        threading.Thread(target=run, name="spool-janitor", daemon=True).start()
+
+
+def _owner(name: str):
+    # pid from the directory name "job-<pid>-<random>", None for directories without it
+    pid = name[len(JOB_PREFIX):].split("-", 1)[0]
+    return int(pid) if pid.isdigit() else None
+
+
+def _running(pid) -> bool:
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # The process exists but belongs to another user
+        return True
+    return True
+
+
+def _directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(directory, name)) for directory, _, names in os.walk(path) for name in names
+    )
+
+
+class JobSpool:
+    """
+    Каталог временных файлов одного задания
+    """
+
+    def __init__(self, spool: Spool):
+        self.spool = spool
+        self.path = None
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def create(self, file_name: str):
+        """
+        :param file_name: Имя файла от пользователя, от него берется только расширение
+        :return: Путь к новому файлу в каталоге задания
+        """
+        if self.path is None:
+            self.path = self.spool._create()
+        self._count += 1
+        return os.path.join(self.path, f"{self._count}{os.path.splitext(os.path.basename(file_name or ''))[1].lower()}")
+
+    def write(self, file_name: str, chunks) -> str:
+        """
+        Записывает файл по частям с учетом квоты
+
+        :param chunks: Итератор частей файла (bytes)
+        :return: Путь к файлу
+        """
+        path = self.create(file_name)
+        with open(path, "wb") as f:
+            for chunk in chunks:
+                self.reserve(len(chunk))
+                f.write(chunk)
+        return path
+
+    def reserve(self, size: int):
+        """
+        Учитывает size байт, записанных в каталог задания
+
+        :raises ValueError: Превышена квота временных файлов
+        """
+        self.spool._reserve(self.path, size)
+
+    def close(self):
+        if self.path is not None:
+            self.spool._release(self.path)
+            self.path = None
+
+
+class DownloadBuffer:
+    """
+    Принимает скачиваемый файл по частям: небольшой файл остается в памяти, большой
+    записывается в каталог задания
+
+    Размер проверяется по мере скачивания, поэтому файл больше max_bytes не скачивается целиком
+    """
+
+    def __init__(self, max_bytes: int = None, job_spool: JobSpool = None, memory_bytes: int = 0, file_name: str = ""):
+        """
+        :param max_bytes: Максимальный размер файла, None - без ограничения
+        :param job_spool: Каталог задания, без него файл всегда остается в памяти
+        :param memory_bytes: Файлы больше этого размера записываются на диск
+        :param file_name: Имя файла от пользователя, для расширения файла на диске
+        """
+        self.max_bytes = max_bytes
+        self.job_spool = job_spool
+        self.memory_bytes = memory_bytes
+        self.file_name = file_name
+        self.size = 0
+        self._buffer = bytearray()
+        self._file = None
+        self._path = None
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.max_bytes and self.size > self.max_bytes:
+            self.close()
+            raise ValueError(f"файл больше {self.max_bytes // 1024 // 1024} МБ")
+
+        if self._file is None and self.job_spool is not None and len(self._buffer) + len(chunk) > self.memory_bytes:
+            self._path = self.job_spool.create(self.file_name)
+            self._file = open(self._path, "wb")
+            self._spill(bytes(self._buffer))
+            self._buffer = bytearray()
+        if self._file is not None:
+            self._spill(chunk)
+        else:
+            self._buffer += chunk
+
+    def _spill(self, data: bytes):
+        if data:
+            self.job_spool.reserve(len(data))
+            self._file.write(data)
+
+    def result(self):
+        """
+        :return: Содержимое файла (bytes) или путь к файлу на диске
+        """
+        if self._file is not None:
+            self._file.close()
+            return self._path
+        return bytes(self._buffer)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
@@ -0,0 +1,327 @@
+"""
+Хранилище состояния диалогов: действие, выбранное в меню, и подготовленные уведомления
+
+Значения хранятся в хранилище (backend) с временем жизни, перед ним стоит LRU кэш в памяти:
+    memory - только в памяти процесса, теряется при перезапуске
+    sqlite - файл SQLite, сохраняется при перезапуске
+    http - общий сервер состояния, к которому подключаются несколько процессов бота
+
+Запуск сервера состояния: python state.py [--host 127.0.0.1] [--port 8090] [--path data/state.sqlite3]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+import requests
+
+# Expired entries are deleted from local backends at most this often, in seconds
+PURGE_INTERVAL = 60
+
+
+class LocalBackend:
+    """
+    Общая часть хранилищ в памяти и в SQLite: периодическое удаление устаревших записей
+    """
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._purged_at = 0
+
+    def _maybe_purge(self, now: float):
+        # Called under the lock
+        if now - self._purged_at >= PURGE_INTERVAL:
+            self._purged_at = now
+            self._purge(now)
+
+
+class MemoryBackend(LocalBackend):
+    """
+    Хранилище в памяти процесса
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._entries = {}  # key -> (value, expires_at)
+
+    def get(self, key: str):
+        """
+        :return: Пара (значение в JSON, время окончания жизни) или None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._maybe_purge(time.time())
+
+    def pop(self, key: str):
+        """
+        Удаляет запись и возвращает ее, как get
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None or entry[1] < time.time():
+            return None
+        return entry
+
+    def _purge(self, now: float):
+        for key in [key for key, (_, expires_at) in self._entries.items() if expires_at < now]:
+            del self._entries[key]
+
+
+class SQLiteBackend(LocalBackend):
+    """
+    Хранилище в файле SQLite
+    """
+
+    def __init__(self, path: str):
+        super().__init__()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._connection.execute(
+                "SELECT value, expires_at FROM state WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return entry
+
+    def set(self, key: str, value: str, expires_at: float):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)", (key, value, expires_at)
+            )
+            self._maybe_purge(time.time())
+
+    def pop(self, key: str):
+        with self._lock, self._connection:
+            entry = self._connection.execute(
+                "SELECT value, expires_at FROM state WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+            self._connection.execute("DELETE FROM state WHERE key = ?", (key,))
+        return entry
+
+    def _purge(self, now: float):
+        self._connection.execute("DELETE FROM state WHERE expires_at < ?", (now,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class HttpBackend:
+    """
+    Общее хранилище на сервере состояния (serve), одно для нескольких процессов бота
+    """
+    shared = True
+
+    def __init__(self, url: str, timeout: float = 5):
+        """
+        :param url: Адрес сервера состояния, например http://127.0.0.1:8090
+        :param timeout: Таймаут запроса в секундах
+        """
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def _entry(self, response):
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        entry = response.json()
+        return entry["value"], entry["expires_at"]
+
+    def get(self, key: str):
+        return self._entry(self._session.get(f"{self.url}/state/{quote(key, safe='')}", timeout=self.timeout))
+
+    def set(self, key: str, value: str, expires_at: float):
+        self._session.put(
+            f"{self.url}/state/{quote(key, safe='')}", json={"value": value, "expires_at": expires_at}, timeout=self.timeout
+        ).raise_for_status()
+
+    def pop(self, key: str):
+        return self._entry(self._session.delete(f"{self.url}/state/{quote(key, safe='')}", timeout=self.timeout))
+
+
+class StateStore:
+    """
+    Состояние диалогов с временем жизни и LRU кэшем в памяти перед хранилищем
+
+    Значения должны сериализоваться в JSON. Для общего хранилища кэш не используется,
+    потому что значение может изменить другой процесс
+    """
+
+    def __init__(self, backend, ttl: float, max_entries: int = 1000):
+        """
+        :param backend: MemoryBackend, SQLiteBackend или HttpBackend
+        :param ttl: Время жизни значения в секундах с последней записи
+        :param max_entries: Сколько значений держать в кэше в памяти
+        """
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = 0 if backend.shared else max_entries
+        self._front = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            entry = self._front.get(key)
+            if entry is not None:
+                if entry[1] >= time.time():
+                    self._front.move_to_end(key)
+                    return entry[0]
+                del self._front[key]
+
+        entry = self.backend.get(key)
+        if entry is None:
+            return default
+        value = json.loads(entry[0])
+        self._remember(key, value, entry[1])
+        return value
+
+    def set(self, key: str, value):
+        expires_at = time.time() + self.ttl
+        self.backend.set(key, json.dumps(value, ensure_ascii=False), expires_at)
+        self._remember(key, value, expires_at)
+
+    def pop(self, key: str, default=None):
+        """
+        Удаляет значение и возвращает его, из общего хранилища значение получит только один процесс
+        """
+        with self._lock:
+            self._front.pop(key, None)
+        entry = self.backend.pop(key)
+        return default if entry is None else json.loads(entry[0])
+
+    def _remember(self, key: str, value, expires_at: float):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._front[key] = (value, expires_at)
+            self._front.move_to_end(key)
+            while len(self._front) > self.max_entries:
+                self._front.popitem(last=False)
+
+
+def create_store(backend: str, ttl: float, max_entries: int, path: str = None, url: str = None) -> StateStore:
+    """
+    :param backend: memory, sqlite или http
+    :param path: Файл базы для sqlite
+    :param url: Адрес сервера состояния для http
+    """
+    match backend:
+        case "memory":
+            return StateStore(MemoryBackend(), ttl, max_entries)
+        case "sqlite":
+            return StateStore(SQLiteBackend(path), ttl, max_entries)
+        case "http":
+            return StateStore(HttpBackend(url), ttl, max_entries)
+    raise ValueError(f"Unknown state backend: {backend}")
+
+
+def make_handler(backend):
+    """
+    Создает обработчик HTTP запросов сервера состояния над локальным хранилищем
+
+    GET, PUT и DELETE /state/<key>, тело и ответ - {"value": ..., "expires_at": ...}
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        # Keep-alive, bot processes reuse connections, small responses are sent at once
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            key = self._key()
+            if key is not None:
+                self._send_entry(backend.get(key))
+
+        def do_PUT(self):
+            key = self._key()
+            if key is None:
+                return
+            try:
+                entry = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                backend.set(key, entry["value"], float(entry["expires_at"]))
+            except (ValueError, KeyError, TypeError):
+                return self._send(400)
+            self._send(204)
+
+        def do_DELETE(self):
+            key = self._key()
+            if key is not None:
+                self._send_entry(backend.pop(key))
+
+        def _key(self):
+            if not self.path.startswith("/state/"):
+                self._send(404)
+                return None
+            return unquote(self.path[len("/state/"):])
+
+        def _send_entry(self, entry):
+            if entry is None:
+                return self._send(404)
+            body = json.dumps({"value": entry[0], "expires_at": entry[1]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send(self, status):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host: str, port: int, backend):
+    """
+    Запускает сервер состояния в фоновом потоке
+
+    :return: Сервер, порт - server.server_port
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(backend))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="state", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сервер состояния диалогов для нескольких процессов бота")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--path", default=None, help="файл SQLite, без него состояние хранится в памяти")
+    args = parser.parse_args(argv)
+
+    backend = SQLiteBackend(args.path) if args.path else MemoryBackend()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(backend))
+    server.daemon_threads = True
+    print(f"State server on {args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
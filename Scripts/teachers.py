@@ -0,0 +1,166 @@
+import json
+import os
+import tempfile
+import threading
+
+
+def normalize_name(full_name) -> str:
+    """
+    Приводит ФИО к виду для сравнения: нижний регистр, ё -> е, одиночные пробелы
+
+    :param full_name: ФИО
+    :return: Нормализованное ФИО или пустая строка
+    """
+    if not isinstance(full_name, str):
+        return ""
+    return " ".join(full_name.lower().replace("ё", "е").split())
+
+
+class TeacherRegistry:
+    """
+    Реестр преподавателей, загружаемый из JSON один раз
+
+    Хранит индексы по username, chat_id и ФИО. Изменения записываются в файл в фоне, одной записью
+    за save_delay секунд, атомарно через временный файл
+    """
+
+    def __init__(self, path: str, save_delay: float = 1.0):
+        """
+        :param path: Путь к JSON файлу реестра
+        :param save_delay: Через сколько секунд после изменения записывается файл
+        """
+        self.path = path
+        self.save_delay = save_delay
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        # Pending write, None when the file is up to date
+        self._timer = None
+        self._teachers = {}
+        self._by_chat_id = {}
+        self._by_name = {}
+        self.load()
+
+    def load(self):
+        """
+        Перечитывает реестр из файла и перестраивает индексы
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                teachers = json.load(f)
+        except FileNotFoundError:
+            teachers = {}
+
+        with self._lock:
+            self._teachers = teachers
+            self._by_chat_id = {}
+            self._by_name = {}
+            for username, data in teachers.items():
+                self._index(username, data)
+
+    def __len__(self):
+        return len(self._teachers)
+
+    def __contains__(self, username):
+        return username in self._teachers
+
+    def items(self):
+        """
+        :return: Список пар (username, данные преподавателя)
+        """
+        with self._lock:
+            return list(self._teachers.items())
+
+    def get(self, username: str):
+        """
+        :return: Данные преподавателя или None
+        """
+        return self._teachers.get(username)
+
+    def by_chat_id(self, chat_id):
+        """
+        :return: username преподавателя с этим chat_id или None
+        """
+        return self._by_chat_id.get(chat_id)
+
+    def by_full_name(self, full_name):
+        """
+        :return: username преподавателя с этим ФИО (без учета регистра и лишних пробелов) или None
+        """
+        return self._by_name.get(normalize_name(full_name))
+
+    def save(self, username: str, chat_id=None, full_name=None):
+        """
+        Добавляет преподавателя или обновляет chat_id существующего, файл записывается в фоне
+
+        :param username: @username преподавателя
+        :param chat_id: Идентификатор чата
+        :param full_name: ФИО, используется только при добавлении
+        """
+        with self._lock:
+            old = self._teachers.get(username)
+            if old is not None:
+                self._unindex(username, old)
+                # A new entry instead of a change in place, entries returned by get and items do not change
+                data = dict(old, chat_id=chat_id)
+            else:
+                data = {"chat_id": chat_id, "full_name": full_name}
+            self._teachers[username] = data
+            self._index(username, data)
+            self._schedule()
+
+    def flush(self) -> bool:
+        """
+        Сразу записывает несохраненные изменения, вызывается таймером и при завершении бота
+
+        :return: True, если файл записан или изменений нет
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._timer is None:
+                    return True
+                self._timer.cancel()
+                self._timer = None
+                content = json.dumps(self._teachers, ensure_ascii=False, indent=4)
+            try:
+                self._write(content)
+            except Exception as e:
+                print(f"Error with teacher save: {e}")
+                # Changes stay in memory, the write is retried later
+                with self._lock:
+                    self._schedule()
+                return False
+            return True
+
+    def _schedule(self):
+        # Called under the lock: changes made before the timer fires are written together
+        if self._timer is None:
+            self._timer = threading.Timer(self.save_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _index(self, username, data):
+        if data.get("chat_id") is not None:
+            self._by_chat_id[data["chat_id"]] = username
+        name = normalize_name(data.get("full_name"))
+        if name:
+            self._by_name[name] = username
+
+    def _unindex(self, username, data):
+        if self._by_chat_id.get(data.get("chat_id")) == username:
+            del self._by_chat_id[data["chat_id"]]
+        name = normalize_name(data.get("full_name"))
+        if self._by_name.get(name) == username:
+            del self._by_name[name]
+
+    def _write(self, content: str):
+        # Write to a temp file next to the target and replace it in one step
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(temp_path, self.path)
+        except Exception:
+            os.remove(temp_path)
+            raise
@@ -0,0 +1,25 @@
+import history
+
+
+def test_namesakes_are_kept(tmp_path):
+    store = history.HistoryStore(str(tmp_path / "history.sqlite3"))
+    records = [
+        ("students", "average_mark", "", "Иванов Иван", 2.0),
+        ("students", "average_mark", "", "иванов  иван", 4.5),
+    ]
+    assert store.add(records, "file1") == 2
+    # The same file sent again adds nothing
+    assert store.add(records, "file1") == 0
+    assert [value for _, value in store.trend("Иванов Иван")[("average_mark", "")]] == [2.0, 4.5]
+    store.close()
+
+
+def test_namesakes_in_parts_of_report(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    writer = history.HistoryWriter(path, "file1")
+    for part in ([("students", "average_mark", "", "Петров Петр", 3.0)], [("students", "average_mark", "", "Петров Петр", 1.0)]):
+        assert writer(part) == 1
+    writer.close()
+    store = history.HistoryStore(path)
+    assert len(store.trend("Петров Петр")[("average_mark", "")]) == 2
+    store.close()
@@ -1,9 +1,8 @@
-import os
-import shutil
-import openpyxl
-import xlrd
+from __future__ import annotations
 
-TEMP_DIR = "temp_files"
+import requests
+from telebot import apihelper
+import spool
 
 def split_message(text, max_length=4096):
     """
@@ -14,59 +13,55 @@ def split_message(text, max_length=4096):
     """
     lines = text.split("\n")
     chunks = []
-    current_chunk = ""
+    # Lines of the current chunk are joined once, when it is full
+    current_lines = []
+    current_length = 0
 
     for line in lines:
-        if len(current_chunk) + len(line) + 1 <= max_length:
-            current_chunk += line + "\n"
+        if current_length + len(line) + 1 <= max_length:
+            current_lines.append(line)
+            current_length += len(line) + 1
         else:
-            chunks.append(current_chunk.strip())
-            current_chunk = line + "\n"
-    if current_chunk.strip():
-        chunks.append(current_chunk.strip())
+            chunks.append("\n".join(current_lines).strip())
+            current_lines = [line]
+            current_length = len(line) + 1
+    current_chunk = "\n".join(current_lines).strip()
+    if current_chunk:
+        chunks.append(current_chunk)
 
     return chunks
 
-def download_and_convert_xls(bot, file_id: str, temp_dir: str, file_name: str) -> str:
+def file_url(template, token: str, file_path: str) -> str:
     """
-    Загружает .xls файл, конвертирует его в .xlsx и возвращает путь к .xlsx файлу
+    :param template: apihelper.FILE_URL или asyncio_helper.FILE_URL
+    :return: Адрес для скачивания файла из Bot API
+    """
+    return (template or "https://api.telegram.org/file/bot{0}/{1}").format(token, file_path)
+
+def download_file(bot, file_id: str, max_bytes: int = None, job_spool=None, memory_bytes: int = 0, file_name: str = ""):
+    """
+    Скачивает файл из Telegram по частям
 
     :param bot: объект бота Telegram
     :param file_id: Идентификатор файла из Telegram
-    :param temp_dir: Директория для временных файлов
-    :param file_name: Имя файла
-    :return: Путь к .xlsx файлу
+    :param max_bytes: Максимальный размер файла, None - без ограничения
+    :param job_spool: spool.JobSpool для файлов больше memory_bytes, без него файл остается в памяти
+    :param memory_bytes: Файлы больше этого размера записываются на диск
+    :param file_name: Имя файла от пользователя, для расширения файла на диске
+    :return: Содержимое файла или путь к файлу в каталоге задания
     """
-    # Download .xls file
     file_info = bot.get_file(file_id)
-    downloaded_file = bot.download_file(file_info.file_path)
-    xls_file_path = os.path.join(temp_dir, file_name)
-
-    with open(xls_file_path, "wb") as new_file:
-        new_file.write(downloaded_file)
-
-    # Convert path to .xlsx
-    xlsx_file_name = file_name.replace(".xls", ".xlsx")
-    xlsx_file_path = os.path.join(temp_dir, xlsx_file_name)
+    if max_bytes and file_info.file_size and file_info.file_size > max_bytes:
+        raise ValueError(f"файл больше {max_bytes // 1024 // 1024} МБ")
 
-    # Open .xls and convert to .xlsx
+    buffer = spool.DownloadBuffer(max_bytes, job_spool, memory_bytes, file_name)
+    url = file_url(apihelper.FILE_URL, bot.token, file_info.file_path)
     try:
-        wb_old = xlrd.open_workbook(xls_file_path, formatting_info=False)
-        wb_new = openpyxl.Workbook()
-        ws_new = wb_new.active
-
-        for ws_old in wb_old.sheets():
-            for row in range(ws_old.nrows):
-                for col in range(ws_old.ncols):
-                    ws_new.cell(row=row + 1, column=col + 1).value = ws_old.cell(row, col).value
-
-        wb_new.save(xlsx_file_path)
-    except Exception as e:
-        raise RuntimeError(f"Ошибка при конвертации .xls в .xlsx: {e}")
-
-    return xlsx_file_path
-
-def clean_temp_folder():
-    if os.path.exists(TEMP_DIR):
-        shutil.rmtree(TEMP_DIR)
-        os.makedirs(TEMP_DIR)
\ No newline at end of file
+        with requests.get(url, stream=True, proxies=apihelper.proxy,
+                          timeout=(apihelper.CONNECT_TIMEOUT, apihelper.READ_TIMEOUT)) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(spool.CHUNK_SIZE):
+                buffer.write(chunk)
+    finally:
+        buffer.close()
+    return buffer.result()
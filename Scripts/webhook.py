@@ -0,0 +1,104 @@
+import json
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot.types import Update
+
+
+class UpdateDeduplicator:
+    """
+    Запоминает последние update_id, чтобы повторно доставленные Telegram обновления
+    не обрабатывались дважды
+    """
+
+    def __init__(self, size: int = 10000):
+        """
+        :param size: Сколько последних update_id хранить
+        """
+        self._seen = set()
+        self._order = deque()
+        self._size = size
+        self._lock = threading.Lock()
+
+    def is_new(self, update_id) -> bool:
+        """
+        :return: True, если обновление встречается впервые
+        """
+        with self._lock:
+            if update_id in self._seen:
+                return False
+            self._seen.add(update_id)
+            self._order.append(update_id)
+            if len(self._order) > self._size:
+                self._seen.discard(self._order.popleft())
+            return True
+
+
+class WebhookServer(ThreadingHTTPServer):
+    # Telegram and load tests open many connections at once
+    request_queue_size = 256
+    daemon_threads = True
+
+
+def make_handler(bot, path: str, secret_token: str = None, deduplicator: UpdateDeduplicator = None):
+    """
+    Создает обработчик HTTP запросов с обновлениями от Telegram
+
+    :param bot: Объект TeleBot
+    :param path: Путь, на который Telegram присылает обновления
+    :param secret_token: Секрет из заголовка X-Telegram-Bot-Api-Secret-Token
+    :param deduplicator: Фильтр повторных обновлений
+    :return: Класс обработчика для HTTPServer
+    """
+    deduplicator = deduplicator or UpdateDeduplicator()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != path:
+                return self._send(404)
+            if secret_token and self.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret_token:
+                return self._send(403)
+
+            try:
+                update_json = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            except ValueError:
+                return self._send(400)
+            if not isinstance(update_json, dict) or not isinstance(update_json.get("update_id"), int):
+                # Telegram always sends update_id, without it the update cannot be deduplicated
+                return self._send(400)
+
+            # Answer at once, handlers run in the bot's worker threads
+            if deduplicator.is_new(update_json.get("update_id")):
+                bot.process_new_updates([Update.de_json(update_json)])
+            self._send(200)
+
+        def _send(self, status):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(bot, host: str, port: int, path: str, url: str = None, secret_token: str = None):
+    """
+    Принимает обновления через webhook вместо long polling
+
+    :param bot: Объект TeleBot
+    :param host: Адрес, на котором слушает сервер
+    :param port: Порт сервера
+    :param path: Путь, на который Telegram присылает обновления
+    :param url: Внешний адрес сервера для setWebhook, без него webhook не регистрируется
+    :param secret_token: Секрет для проверки, что запрос пришел от Telegram
+    """
+    server = WebhookServer((host, port), make_handler(bot, path, secret_token))
+    if url:
+        bot.remove_webhook()
+        bot.set_webhook(url=url.rstrip("/") + path, secret_token=secret_token)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,165 @@
+"""
+Бенчмарк этапов обработки отчета: скачивание, проверка заголовка, разбор, анализ и подготовка ответа
+
+Запуск из корня репозитория:
+    python -m benchmarks                                  - размеры 10, 1000, 10000 строк
+    python -m benchmarks --sizes 10 1000 10000 100000     - до 100k строк (.xls ограничен 65536 строками)
+    python -m benchmarks --save-baseline                  - сохранить результат как эталон
+Результат сравнивается с benchmarks/baseline.json, при замедлении код выхода 1
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+import telebot
+from telebot import apihelper
+
+from . import generators
+
+import actions
+import fake_api
+import utils
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SIZES = [10, 1000, 10000]
+
+
+def measure(func, *args, repeat: int = 3):
+    """
+    :return: Лучшее время из repeat запусков в секундах и результат последнего запуска
+    """
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(sizes, formats, reports, repeat):
+    server, api = fake_api.start()
+    apihelper.API_URL = f"http://127.0.0.1:{server.server_port}/bot{{0}}/{{1}}"
+    apihelper.FILE_URL = f"http://127.0.0.1:{server.server_port}/file/bot{{0}}/{{1}}"
+    bot = telebot.TeleBot("0:benchmark")
+
+    results = []
+    for report in reports:
+        _, report_actions = generators.REPORTS[report]
+        for fmt in formats:
+            for rows in sizes:
+                if fmt == "xls" and rows >= generators.XLS_MAX_ROWS:
+                    continue
+
+                data = generators.generate(report, rows, fmt)
+                file_id = f"{report}-{rows}.{fmt}"
+                api.add_file(file_id, data, file_id)
+                runs = repeat if rows < 10000 else 1
+
+                def record(stage, seconds, action=None):
+                    results.append({
+                        "report": report, "format": fmt, "rows": rows, "bytes": len(data),
+                        "action": action, "stage": stage, "seconds": round(seconds, 6),
+                    })
+                    print(f"{report:17} {fmt:4} {rows:>7} {action or '':24} {stage:25} {seconds * 1000:10.1f} ms")
+
+                download, _ = measure(utils.download_file, bot, file_id, repeat=runs)
+                record("download", download)
+                # Header check before the full parse, as in the bot
+                check, _ = measure(actions.check_report, data, repeat=runs)
+                record("check", check)
+
+                parsed = {}
+                for action in report_actions:
+                    report_type = actions.report_type(action)
+                    if report_type not in parsed:
+                        parsed[report_type] = measure(actions.load_report, data, report_type, repeat=runs)
+                    parse, df = parsed[report_type]
+                    analyze, result = measure(actions.run_analysis, action, df, repeat=runs)
+                    reply, _ = measure(utils.split_message, result, repeat=runs)
+
+                    record("parse", parse, action)
+                    record("analyze", analyze, action)
+                    record("reply", reply, action)
+                    record("total", download + check + parse + analyze + reply, action)
+
+    server.shutdown()
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def _key(result):
+    return result["report"], result["format"], result["rows"], result["action"], result["stage"]
+
+
+def compare(current: dict, baseline: dict, tolerance: float, min_seconds: float) -> list:
+    """
+    Сравнивает результаты с эталоном
+
+    :param tolerance: Допустимое относительное замедление, 0.25 - на 25%
+    :param min_seconds: Разница меньше этого значения не считается замедлением
+    :return: Список описаний замедлившихся этапов
+    """
+    baseline_times = {_key(result): result["seconds"] for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = baseline_times.get(_key(result))
+        if old is None:
+            continue
+        new = result["seconds"]
+        if new > old * (1 + tolerance) and new - old > min_seconds:
+            report, fmt, rows, action, stage = _key(result)
+            regressions.append(f"{report} {fmt} {rows} {action or ''} {stage}: {old * 1000:.1f} -> {new * 1000:.1f} ms")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Бенчмарк анализа отчетов")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="количество строк в отчетах")
+    parser.add_argument("--formats", nargs="+", default=generators.formats(), choices=["xls", "xlsx"])
+    parser.add_argument("--reports", nargs="+", default=list(generators.REPORTS), choices=list(generators.REPORTS))
+    parser.add_argument("--repeat", type=int, default=3, help="повторов для отчетов меньше 10000 строк")
+    parser.add_argument("--output", default="bench_output.json", help="файл с результатами")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="файл с эталонными результатами")
+    parser.add_argument("--save-baseline", action="store_true", help="сохранить результаты как эталон")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="допустимое замедление, доля")
+    parser.add_argument("--min-ms", type=float, default=5, help="минимальная значимая разница, мс")
+    args = parser.parse_args(argv)
+
+    current = run(args.sizes, args.formats, args.reports, args.repeat)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(current, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"Эталон сохранен в {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("Эталон не найден, сравнение пропущено")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.tolerance, args.min_ms / 1000)
+    if regressions:
+        print("Замедление относительно эталона:")
+        print("\n".join(regressions))
+        return 1
+    print("Замедлений относительно эталона нет")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import io
+import random
+
+import openpyxl
+
+try:
+    import xlwt
+except ImportError:
+    xlwt = None
+
+# .xls sheet row limit
+XLS_MAX_ROWS = 65536
+
+WEEKDAYS = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота"]
+SUBJECTS = ["Python", "Математика", "Дизайн", "Английский язык", "Алгоритмы", "Веб-разработка", "Базы данных"]
+LAST_NAMES = ["Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев"]
+FIRST_NAMES = ["Иван", "Петр", "Алексей", "Мария", "Анна", "Ольга", "Дмитрий", "Елена"]
+
+
+def _name(rng: random.Random, index: int) -> str:
+    return f"{rng.choice(LAST_NAMES)} {rng.choice(FIRST_NAMES)} {index}"
+
+
+def schedule_rows(rows: int, rng: random.Random):
+    """Расписание: группа, время и ячейки дней недели вида "Предмет: ...\\n..." """
+    yield ["Группа", "Время"] + [f"{day} {i + 1:02d}.09" for i, day in enumerate(WEEKDAYS)]
+    for i in range(rows):
+        cells = [
+            f"Предмет: {rng.choice(SUBJECTS)}\nАудитория {rng.randint(1, 30)}" if rng.random() < 0.7 else None
+            for _ in WEEKDAYS
+        ]
+        yield [f"ИТ-{i // 6 + 1}", f"{9 + i % 6}:00"] + cells
+
+
+def homework_rows(rows: int, rng: random.Random):
+    """Отчет по ДЗ: строка заголовка отчета, затем таблица (header=1), ФИО во втором столбце без названия"""
+    yield ["Отчет по домашним заданиям"] + [None] * 11
+    yield ["№", None, "Месяц", "Выдано", "Получено", "Проверено", "План", "Неделя", "Выдано", "Получено", "Проверено", "План"]
+    for i in range(rows):
+        month = [rng.randint(0, 40) for _ in range(4)]
+        week = [rng.randint(0, 10) for _ in range(4)]
+        yield [i + 1, _name(rng, i), None] + month + [None] + week
+
+
+def topics_rows(rows: int, rng: random.Random):
+    """Темы уроков: дата, тема и ФИО преподавателя, часть тем не по шаблону"""
+    yield ["Date", "Тема урока", "ФИО преподавателя"]
+    for i in range(rows):
+        topic = f"Урок № {i % 40 + 1}. Тема: {rng.choice(SUBJECTS)}" if rng.random() < 0.9 else rng.choice(SUBJECTS)
+        yield [f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}", topic, _name(rng, i % 200)]
+
+
+def attendance_rows(rows: int, rng: random.Random):
+    """Посещаемость преподавателей в процентах строкой и итоговая строка в конце"""
+    yield ["ФИО преподавателя", "Средняя посещаемость"]
+    for i in range(rows):
+        yield [_name(rng, i), f"{rng.randint(30, 100)}%"]
+    yield ["Итого", "75%"]
+
+
+def student_homework_rows(rows: int, rng: random.Random):
+    """Процент выполнения ДЗ студентами"""
+    yield ["FIO", "Percentage Homework"]
+    for i in range(rows):
+        yield [_name(rng, i), rng.randint(0, 100)]
+
+
+def marks_rows(rows: int, rng: random.Random):
+    """Средние оценки студентов за Homework и Classroom"""
+    yield ["FIO", "Homework", "Classroom"]
+    for i in range(rows):
+        yield [_name(rng, i), rng.randint(1, 5), rng.randint(1, 5)]
+
+
+# Report type -> (rows generator, analyses run on it)
+REPORTS = {
+    "schedule": (schedule_rows, ["group_subjects"]),
+    "homework": (homework_rows, ["checked_month", "checked_week", "given_month", "given_week"]),
+    "topics": (topics_rows, ["topic_check"]),
+    "attendance": (attendance_rows, ["low_attendance"]),
+    "student_homework": (student_homework_rows, ["low_homework_percentage"]),
+    "marks": (marks_rows, ["marks_analysis"]),
+}
+
+
+def formats() -> list:
+    """
+    :return: Форматы, которые можно сгенерировать (.xls требует xlwt)
+    """
+    return ["xls", "xlsx"] if xlwt else ["xlsx"]
+
+
+def generate(report: str, rows: int, fmt: str = "xlsx", seed: int = 0) -> bytes:
+    """
+    Генерирует синтетический отчет
+
+    :param report: Тип отчета из REPORTS
+    :param rows: Количество строк данных
+    :param fmt: xls или xlsx
+    :param seed: Зерно генератора, одинаковое зерно дает одинаковый файл
+    :return: Содержимое файла
+    """
+    row_generator, _ = REPORTS[report]
+    rng = random.Random(seed)
+    buffer = io.BytesIO()
+
+    if fmt == "xlsx":
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        for row in row_generator(rows, rng):
+            sheet.append(row)
+        workbook.save(buffer)
+    elif fmt == "xls":
+        if xlwt is None:
+            raise RuntimeError("Для генерации .xls нужен пакет xlwt")
+        workbook = xlwt.Workbook()
+        sheet = workbook.add_sheet("Sheet1")
+        for row_index, row in enumerate(row_generator(rows, rng)):
+            if row_index >= XLS_MAX_ROWS:
+                raise ValueError(f"Формат .xls ограничен {XLS_MAX_ROWS} строками")
+            for col_index, value in enumerate(row):
+                if value is not None:
+                    sheet.write(row_index, col_index, value)
+        workbook.save(buffer)
+    else:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    return buffer.getvalue()